@@ -1,9 +1,33 @@
-from fastapi import Query
+from http import HTTPStatus
+from typing import Optional
+from uuid import UUID
+
+from fastapi import HTTPException, Query
+from fastapi.responses import ORJSONResponse
+
+from core.config import settings
 
 
 async def list_parameters(sort: str = None,
                           page_size: int = Query(50, alias='page[size]', ge=1),
-                          page_number: int = Query(1, alias='page[number]', ge=1)):
+                          page_number: int = Query(1, alias='page[number]', ge=1),
+                          cursor: str = Query(None, alias='page[cursor]')):
+    # Пустой page[cursor] начинает выдачу по курсору с первой страницы,
+    # курсор следующей страницы возвращается в заголовке X-Next-Cursor
     return {'sort': sort,
             'page_size': page_size,
-            'page_number': page_number}
+            'page_number': page_number,
+            'cursor': cursor}
+
+
+async def batch_ids(ids: list[UUID] = Query(...)) -> list[UUID]:
+    # Айди передаются повторением параметра: ?ids=...&ids=...; повторы отбрасываются
+    if len(ids) > settings.BATCH_MAX_IDS:
+        raise HTTPException(status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+                            detail=f'too many ids, max {settings.BATCH_MAX_IDS}')
+    return list(dict.fromkeys(ids))
+
+
+def cursor_response(content: list, next_cursor: Optional[str]) -> ORJSONResponse:
+    headers = {'X-Next-Cursor': next_cursor} if next_cursor else None
+    return ORJSONResponse(content=[item.dict() for item in content], headers=headers)
@@ -3,8 +3,12 @@ from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 
-from api.v1 import list_parameters
+from api.v1 import batch_ids, cursor_response, list_parameters
 from api.v1.models import FilmList, FilmDetail
+from api.v1.response_cache import ResponseCache, get_response_cache
+from core.config import settings
+from db.bloom import bloom_filters
+from db.popularity import popularity
 from services.film import FilmService, get_film_service
 
 router = APIRouter()
@@ -13,30 +17,78 @@ router = APIRouter()
 @router.get('/search', response_model=list[FilmList])
 async def film_search(query: str,
                       list_parameters: dict = Depends(list_parameters),
-                      film_service: FilmService = Depends(get_film_service)) -> list[FilmList]:
+                      film_service: FilmService = Depends(get_film_service),
+                      response_cache: ResponseCache = Depends(get_response_cache('film'))) -> list[FilmList]:
+    if list_parameters['cursor'] is not None:
+        films, next_cursor = await film_service.search_by_cursor(query, list_parameters)
+        if not films:
+            raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='films not found')
+        return cursor_response([FilmList(**film.dict()) for film in films], next_cursor)
+
+    cached = await response_cache.get()
+    if cached:
+        return cached
+
     films = await film_service.search(query, list_parameters)
     if not films:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='films not found')
 
-    return [FilmList(**film.dict()) for film in films]
+    return await response_cache.put([FilmList(**film.dict()) for film in films],
+                                    expire=settings.FILM_CACHE_EXPIRE_IN_SECONDS)
+
+
+# Объявлена до /{film_id}, иначе batch разбирался бы как айди фильма
+@router.get('/batch', response_model=list[FilmDetail])
+async def film_batch(ids: list[UUID] = Depends(batch_ids),
+                     film_service: FilmService = Depends(get_film_service)) -> list[FilmDetail]:
+    for film_id in ids:
+        popularity.hit('film', film_id)
+    films = await film_service.get_many_by_id(ids)
+    if not films:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='films not found')
+
+    return [FilmDetail(**film.dict()) for film in films]
 
 
 # Внедряем FilmService с помощью Depends(get_film_service)
 @router.get('/{film_id}', response_model=FilmDetail)
-async def film_details(film_id: UUID, film_service: FilmService = Depends(get_film_service)) -> FilmDetail:
+async def film_details(film_id: UUID,
+                       film_service: FilmService = Depends(get_film_service),
+                       response_cache: ResponseCache = Depends(get_response_cache('film'))) -> FilmDetail:
+    # Заведомо несуществующие айди отсекаются фильтром Блума, не доходя до кеша и ES
+    if not bloom_filters.might_contain('movies', film_id):
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='film not found')
+    # Самые запрашиваемые фильмы прогреваются в кеше заранее
+    popularity.hit('film', film_id)
+    cached = await response_cache.get()
+    if cached:
+        return cached
+
     film = await film_service.get_by_id(film_id)
     if not film:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='film not found')
 
-    return FilmDetail(**film.dict())
+    return await response_cache.put(FilmDetail(**film.dict()), expire=settings.FILM_CACHE_EXPIRE_IN_SECONDS)
 
 
 @router.get('/', response_model=list[FilmList])
 async def film_list(filter_genre: UUID = Query(None, alias='filter[genre]'),
                     list_parameters: dict = Depends(list_parameters),
-                    film_service: FilmService = Depends(get_film_service)) -> list[FilmList]:
+                    film_service: FilmService = Depends(get_film_service),
+                    response_cache: ResponseCache = Depends(get_response_cache('film'))) -> list[FilmList]:
+    if list_parameters['cursor'] is not None:
+        films, next_cursor = await film_service.list_films_by_cursor(filter_genre, list_parameters)
+        if not films:
+            raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='films not found')
+        return cursor_response([FilmList(**film.dict()) for film in films], next_cursor)
+
+    cached = await response_cache.get()
+    if cached:
+        return cached
+
     films = await film_service.list_films(filter_genre, list_parameters)
     if not films:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='films not found')
 
-    return [FilmList(**film.dict()) for film in films]
+    return await response_cache.put([FilmList(**film.dict()) for film in films],
+                                    expire=settings.FILM_CACHE_EXPIRE_IN_SECONDS)
@@ -3,22 +3,52 @@ from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException
 
+from api.v1 import batch_ids
 from api.v1.models import Genre
+from api.v1.response_cache import ResponseCache, get_response_cache
+from core.config import settings
+from db.bloom import bloom_filters
 from services.genre import GenreService, get_genre_service
 
 router = APIRouter()
 
 
+# Объявлена до /{genre_id}, иначе batch разбирался бы как айди жанра
+@router.get('/batch', response_model=list[Genre])
+async def genre_batch(ids: list[UUID] = Depends(batch_ids),
+                      genre_service: GenreService = Depends(get_genre_service)) -> list[Genre]:
+    genres = await genre_service.get_many_by_id(ids)
+    if not genres:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='genres not found')
+
+    return [Genre(**genre.dict()) for genre in genres]
+
+
 @router.get('/{genre_id}', response_model=Genre)
-async def genre_details(genre_id: UUID, genre_service: GenreService = Depends(get_genre_service)) -> Genre:
+async def genre_details(genre_id: UUID,
+                        genre_service: GenreService = Depends(get_genre_service),
+                        response_cache: ResponseCache = Depends(get_response_cache('genre'))) -> Genre:
+    # Заведомо несуществующие айди отсекаются фильтром Блума, не доходя до кеша и ES
+    if not bloom_filters.might_contain('genres', genre_id):
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='genre not found')
+    cached = await response_cache.get()
+    if cached:
+        return cached
+
     genre = await genre_service.get_by_id(genre_id)
     if not genre:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='genre not found')
 
-    return Genre(**genre.dict())
+    return await response_cache.put(Genre(**genre.dict()), expire=settings.GENRE_CACHE_EXPIRE_IN_SECONDS)
 
 
 @router.get('/', response_model=list[Genre])
-async def genre_list(genre_service: GenreService = Depends(get_genre_service)) -> list[Genre]:
+async def genre_list(genre_service: GenreService = Depends(get_genre_service),
+                     response_cache: ResponseCache = Depends(get_response_cache('genre'))) -> list[Genre]:
+    cached = await response_cache.get()
+    if cached:
+        return cached
+
     res = await genre_service.get_all()
-    return [Genre(**genre.dict()) for genre in res]
+    return await response_cache.put([Genre(**genre.dict()) for genre in res],
+                                    expire=settings.GENRE_CACHE_EXPIRE_IN_SECONDS)
@@ -1,7 +1,7 @@
 from typing import Optional
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
 
 
 class FilmList(BaseModel):
@@ -27,8 +27,13 @@ class FilmDetail(BaseModel):
     uuid: UUID
     title: str
     imdb_rating: Optional[float] = None
-    description: str
-    genre: list[Genre]
-    actors: list[PersonList]
-    writers: list[PersonList]
-    directors: list[PersonList]
+    description: Optional[str] = None
+    genre: list[Genre] = []
+    actors: list[PersonList] = []
+    writers: list[PersonList] = []
+    directors: list[PersonList] = []
+
+    # У фильма в индексе может не быть жанров или участников: тогда списки пустые
+    @validator('genre', 'actors', 'writers', 'directors', pre=True)
+    def empty_if_missing(cls, value):
+        return value or []
@@ -3,8 +3,12 @@ from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException
 
-from api.v1 import list_parameters
+from api.v1 import batch_ids, cursor_response, list_parameters
 from api.v1.models import PersonDetail, FilmList
+from api.v1.response_cache import ResponseCache, get_response_cache
+from core.config import settings
+from db.bloom import bloom_filters
+from db.popularity import popularity
 from services.person import PersonService, get_person_service
 
 router = APIRouter()
@@ -13,27 +17,68 @@ router = APIRouter()
 @router.get('/search', response_model=list[PersonDetail])
 async def person_search(query: str,
                         list_parameters: dict = Depends(list_parameters),
-                        person_service: PersonService = Depends(get_person_service)) -> list[PersonDetail]:
+                        person_service: PersonService = Depends(get_person_service),
+                        response_cache: ResponseCache = Depends(get_response_cache('person'))) -> list[PersonDetail]:
+    if list_parameters['cursor'] is not None:
+        res, next_cursor = await person_service.get_by_search_cursor(query, list_parameters)
+        if not res:
+            raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='person not found')
+        return cursor_response([PersonDetail(**person.dict()) for person in res], next_cursor)
+
+    cached = await response_cache.get()
+    if cached:
+        return cached
+
     res = await person_service.get_by_search(query, list_parameters)
     if not res:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='person not found')
-    return [PersonDetail(**person.dict()) for person in res]
+    return await response_cache.put([PersonDetail(**person.dict()) for person in res],
+                                    expire=settings.PERSON_CACHE_EXPIRE_IN_SECONDS)
+
+
+# Объявлена до /{person_id}, иначе batch разбирался бы как айди персоны
+@router.get('/batch', response_model=list[PersonDetail])
+async def person_batch(ids: list[UUID] = Depends(batch_ids),
+                       person_service: PersonService = Depends(get_person_service)) -> list[PersonDetail]:
+    for person_id in ids:
+        popularity.hit('person', person_id)
+    persons = await person_service.get_many_by_id(ids)
+    if not persons:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='persons not found')
+
+    return [PersonDetail(**person.dict()) for person in persons]
 
 
 @router.get('/{person_id}', response_model=PersonDetail)
 async def person_details(person_id: UUID,
-                         person_service: PersonService = Depends(get_person_service)) -> PersonDetail:
+                         person_service: PersonService = Depends(get_person_service),
+                         response_cache: ResponseCache = Depends(get_response_cache('person'))) -> PersonDetail:
+    # Заведомо несуществующие айди отсекаются фильтром Блума, не доходя до кеша и ES
+    if not bloom_filters.might_contain('persons', person_id):
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='person not found')
+    # Самые запрашиваемые персоны прогреваются в кеше заранее
+    popularity.hit('person', person_id)
+    cached = await response_cache.get()
+    if cached:
+        return cached
+
     person = await person_service.get_by_id(person_id)
     if not person:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='person not found')
 
-    return PersonDetail(**person.dict())
+    return await response_cache.put(PersonDetail(**person.dict()), expire=settings.PERSON_CACHE_EXPIRE_IN_SECONDS)
 
 
 @router.get('/{person_id}/film', response_model=list[FilmList], deprecated=True)
 async def person_films(person_id: UUID,
-                       person_service: PersonService = Depends(get_person_service)) -> list[FilmList]:
+                       person_service: PersonService = Depends(get_person_service),
+                       response_cache: ResponseCache = Depends(get_response_cache('person'))) -> list[FilmList]:
+    cached = await response_cache.get()
+    if cached:
+        return cached
+
     res = await person_service.get_films_by_person_id(person_id)
     if not res:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='films not found')
-    return [FilmList(**film.dict()) for film in res]
+    return await response_cache.put([FilmList(**film.dict()) for film in res],
+                                    expire=settings.PERSON_CACHE_EXPIRE_IN_SECONDS)
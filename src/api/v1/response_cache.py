@@ -0,0 +1,57 @@
+from typing import Callable, Optional, Union
+
+import orjson
+from fastapi import Depends, Request, Response
+
+from core.config import settings
+from db.dependens import get_cache, get_cache_creator
+from db.storage import AbstractCache, AbstractKeyCreator
+from pydantic import BaseModel
+
+
+class ResponseCache:
+    """
+    Кеш готовых тел ответов ручки: ключ строится по пути и параметрам запроса,
+    при попадании байты из кеша отдаются как есть, без разбора в модели и валидации.
+    """
+
+    def __init__(self, name_model: str, request: Request, cache: AbstractCache, cache_creator: AbstractKeyCreator):
+        self.name_model = name_model
+        self.request = request
+        self.cache = cache
+        self.cache_creator = cache_creator
+
+    async def get_key(self) -> str:
+        return await self.cache_creator.get_key_from_response(
+            self.name_model, self.request.url.path, dict(self.request.query_params)
+        )
+
+    async def get(self) -> Optional[Response]:
+        if not settings.RESPONSE_CACHE_ENABLED:
+            return None
+        body = await self.cache.get_raw(await self.get_key())
+        if not body:
+            return None
+        return Response(content=body, media_type='application/json')
+
+    async def put(self, content: Union[BaseModel, list[BaseModel]], expire: int) -> Response:
+        if isinstance(content, list):
+            body = orjson.dumps([item.dict() for item in content])
+        else:
+            body = orjson.dumps(content.dict())
+        if settings.RESPONSE_CACHE_ENABLED:
+            await self.cache.put_raw(await self.get_key(), body, expire=expire)
+        return Response(content=body, media_type='application/json')
+
+
+def get_response_cache(name_model: str) -> Callable:
+    """Зависимость для ручек одной сущности: их ответы лежат в своём пространстве имён кеша"""
+
+    async def response_cache(
+            request: Request,
+            cache: AbstractCache = Depends(get_cache),
+            cache_creator: AbstractKeyCreator = Depends(get_cache_creator),
+    ) -> ResponseCache:
+        return ResponseCache(name_model, request, cache, cache_creator)
+
+    return response_cache
@@ -1,5 +1,6 @@
 import os
 from logging import config as logging_config
+from typing import Optional
 
 from pydantic import BaseSettings, Field
 
@@ -12,12 +13,96 @@ class Settings(BaseSettings):
     PROJECT_NAME: str = 'movies'
     REDIS_HOST: str = Field('127.0.0.1', env='REDIS_HOST')
     REDIS_PORT: int = 6379
+    REDIS_POOL_MIN_SIZE: int = 10
+    REDIS_POOL_MAX_SIZE: int = 20
     ELASTIC_HOST: str = Field('127.0.0.1', env='ELASTIC_HOST')
     ELASTIC_PORT: int = 9200
+    # Соединений с каждым узлом ES, сколько держать простаивающее соединение и таймаут запроса
+    ELASTIC_POOL_MAX_SIZE: int = 25
+    ELASTIC_KEEP_ALIVE_IN_SECONDS: float = 30
+    ELASTIC_TIMEOUT_IN_SECONDS: float = 10
+    # Сколько операций каждого вида одновременно выполняется с бэкендом и сколько операция
+    # может ждать свободного слота, прежде чем запрос получит 503. Поиск и get в ES вместе
+    # не должны превышать ELASTIC_POOL_MAX_SIZE, чтобы поиски не забирали соединения у get
+    ES_SEARCH_CONCURRENCY: int = 15
+    ES_GET_CONCURRENCY: int = 10
+    REDIS_CONCURRENCY: int = 100
+    BULKHEAD_MAX_WAIT_IN_SECONDS: float = 0.05
+    # Предохранитель ES размыкается, когда среди последних WINDOW вызовов (но не меньше MIN_CALLS)
+    # доля ошибок или вызовов дольше SLOW_CALL достигает порога. Разомкнутый предохранитель
+    # через OPEN_IN_SECONDS пропускает HALF_OPEN_CALLS пробных вызовов
+    ES_CIRCUIT_BREAKER_ENABLED: bool = True
+    ES_CIRCUIT_BREAKER_WINDOW: int = 50
+    ES_CIRCUIT_BREAKER_MIN_CALLS: int = 20
+    ES_CIRCUIT_BREAKER_FAILURE_RATE: float = 0.5
+    ES_CIRCUIT_BREAKER_SLOW_CALL_IN_SECONDS: float = 2
+    ES_CIRCUIT_BREAKER_SLOW_CALL_RATE: float = 0.8
+    ES_CIRCUIT_BREAKER_OPEN_IN_SECONDS: float = 10
+    ES_CIRCUIT_BREAKER_HALF_OPEN_CALLS: int = 3
+    # Постраничная выдача по курсору читает страницы после первой с одного снимка индекса (point-in-time)
+    ES_POINT_IN_TIME_ENABLED: bool = True
+    # Сколько ES держит снимок после последнего обращения: брошенные выдачи живут не дольше
+    ES_POINT_IN_TIME_KEEP_ALIVE_IN_SECONDS: int = 30
+    # Сколько снимков может быть открыто воркером одновременно, сверх этого выдача идёт без снимка
+    ES_POINT_IN_TIME_MAX_OPEN: int = 100
+    # Сохранить шаблоны запросов в ES (search templates) и передавать в запросах только их имена и параметры
+    ES_STORED_TEMPLATES_ENABLED: bool = False
     BASE_DIR: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    FILM_CACHE_EXPIRE_IN_SECONDS: int = 60 * 5  # 5 минут
-    GENRE_CACHE_EXPIRE_IN_SECONDS: int = 60 * 5  # 5 минут
-    PERSON_CACHE_EXPIRE_IN_SECONDS: int = 60 * 5  # 5 минут
+    # Кеш сбрасывается по событиям ETL, поэтому TTL могут быть долгими
+    FILM_CACHE_EXPIRE_IN_SECONDS: int = 60 * 60  # 1 час
+    # Размер окна упорядоченных айди, которыми кешируются списки и поиск фильмов
+    FILM_WINDOW_SIZE: int = 200
+    GENRE_CACHE_EXPIRE_IN_SECONDS: int = 60 * 60  # 1 час
+    PERSON_CACHE_EXPIRE_IN_SECONDS: int = 60 * 60  # 1 час
+    # Redis stream, в который ETL публикует айди загруженных объектов
+    CACHE_INVALIDATION_ENABLED: bool = True
+    CACHE_INVALIDATION_STREAM: str = 'cache-invalidation'
+    CACHE_INVALIDATION_BLOCK_IN_MS: int = 5000
+    # Сколько событий читается одним XREAD и для скольких айди ключи удаляются одной командой DEL
+    CACHE_INVALIDATION_READ_COUNT: int = 10
+    CACHE_INVALIDATION_DELETE_BATCH_SIZE: int = 500
+    # Сколько ещё после истечения TTL хранится устаревшая запись: её сразу отдают,
+    # а обновляют в фоне. После этого срока данные запрашиваются синхронно
+    CACHE_STALE_TTL_IN_SECONDS: int = 60 * 5  # 5 минут
+    # Сколько запись хранится ещё и после этого: её отдают, только если хранилище недоступно
+    CACHE_GRACE_TTL_IN_SECONDS: int = 60 * 60  # 1 час
+    # Кодек значений в Redis: json, orjson, msgpack, orjson+zlib, msgpack+zlib, orjson+zstd, msgpack+zstd.
+    # Записи помечены форматом, поэтому кодек можно менять без сброса кеша
+    CACHE_CODEC: str = 'orjson'
+    # Версия схемы ключей кеша: увеличивается при несовместимом изменении моделей
+    CACHE_SCHEMA_VERSION: int = 1
+    # Сколько процесс помнит поколения пространств имён ключей, прежде чем перечитать их из Redis
+    CACHE_GENERATION_TTL_IN_SECONDS: float = 1
+    # Кешировать готовые тела ответов ручек и отдавать их без повторной сериализации
+    RESPONSE_CACHE_ENABLED: bool = True
+    # In-process кеш перед Redis: время жизни записей и лимиты в объектах на пространство имён
+    LOCAL_CACHE_ENABLED: bool = True
+    LOCAL_CACHE_TTL_IN_SECONDS: float = 10
+    LOCAL_CACHE_MAX_OBJECTS: int = 10000
+    LOCAL_CACHE_NAMESPACE_MAX_OBJECTS: dict[str, int] = {'genre': 1000, 'genre_list': 1000, 'raw': 2000}
+    # Сколько помнить, что объекта нет в хранилище
+    NEGATIVE_CACHE_TTL_IN_SECONDS: int = 30
+    # Фильтры Блума айди от ETL: по ним заведомо несуществующие айди получают 404 без кеша и ES
+    BLOOM_FILTER_ENABLED: bool = True
+    BLOOM_FILTER_REFRESH_INTERVAL_IN_SECONDS: float = 60
+    # Сколько айди можно запросить за раз в пакетных ручках /batch
+    BATCH_MAX_IDS: int = 100
+    # Время жизни блокировки, под которой один воркер ходит в хранилище при промахе кеша
+    SINGLE_FLIGHT_LOCK_TIMEOUT_IN_SECONDS: float = 5
+    # Как часто остальные воркеры проверяют кеш, ожидая результат
+    SINGLE_FLIGHT_POLL_INTERVAL_IN_SECONDS: float = 0.05
+    # Прогрев кеша при старте и после загрузок ETL: сколько запросов к хранилищу идёт одновременно,
+    # сколько первых страниц списка фильмов греть для каждой сортировки и жанра
+    # и сколько самых запрашиваемых фильмов и персон
+    WARMUP_ENABLED: bool = True
+    WARMUP_CONCURRENCY: int = 8
+    WARMUP_FILM_SORTS: list[Optional[str]] = ['-imdb_rating', 'imdb_rating', None]
+    WARMUP_FILM_PAGES: int = 4
+    WARMUP_FILM_PAGE_SIZE: int = 50
+    WARMUP_POPULAR_IDS: int = 200
+    # Счётчики запросов по айди сбрасываются в Redis раз в интервал, хранятся самые запрашиваемые айди
+    POPULARITY_FLUSH_INTERVAL_IN_SECONDS: float = 10
+    POPULARITY_MAX_IDS: int = 1000
 
     class Config:
         env_file = '.env'
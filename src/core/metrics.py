@@ -0,0 +1,288 @@
+import math
+import time
+from http import HTTPStatus
+from typing import Callable, Optional
+
+from starlette.routing import Match
+
+# Метрики собираются в процессе и отдаются на /metrics в текстовом формате Prometheus.
+# У каждого воркера свои значения, поэтому сборщик должен опрашивать воркеры по отдельности
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def format_labels(labelnames: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{escape(str(value))}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class Metric:
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # значения меток -> дочерняя метрика
+        self.children: dict[tuple, object] = {}
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects labels {self.labelnames}')
+            child = self.children[values] = self.create_child()
+        return child
+
+    def create_child(self):
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for values, child in sorted(self.children.items()):
+            lines.extend(self.render_child(values, child))
+        return lines
+
+    def render_child(self, values: tuple, child) -> list[str]:
+        return [f'{self.name}{format_labels(self.labelnames, values)} {format_value(child.value)}']
+
+
+class CounterChild:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def create_child(self):
+        return CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def create_child(self):
+        return GaugeChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class HistogramChild:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def create_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render_child(self, values: tuple, child: HistogramChild) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, child.counts):
+            cumulative += count
+            labels = format_labels(self.labelnames, values, f'le="{format_value(bound)}"')
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = format_labels(self.labelnames, values, 'le="+Inf"')
+        lines.append(f'{self.name}_bucket{labels} {child.count}')
+        labels = format_labels(self.labelnames, values)
+        lines.append(f'{self.name}_sum{labels} {format_value(child.sum)}')
+        lines.append(f'{self.name}_count{labels} {child.count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+        # Функции, обновляющие метрики, которые снимаются в момент опроса (размеры пулов и т.п.)
+        self.collectors: list[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            collector()
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.register(Counter(
+    'http_requests_total', 'HTTP requests by route and status', ('method', 'route', 'status'),
+))
+HTTP_REQUEST_DURATION = registry.register(Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route', ('method', 'route'),
+))
+HTTP_REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    'http_requests_in_flight', 'HTTP requests being processed',
+))
+CACHE_REQUESTS = registry.register(Counter(
+    'cache_requests_total', 'Redis cache lookups by key namespace and result', ('namespace', 'result'),
+))
+LOCAL_CACHE_REQUESTS = registry.register(Counter(
+    'local_cache_requests_total', 'In-process cache lookups by namespace and result', ('namespace', 'result'),
+))
+ES_REQUEST_DURATION = registry.register(Histogram(
+    'elasticsearch_request_duration_seconds', 'ElasticStorage call latency by method', ('method',),
+))
+ES_TOOK = registry.register(Histogram(
+    'elasticsearch_took_seconds', 'Server-side search time reported by Elasticsearch', ('method',),
+))
+ES_ERRORS = registry.register(Counter(
+    'elasticsearch_errors_total', 'Failed ElasticStorage calls by method', ('method',),
+))
+POOL_CONNECTIONS = registry.register(Gauge(
+    'pool_connections', 'Connection pool usage by backend and state', ('backend', 'state'),
+))
+SINGLE_FLIGHT = registry.register(Counter(
+    'single_flight_total', 'Cache miss fetches by single-flight outcome', ('result',),
+))
+BULKHEAD_QUEUE_WAIT = registry.register(Histogram(
+    'bulkhead_queue_wait_seconds', 'Time spent waiting for a bulkhead slot', ('bulkhead',),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5),
+))
+BULKHEAD_IN_USE = registry.register(Gauge(
+    'bulkhead_in_use', 'Bulkhead slots currently taken', ('bulkhead',),
+))
+BULKHEAD_REJECTED = registry.register(Counter(
+    'bulkhead_rejected_total', 'Operations rejected because the bulkhead stayed full', ('bulkhead',),
+))
+CIRCUIT_BREAKER_STATE = registry.register(Gauge(
+    'circuit_breaker_state', 'Circuit breaker state: 0 closed, 1 half-open, 2 open', ('breaker',),
+))
+CIRCUIT_BREAKER_REJECTED = registry.register(Counter(
+    'circuit_breaker_rejected_total', 'Calls rejected by an open circuit breaker', ('breaker',),
+))
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware: латентность и статусы ответов по ручкам и число выполняющихся запросов.
+    Написана без BaseHTTPMiddleware, чтобы не оборачивать каждый ответ в поток.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        # endpoint ручки -> шаблон её пути, строится при первом запросе
+        self.route_paths: Optional[dict[Callable, str]] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = HTTPStatus.INTERNAL_SERVER_ERROR
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            route = self.get_route(scope)
+            HTTP_REQUEST_DURATION.labels(scope['method'], route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(scope['method'], route, int(status)).inc()
+
+    def get_route(self, scope) -> str:
+        # Метка - шаблон пути ручки, а не сам путь, чтобы число рядов метрик не зависело от айди в запросах.
+        # Роутер кладёт в scope endpoint найденной ручки, так что маршруты заново не перебираются
+        if self.route_paths is None:
+            self.route_paths = self.build_route_paths(scope['app'].router.routes)
+        path = self.route_paths.get(scope.get('endpoint'))
+        if path is not None:
+            return path
+        if 'endpoint' not in scope:
+            return 'unmatched'
+        # Один endpoint у нескольких ручек: шаблон определяется сопоставлением пути
+        for route in scope['app'].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return 'unmatched'
+
+    @staticmethod
+    def build_route_paths(routes: list) -> dict[Callable, str]:
+        paths, shared = {}, set()
+        for route in routes:
+            # У смонтированных приложений своих endpoint нет, их ручки определяются сопоставлением
+            endpoint = getattr(route, 'endpoint', None)
+            if endpoint is None:
+                continue
+            if endpoint in paths:
+                shared.add(endpoint)
+            paths[endpoint] = route.path
+        return {endpoint: path for endpoint, path in paths.items() if endpoint not in shared}
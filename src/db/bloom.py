@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import json
+import logging
+import struct
+from typing import Iterable, Optional
+from uuid import UUID
+
+from core.config import settings
+from db import redis as redis_db
+
+logger = logging.getLogger(__name__)
+
+# Формат и хеширование должны совпадать с фильтром, который строит ETL (src/etl/bloom.py)
+HEADER = struct.Struct('!QB')
+
+INDEXES = ('movies', 'persons', 'genres')
+
+
+class BloomFilter:
+    def __init__(self, size: int, hash_count: int, bits: bytearray):
+        self.size = size
+        self.hash_count = hash_count
+        self.bits = bits
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'BloomFilter':
+        size, hash_count = HEADER.unpack_from(data)
+        return cls(size, hash_count, bytearray(data[HEADER.size:]))
+
+    def positions(self, pk: UUID) -> Iterable[int]:
+        digest = hashlib.blake2b(UUID(str(pk)).bytes, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, pk: UUID):
+        for position in self.positions(pk):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, pk: UUID) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(pk))
+
+
+def parse_stream_id(stream_id: str) -> tuple[int, int]:
+    ms, seq = stream_id.split('-')
+    return int(ms), int(seq)
+
+
+class BloomFilters:
+    """
+    Фильтры Блума всех айди индексов, построенные ETL. Если фильтр говорит, что айди нет,
+    его точно нет, и сервис отвечает 404, не обращаясь к кешу и ES.
+    Пока фильтр не загружен, все айди считаются возможно существующими.
+
+    Фильтр хранит позицию потока инвалидации на момент построения: айди, загруженные позже,
+    дочитываются из потока при загрузке фильтра, а новые события добавляет слушатель инвалидации.
+    """
+
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self.filters: dict[str, BloomFilter] = {}
+        self.built_at: dict[str, bytes] = {}
+        # Айди из событий, пришедших во время загрузки фильтра индекса
+        self.pending: dict[str, list] = {}
+
+    @staticmethod
+    def get_key(index: str) -> str:
+        return f'bloom:{index}'
+
+    def might_contain(self, index: str, pk: UUID) -> bool:
+        bloom = self.filters.get(index)
+        return bloom is None or pk in bloom
+
+    def add(self, index: str, ids: Iterable[UUID]):
+        ids = list(ids)
+        bloom = self.filters.get(index)
+        if bloom is not None:
+            for pk in ids:
+                bloom.add(pk)
+        if index in self.pending:
+            self.pending[index].extend(ids)
+
+    async def refresh(self):
+        for index in INDEXES:
+            built_at = await redis_db.redis.hget(self.get_key(index), 'built_at')
+            if built_at and built_at != self.built_at.get(index):
+                await self.load(index)
+
+    async def load(self, index: str):
+        self.pending[index] = []
+        try:
+            entry = await redis_db.redis.hgetall(self.get_key(index))
+            bloom = BloomFilter.from_bytes(entry[b'filter'])
+            stream_id = entry[b'stream_id'].decode()
+            ids = await self.read_stream_since(index, stream_id)
+            if ids is None:
+                logger.warning(f'Bloom filter for {index} is older than the invalidation stream, not used')
+                return
+            for pk in [*ids, *self.pending[index]]:
+                bloom.add(pk)
+            self.filters[index] = bloom
+            self.built_at[index] = entry[b'built_at']
+            logger.info(f'Bloom filter for {index} loaded, {len(ids)} ids replayed from the stream')
+        finally:
+            del self.pending[index]
+
+    async def read_stream_since(self, index: str, stream_id: str) -> Optional[list[str]]:
+        """Айди индекса из событий после stream_id или None, если часть событий уже вытеснена из потока"""
+        stream = settings.CACHE_INVALIDATION_STREAM
+        first = await redis_db.redis.xrange(stream, count=1)
+        if stream_id == '0-0':
+            # Фильтр строился при пустом потоке. Если события с тех пор появились, нельзя
+            # узнать, не вытеснены ли первые из них по maxlen, поэтому фильтр не используется
+            # до следующего построения, у которого будет настоящая позиция потока
+            return None if first else []
+        if first and parse_stream_id(first[0][0].decode()) > parse_stream_id(stream_id):
+            return None
+
+        ids = []
+        for message_id, fields in await redis_db.redis.xrange(stream, start=stream_id):
+            if message_id.decode() != stream_id and fields[b'index'].decode() == index:
+                ids.extend(json.loads(fields[b'ids']))
+        return ids
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception('Bloom filter refresh failed')
+
+
+bloom_filters = BloomFilters(refresh_interval=settings.BLOOM_FILTER_REFRESH_INTERVAL_IN_SECONDS)
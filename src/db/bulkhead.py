@@ -0,0 +1,59 @@
+import asyncio
+import time
+from typing import Optional
+
+from core.config import settings
+from core.metrics import BULKHEAD_IN_USE, BULKHEAD_QUEUE_WAIT, BULKHEAD_REJECTED
+
+
+class BackendOverloaded(RuntimeError):
+    """Все слоты переборки заняты дольше допустимого ожидания: запрос отклоняется сразу"""
+
+
+class Bulkhead:
+    """
+    Ограничение числа одновременных операций одного вида с бэкендом (переборка).
+    Медленные операции одного вида занимают только свои слоты и не забирают
+    соединения у остальных. Если слот не освободился за max_wait секунд, операция
+    не встаёт в очередь дальше, а завершается BackendOverloaded.
+    """
+
+    def __init__(self, name: str, limit: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.max_wait = max_wait
+        # Семафор создаётся при первом использовании, уже внутри цикла событий воркера
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.in_use = BULKHEAD_IN_USE.labels(name)
+        self.queue_wait = BULKHEAD_QUEUE_WAIT.labels(name)
+        self.rejected = BULKHEAD_REJECTED.labels(name)
+
+    async def __aenter__(self):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.limit)
+
+        if not self.semaphore.locked():
+            await self.semaphore.acquire()
+            self.queue_wait.observe(0)
+        else:
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), self.max_wait)
+            except asyncio.TimeoutError:
+                self.rejected.inc()
+                raise BackendOverloaded(self.name)
+            finally:
+                self.queue_wait.observe(time.perf_counter() - started)
+        self.in_use.inc()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_use.dec()
+        self.semaphore.release()
+
+
+# Поиск и получение документов по айди в ES ограничены отдельно,
+# чтобы тяжёлые поиски не занимали соединения, нужные быстрым get/mget
+es_search_bulkhead = Bulkhead('elasticsearch-search', settings.ES_SEARCH_CONCURRENCY, settings.BULKHEAD_MAX_WAIT_IN_SECONDS)
+es_get_bulkhead = Bulkhead('elasticsearch-get', settings.ES_GET_CONCURRENCY, settings.BULKHEAD_MAX_WAIT_IN_SECONDS)
+redis_bulkhead = Bulkhead('redis', settings.REDIS_CONCURRENCY, settings.BULKHEAD_MAX_WAIT_IN_SECONDS)
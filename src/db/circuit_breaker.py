@@ -0,0 +1,169 @@
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from core.config import settings
+from core.metrics import CIRCUIT_BREAKER_REJECTED, CIRCUIT_BREAKER_STATE
+from db.bulkhead import BackendOverloaded
+from db.storage import InvalidCursor
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpen(BackendOverloaded):
+    """Предохранитель бэкенда разомкнут: запрос к нему не выполняется"""
+
+
+class CircuitBreaker:
+    """
+    Предохранитель бэкенда. Исходы последних window вызовов хранятся в скользящем окне;
+    когда набралось не меньше min_calls вызовов и доля ошибок или медленных вызовов
+    достигла порога, предохранитель размыкается, и вызовы сразу завершаются CircuitOpen.
+    Через open_interval секунд пропускается half_open_calls пробных вызовов: если все они
+    прошли успешно и быстро, предохранитель замыкается, иначе снова размыкается.
+    Ошибки клиента (InvalidCursor) и отказы переборки в окно не попадают.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+    # Значения состояний в метрике
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    ignored_exceptions = (InvalidCursor, BackendOverloaded)
+
+    def __init__(
+            self, name: str, enabled: bool, window: int, min_calls: int, failure_rate: float,
+            slow_call_duration: float, slow_call_rate: float, open_interval: float, half_open_calls: int,
+    ):
+        self.name = name
+        self.enabled = enabled
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate = slow_call_rate
+        self.open_interval = open_interval
+        self.half_open_calls = half_open_calls
+        # (ошибка, медленный) по последним вызовам и их суммы по окну
+        self.outcomes: deque[tuple[bool, bool]] = deque(maxlen=window)
+        self.failures = 0
+        self.slow_calls = 0
+        self.state = self.CLOSED
+        # Номер текущего состояния: вызовы, начатые в прошлом состоянии, на новое не влияют
+        self.epoch = 0
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.probes_succeeded = 0
+        self.state_metric = CIRCUIT_BREAKER_STATE.labels(name)
+        self.rejected = CIRCUIT_BREAKER_REJECTED.labels(name)
+        self.state_metric.set(self.STATE_VALUES[self.state])
+
+    @property
+    def is_open(self) -> bool:
+        """Вызовы сейчас отклоняются без попытки (пробные вызовы ещё не разрешены)"""
+        return self.state == self.OPEN and time.monotonic() - self.opened_at < self.open_interval
+
+    @asynccontextmanager
+    async def guard(self):
+        """Выполняет вызов внутри блока через предохранитель и учитывает его исход"""
+        if not self.enabled:
+            yield
+            return
+
+        epoch, probe = self.before_call()
+        started = time.perf_counter()
+        # None - исход вызова не учитывается
+        failed = None
+        try:
+            yield
+            failed = False
+        except self.ignored_exceptions:
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.after_call(epoch, probe, failed, time.perf_counter() - started)
+
+    def before_call(self) -> tuple[int, bool]:
+        """Пропускает вызов или отклоняет его. Возвращает номер состояния и признак пробного вызова"""
+        if self.state == self.OPEN:
+            if self.is_open:
+                self.reject()
+            self.set_state(self.HALF_OPEN)
+
+        if self.state == self.HALF_OPEN:
+            if self.probes_in_flight + self.probes_succeeded >= self.half_open_calls:
+                self.reject()
+            self.probes_in_flight += 1
+            return self.epoch, True
+        return self.epoch, False
+
+    def after_call(self, epoch: int, probe: bool, failed: Optional[bool], duration: float):
+        if epoch != self.epoch:
+            return
+        if probe:
+            self.probes_in_flight -= 1
+        if failed is None:
+            return
+        slow = duration >= self.slow_call_duration
+
+        if probe:
+            if failed or slow:
+                self.open()
+                return
+            self.probes_succeeded += 1
+            if self.probes_succeeded >= self.half_open_calls:
+                self.set_state(self.CLOSED)
+            return
+
+        if len(self.outcomes) == self.outcomes.maxlen:
+            old_failed, old_slow = self.outcomes.popleft()
+            self.failures -= old_failed
+            self.slow_calls -= old_slow
+        self.outcomes.append((failed, slow))
+        self.failures += failed
+        self.slow_calls += slow
+
+        calls = len(self.outcomes)
+        if calls >= self.min_calls and (
+                self.failures / calls >= self.failure_rate or self.slow_calls / calls >= self.slow_call_rate
+        ):
+            self.open()
+
+    def reject(self):
+        self.rejected.inc()
+        raise CircuitOpen(self.name)
+
+    def open(self):
+        logger.warning(
+            f'Circuit breaker {self.name} opened: {self.failures} failed and {self.slow_calls} slow '
+            f'of {len(self.outcomes)} calls'
+        )
+        self.opened_at = time.monotonic()
+        self.set_state(self.OPEN)
+
+    def set_state(self, state: str):
+        if state != self.OPEN:
+            logger.info(f'Circuit breaker {self.name} is {state}')
+        self.state = state
+        self.epoch += 1
+        self.outcomes.clear()
+        self.failures = 0
+        self.slow_calls = 0
+        self.probes_in_flight = 0
+        self.probes_succeeded = 0
+        self.state_metric.set(self.STATE_VALUES[state])
+
+
+es_circuit_breaker = CircuitBreaker(
+    'elasticsearch',
+    enabled=settings.ES_CIRCUIT_BREAKER_ENABLED,
+    window=settings.ES_CIRCUIT_BREAKER_WINDOW,
+    min_calls=settings.ES_CIRCUIT_BREAKER_MIN_CALLS,
+    failure_rate=settings.ES_CIRCUIT_BREAKER_FAILURE_RATE,
+    slow_call_duration=settings.ES_CIRCUIT_BREAKER_SLOW_CALL_IN_SECONDS,
+    slow_call_rate=settings.ES_CIRCUIT_BREAKER_SLOW_CALL_RATE,
+    open_interval=settings.ES_CIRCUIT_BREAKER_OPEN_IN_SECONDS,
+    half_open_calls=settings.ES_CIRCUIT_BREAKER_HALF_OPEN_CALLS,
+)
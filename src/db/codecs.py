@@ -0,0 +1,126 @@
+import json
+import zlib
+from abc import ABC, abstractmethod
+from typing import Any
+from uuid import UUID
+
+import orjson
+
+# Закодированная запись начинается с MAGIC и байта с идентификатором кодека.
+# Записи без заголовка - это JSON, который писался до появления кодеков.
+# Читатель понимает любой известный формат, поэтому кодек записи можно менять
+# при поэтапной выкладке: старые и новые воркеры читают записи друг друга.
+MAGIC = b'\x00'
+
+
+class Codec(ABC):
+    @abstractmethod
+    def encode(self, obj: Any) -> bytes:
+        pass
+
+    @abstractmethod
+    def decode(self, data: bytes) -> Any:
+        pass
+
+
+class JsonCodec(Codec):
+    def encode(self, obj: Any) -> bytes:
+        return json.dumps(obj, default=str).encode()
+
+    def decode(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(Codec):
+    def encode(self, obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def decode(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+
+class MsgpackCodec(Codec):
+    def __init__(self):
+        import msgpack
+        self.msgpack = msgpack
+
+    @staticmethod
+    def default(obj: Any) -> Any:
+        if isinstance(obj, UUID):
+            return str(obj)
+        raise TypeError(f'Object of type {type(obj).__name__} is not msgpack serializable')
+
+    def encode(self, obj: Any) -> bytes:
+        return self.msgpack.packb(obj, default=self.default)
+
+    def decode(self, data: bytes) -> Any:
+        return self.msgpack.unpackb(data)
+
+
+class ZlibCodec(Codec):
+    def __init__(self, inner: Codec, level: int = 6):
+        self.inner = inner
+        self.level = level
+
+    def encode(self, obj: Any) -> bytes:
+        return zlib.compress(self.inner.encode(obj), self.level)
+
+    def decode(self, data: bytes) -> Any:
+        return self.inner.decode(zlib.decompress(data))
+
+
+class ZstdCodec(Codec):
+    def __init__(self, inner: Codec, level: int = 3):
+        import zstandard
+        self.inner = inner
+        self.compressor = zstandard.ZstdCompressor(level=level)
+        self.decompressor = zstandard.ZstdDecompressor()
+
+    def encode(self, obj: Any) -> bytes:
+        return self.compressor.compress(self.inner.encode(obj))
+
+    def decode(self, data: bytes) -> Any:
+        return self.inner.decode(self.decompressor.decompress(data))
+
+
+# Имя кодека -> (идентификатор в заголовке записи, фабрика).
+# Идентификаторы нельзя менять и переиспользовать: по ним читаются уже записанные данные
+CODECS = {
+    'json': (1, JsonCodec),
+    'orjson': (2, OrjsonCodec),
+    'msgpack': (3, MsgpackCodec),
+    'orjson+zlib': (4, lambda: ZlibCodec(OrjsonCodec())),
+    'msgpack+zlib': (5, lambda: ZlibCodec(MsgpackCodec())),
+    'orjson+zstd': (6, lambda: ZstdCodec(OrjsonCodec())),
+    'msgpack+zstd': (7, lambda: ZstdCodec(MsgpackCodec())),
+}
+CODEC_NAMES = {codec_id: name for name, (codec_id, _) in CODECS.items()}
+
+
+class CacheSerializer:
+    """Кодирует значения кеша выбранным кодеком, а декодирует по заголовку записи любым известным"""
+
+    def __init__(self, codec_name: str):
+        if codec_name not in CODECS:
+            raise ValueError(f'Unknown cache codec {codec_name}')
+        self.codec_id, factory = CODECS[codec_name]
+        self.header = MAGIC + bytes([self.codec_id])
+        self.codec = factory()
+        self.decoders: dict[int, Codec] = {self.codec_id: self.codec}
+
+    def dumps(self, obj: Any) -> bytes:
+        return self.header + self.codec.encode(obj)
+
+    def loads(self, data: bytes) -> Any:
+        if not data.startswith(MAGIC):
+            return json.loads(data)
+        return self.get_decoder(data[1]).decode(data[2:])
+
+    def get_decoder(self, codec_id: int) -> Codec:
+        decoder = self.decoders.get(codec_id)
+        if decoder is None:
+            if codec_id not in CODEC_NAMES:
+                raise ValueError(f'Unknown cache codec id {codec_id}')
+            _, factory = CODECS[CODEC_NAMES[codec_id]]
+            decoder = self.decoders[codec_id] = factory()
+        return decoder
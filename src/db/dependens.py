@@ -1,5 +1,8 @@
+from core.config import settings
 from db.elastic import ElasticStorage
+from db.memory import TwoTierCache, local_cache
 from db.redis import RedisStorage, RedisCreator
+from db.single_flight import SingleFlight, single_flight
 from db.storage import AbstractStorage, AbstractCache, AbstractKeyCreator
 
 
@@ -10,6 +13,8 @@ async def get_storage() -> AbstractStorage:
 
 async def get_cache() -> AbstractCache:
     cache = RedisStorage()
+    if settings.LOCAL_CACHE_ENABLED:
+        cache = TwoTierCache(local_cache, cache, ttl=settings.LOCAL_CACHE_TTL_IN_SECONDS)
     return cache
 
 
@@ -17,3 +22,6 @@ async def get_cache_creator() -> AbstractKeyCreator:
     cache_creator = RedisCreator()
     return cache_creator
 
+
+async def get_single_flight() -> SingleFlight:
+    return single_flight
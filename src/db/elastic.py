@@ -1,174 +1,364 @@
+import asyncio
+import base64
+import binascii
+import json
+import logging
+import time
+from contextvars import ContextVar
+from functools import lru_cache, wraps
 from typing import Optional
 from uuid import UUID
 
-from elasticsearch import AsyncElasticsearch, NotFoundError
+import aiohttp
+import orjson
+from elasticsearch import AIOHttpConnection, AsyncElasticsearch, NotFoundError, TransportError
+from elasticsearch._async.http_aiohttp import ESClientResponse
+from elasticsearch.exceptions import HTTP_EXCEPTIONS
 
 from api.v1 import models
-from db.storage import AbstractStorage
+from core.config import settings
+from core.metrics import ES_ERRORS, ES_REQUEST_DURATION, ES_TOOK
+from db.bulkhead import BackendOverloaded, es_get_bulkhead, es_search_bulkhead
+from db.circuit_breaker import es_circuit_breaker
+from db.queries import (FILM_SEARCH_PAGE, FILMS_BY_GENRE_PAGE, MATCH_ALL_PAGE, PERSON_FILMS, PERSON_SEARCH_PAGE,
+                        QueryTemplate, get_sort)
+from db.storage import AbstractStorage, InvalidCursor
+
+logger = logging.getLogger(__name__)
 
 es: Optional[AsyncElasticsearch] = None
 
 
+class KeepAliveConnection(AIOHttpConnection):
+    """Соединение с ES, у которого настраивается, сколько живут простаивающие соединения пула"""
+
+    def __init__(self, *args, keep_alive: float = 15, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.keep_alive = keep_alive
+
+    async def _create_aiohttp_session(self):
+        # Как в AIOHttpConnection, но с keepalive_timeout у пула соединений
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        self.session = aiohttp.ClientSession(
+            headers=self.headers,
+            auto_decompress=True,
+            loop=self.loop,
+            cookie_jar=aiohttp.DummyCookieJar(),
+            response_class=ESClientResponse,
+            connector=aiohttp.TCPConnector(
+                limit=self._limit, use_dns_cache=True, ssl=self._ssl_context, keepalive_timeout=self.keep_alive,
+            ),
+        )
+
+@lru_cache()
+def get_source_fields(model) -> list[str]:
+    """
+    Поля документа, которые нужны модели: из ES забирается только эта часть _source.
+    Вложенные модели не раскрываются до своих полей (actors.uuid): фильтрация _source
+    по таким путям выкидывает пустые массивы, и поле пропадает из документа.
+    """
+    return list(model.__fields__)
+
+
+def encode_cursor(cursor: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        raise InvalidCursor(cursor)
+    if not isinstance(decoded, dict) or not isinstance(decoded.get("search_after"), list):
+        raise InvalidCursor(cursor)
+    return decoded
+
+
+# Публичный метод ElasticStorage, внутри которого идёт запрос: метка для took
+current_method: ContextVar[str] = ContextVar('current_method', default='')
+
+
+def instrumented(func):
+    """Вызов метода хранилища через предохранитель ES, время и ошибки вызова в метриках"""
+
+    @wraps(func)
+    async def inner(*args, **kwargs):
+        token = current_method.set(func.__name__)
+        started = time.perf_counter()
+        try:
+            async with es_circuit_breaker.guard():
+                return await func(*args, **kwargs)
+        except (InvalidCursor, BackendOverloaded):
+            raise
+        except Exception:
+            ES_ERRORS.labels(func.__name__).inc()
+            raise
+        finally:
+            ES_REQUEST_DURATION.labels(func.__name__).observe(time.perf_counter() - started)
+            current_method.reset(token)
+
+    return inner
+
+
+def observe_took(doc: dict):
+    if "took" in doc:
+        ES_TOOK.labels(current_method.get()).observe(doc["took"] / 1000)
+
+
+class PointsInTime:
+    """
+    Снимки индекса (point-in-time), открытые воркером, и сроки их жизни в ES.
+    Брошенные выдачи не закрывают снимки, поэтому число живых снимков ограничено:
+    снимок считается живым, пока не истёк keep_alive после последнего обращения.
+    """
+
+    def __init__(self, keep_alive: int, max_open: int):
+        self.keep_alive = keep_alive
+        self.max_open = max_open
+        # pit_id -> когда ES закроет снимок сам
+        self.expires_at: dict[str, float] = {}
+
+    def can_open(self) -> bool:
+        now = time.monotonic()
+        self.expires_at = {pit_id: expires for pit_id, expires in self.expires_at.items() if expires > now}
+        return len(self.expires_at) < self.max_open
+
+    def touch(self, pit_id: str, previous_id: Optional[str] = None):
+        if previous_id and previous_id != pit_id:
+            self.expires_at.pop(previous_id, None)
+        self.expires_at[pit_id] = time.monotonic() + self.keep_alive
+
+    def forget(self, pit_id: str):
+        self.expires_at.pop(pit_id, None)
+
+
+points_in_time = PointsInTime(settings.ES_POINT_IN_TIME_KEEP_ALIVE_IN_SECONDS, settings.ES_POINT_IN_TIME_MAX_OPEN)
+
+
 class ElasticStorage(AbstractStorage):
     def __init__(self):
         self.elastic = es
 
+    @instrumented
     async def get_data_by_id(self, index: str, id: UUID, model: models) -> Optional[models.BaseModel]:
         try:
-            doc = await self.elastic.get(index, id)
+            async with es_get_bulkhead:
+                doc = await self.elastic.get(index, id, _source_includes=get_source_fields(model))
             return model(**doc["_source"])
         except NotFoundError:
             return None
 
-    async def get_data_list_by_id(
-            self, index: str, filter_genre: UUID, model: models, parameters: dict = None
-    ) -> Optional[list[models.BaseModel]]:
+    async def search(
+            self, template: QueryTemplate, params: dict, index: Optional[str] = None, extra: Optional[dict] = None
+    ) -> dict:
+        """
+        Запрос по шаблону. Если шаблоны сохранены в ES, передаются только имя и параметры,
+        кроме запросов с полями сверх шаблона (search_after, pit) - у них тело собирается здесь.
+        """
+        async with es_search_bulkhead:
+            if settings.ES_STORED_TEMPLATES_ENABLED and not extra:
+                doc = await self.elastic.search_template(index=index, body=template.render_stored(params))
+            else:
+                doc = await self.elastic.search(index=index, body=template.render(params, extra))
+        observe_took(doc)
+        return doc
 
-        if filter_genre:
-            body = {
-                "query": {
-                    "bool": {
-                        "must": [
-                            {
-                                "nested": {
-                                    "path": "genre",
-                                    "query": {
-                                        "bool": {
-                                            "should": [
-                                                {"term": {"genre.uuid": filter_genre}}
-                                            ]
-                                        }
-                                    },
-                                }
-                            }
-                        ]
-                    }
-                }
-            }
-        else:
-            body = {"query": {"match_all": {}}}
-        additional_params = {
+    @staticmethod
+    def get_film_list_query(filter_genre: Optional[UUID], parameters: dict) -> tuple[QueryTemplate, dict]:
+        sort = get_sort(parameters["sort"], "film")
+        if not filter_genre:
+            return MATCH_ALL_PAGE, {"sort": sort}
+        return FILMS_BY_GENRE_PAGE, {"sort": sort, "genre": filter_genre}
+
+    @staticmethod
+    def get_film_search_query(query: str, parameters: dict) -> tuple[QueryTemplate, dict]:
+        sort = get_sort(parameters["sort"], "film")
+        if not query:
+            return MATCH_ALL_PAGE, {"sort": sort}
+        return FILM_SEARCH_PAGE, {"sort": sort, "query": query}
+
+    @staticmethod
+    def get_person_search_query(query: str, parameters: dict) -> tuple[QueryTemplate, dict]:
+        sort = get_sort(parameters["sort"], "person")
+        if not query:
+            return MATCH_ALL_PAGE, {"sort": sort}
+        return PERSON_SEARCH_PAGE, {"sort": sort, "query": query}
+
+    async def search_page(self, index: str, template: QueryTemplate, params: dict, model, parameters: dict
+                          ) -> list[models.BaseModel]:
+        params = {
+            **params,
+            "source": get_source_fields(model),
             "from": (parameters["page_number"] - 1) * parameters["page_size"],
             "size": parameters["page_size"],
         }
-        if parameters["sort"] == "imdb_rating":
-            additional_params.update({"sort": [{"imdb_rating": {"order": "asc"}}]})
-        elif parameters["sort"] == "-imdb_rating":
-            additional_params.update({"sort": [{"imdb_rating": {"order": "desc"}}]})
-        body.update(additional_params)
+        doc = await self.search(template, params, index=index)
+        return [model(**hit["_source"]) for hit in doc["hits"]["hits"]]
 
-        doc = await self.elastic.search(index=index, body=body)
-        films = [model(**hit["_source"]) for hit in doc["hits"]["hits"]]
-        return films
+    async def open_pit(self, index: str) -> Optional[str]:
+        if not points_in_time.can_open():
+            return None
+        async with es_search_bulkhead:
+            pit = await self.elastic.transport.perform_request(
+                "POST", f"/{index}/_pit", params={"keep_alive": f"{settings.ES_POINT_IN_TIME_KEEP_ALIVE_IN_SECONDS}s"}
+            )
+        points_in_time.touch(pit["id"])
+        return pit["id"]
+
+    async def close_pit(self, pit_id: str):
+        points_in_time.forget(pit_id)
+        try:
+            async with es_search_bulkhead:
+                await self.elastic.transport.perform_request("DELETE", "/_pit", body={"id": pit_id})
+        except Exception:
+            # Незакрытый снимок ES закроет сам по истечении keep_alive
+            logger.warning("Failed to close point-in-time", exc_info=True)
 
+    async def search_after(
+            self, index: str, template: QueryTemplate, params: dict, model, parameters: dict
+    ) -> tuple[list[models.BaseModel], Optional[str]]:
+        """
+        Страница выдачи после курсора parameters["cursor"] (пустой курсор - с начала выдачи).
+        Вместо from/size используется search_after, поэтому глубина страницы не влияет на
+        время ответа и не ограничена index.max_result_window. Если включён point-in-time,
+        страницы после первой читаются с одного снимка индекса: снимок открывается только
+        при переходе на вторую страницу, так что запросы одной первой страницы снимков не
+        оставляют. Если открыто слишком много снимков, выдача идёт без снимка.
+        Возвращает найденные объекты и курсор следующей страницы (None, если выдача закончилась).
+        """
+        cursor = decode_cursor(parameters["cursor"]) if parameters["cursor"] else {}
+        pit_id = cursor.get("pit_id")
+        opened = False
+        if cursor and not pit_id and settings.ES_POINT_IN_TIME_ENABLED:
+            pit_id = await self.open_pit(index)
+            opened = pit_id is not None
+
+        params = {**params, "source": get_source_fields(model), "from": 0, "size": parameters["page_size"]}
+        extra = {}
+        if cursor.get("search_after"):
+            extra["search_after"] = cursor["search_after"]
+        try:
+            if pit_id:
+                # Запрос по point-in-time выполняется без указания индекса
+                extra["pit"] = {"id": pit_id, "keep_alive": f"{settings.ES_POINT_IN_TIME_KEEP_ALIVE_IN_SECONDS}s"}
+                doc = await self.search(template, params, extra=extra)
+                points_in_time.touch(doc.get("pit_id", pit_id), pit_id)
+                pit_id = doc.get("pit_id", pit_id)
+            else:
+                doc = await self.search(template, params, index=index, extra=extra)
+        except Exception:
+            # Снимок, открытый этим запросом, не попал ни в один курсор, и закрыть его больше некому
+            if opened:
+                await self.close_pit(pit_id)
+            raise
+
+        hits = doc["hits"]["hits"]
+        if len(hits) < parameters["page_size"]:
+            if pit_id:
+                await self.close_pit(pit_id)
+            next_cursor = None
+        else:
+            next_cursor = encode_cursor({"search_after": hits[-1]["sort"], "pit_id": pit_id})
+        return [model(**hit["_source"]) for hit in hits], next_cursor
+
+    @instrumented
+    async def get_data_list_by_id(
+            self, index: str, filter_genre: UUID, model: models, parameters: dict = None
+    ) -> Optional[list[models.BaseModel]]:
+        template, params = self.get_film_list_query(filter_genre, parameters)
+        return await self.search_page(index, template, params, model, parameters)
+
+    @instrumented
+    async def get_data_list_by_cursor(
+            self, index: str, filter_genre: UUID, model, parameters: dict
+    ) -> tuple[list[models.BaseModel], Optional[str]]:
+        template, params = self.get_film_list_query(filter_genre, parameters)
+        return await self.search_after(index, template, params, model, parameters)
+
+    @instrumented
     async def get_data_by_query(
             self, index: str, query: str, model, parameters: dict = None
     ) -> Optional[list[models.BaseModel]]:
-        if query:
-            body = {
-                "query": {
-                    "bool": {
-                        "should": [
-                            {"match": {"title": query}},
-                            {"match": {"description": query}},
-                        ]
-                    }
-                }
-            }
-        else:
-            body = {"query": {"match_all": {}}}
-        additional_params = {
-            "from": (parameters["page_number"] - 1) * parameters["page_size"],
-            "size": parameters["page_size"],
-        }
-        if parameters["sort"] == "imdb_rating":
-            additional_params.update({"sort": [{"imdb_rating": {"order": "asc"}}]})
-        elif parameters["sort"] == "-imdb_rating":
-            additional_params.update({"sort": [{"imdb_rating": {"order": "desc"}}]})
-        body.update(additional_params)
+        template, params = self.get_film_search_query(query, parameters)
+        return await self.search_page(index, template, params, model, parameters)
 
-        doc = await self.elastic.search(index=index, body=body)
-        films = [model(**hit["_source"]) for hit in doc["hits"]["hits"]]
-        return films
+    @instrumented
+    async def get_data_by_query_cursor(
+            self, index: str, query: str, model, parameters: dict
+    ) -> tuple[list[models.BaseModel], Optional[str]]:
+        template, params = self.get_film_search_query(query, parameters)
+        return await self.search_after(index, template, params, model, parameters)
 
+    @instrumented
+    async def get_data_by_ids(self, index: str, ids: list[UUID], model) -> list[Optional[models.BaseModel]]:
+        if not ids:
+            return []
+        async with es_get_bulkhead:
+            doc = await self.elastic.mget(
+                body={"ids": [str(id) for id in ids]}, index=index, _source_includes=get_source_fields(model)
+            )
+        return [model(**item["_source"]) if item.get("found") else None for item in doc["docs"]]
+
+    @instrumented
     async def get_person_films_from_elastic(self, index: str, person_id: UUID, model) -> list[models.BaseModel]:
-        body = {
-            "_source": [
-                "uuid",
-                "title",
-                "imdb_rating",
-                "actors",
-                "writers",
-                "directors",
-            ],
-            "query": {
-                "bool": {
-                    "should": [
-                        {
-                            "nested": {
-                                "path": "actors",
-                                "query": {
-                                    "bool": {
-                                        "should": [{"term": {"actors.uuid": person_id}}]
-                                    }
-                                },
-                            }
-                        },
-                        {
-                            "nested": {
-                                "path": "writers",
-                                "query": {
-                                    "bool": {
-                                        "should": [
-                                            {"term": {"writers.uuid": person_id}}
-                                        ]
-                                    }
-                                },
-                            }
-                        },
-                        {
-                            "nested": {
-                                "path": "directors",
-                                "query": {
-                                    "bool": {
-                                        "should": [
-                                            {"term": {"directors.uuid": person_id}}
-                                        ]
-                                    }
-                                },
-                            }
-                        },
-                    ]
-                }
-            },
-        }
-        doc = await self.elastic.search(index=index, body=body)
+        doc = await self.search(PERSON_FILMS, {"source": get_source_fields(model), "person": person_id}, index=index)
         films = [model(**hit["_source"]) for hit in doc["hits"]["hits"]]
         return films
 
+    @instrumented
+    async def get_persons_films_from_elastic(
+            self, index: str, person_ids: list[UUID], model
+    ) -> list[list[models.BaseModel]]:
+        # Фильмографии всех персон получаем одним запросом msearch
+        if not person_ids:
+            return []
+        header = orjson.dumps({"index": index})
+        source = get_source_fields(model)
+        lines = []
+        for person_id in person_ids:
+            params = {"source": source, "person": person_id}
+            lines.append(header)
+            if settings.ES_STORED_TEMPLATES_ENABLED:
+                lines.append(PERSON_FILMS.render_stored(params))
+            else:
+                lines.append(PERSON_FILMS.render(params))
+        body = b"\n".join(lines) + b"\n"
+        async with es_search_bulkhead:
+            if settings.ES_STORED_TEMPLATES_ENABLED:
+                doc = await self.elastic.msearch_template(body=body)
+            else:
+                doc = await self.elastic.msearch(body=body)
+        observe_took(doc)
+        for response in doc["responses"]:
+            # Ошибка отдельного запроса не делает ошибочным весь ответ msearch. Она пробрасывается
+            # так же, как ошибка всего запроса, иначе персона попала бы в кеш без фильмографии
+            if "error" in response:
+                status, error = response.get("status", 500), response["error"]
+                error_type = error.get("type") if isinstance(error, dict) else error
+                raise HTTP_EXCEPTIONS.get(status, TransportError)(status, error_type, response)
+        return [
+            [model(**hit["_source"]) for hit in response["hits"]["hits"]]
+            for response in doc["responses"]
+        ]
+
+    @instrumented
     async def get_person_search_from_elastic(
             self, index: str, query: str, model, parameters: dict = None
     ) -> list[models.BaseModel]:
-        if query:
-            body = {"query": {"match": {"full_name": {"query": query}}}}
-        else:
-            body = {"query": {"match_all": {}}}
-        additional_params = {
-            "from": (parameters["page_number"] - 1) * parameters["page_size"],
-            "size": parameters["page_size"],
-        }
-        if parameters["sort"] == "full_name":
-            additional_params.update({"sort": [{"full_name.raw": {"order": "asc"}}]})
-        elif parameters["sort"] == "-full_name":
-            additional_params.update({"sort": [{"full_name.raw": {"order": "desc"}}]})
-        body.update(additional_params)
+        template, params = self.get_person_search_query(query, parameters)
+        return await self.search_page(index, template, params, model, parameters)
 
-        doc = await self.elastic.search(index=index, body=body)
-        persons = [model(**hit["_source"]) for hit in doc["hits"]["hits"]]
-        return persons
+    @instrumented
+    async def get_person_search_by_cursor(
+            self, index: str, query: str, model, parameters: dict
+    ) -> tuple[list[models.BaseModel], Optional[str]]:
+        template, params = self.get_person_search_query(query, parameters)
+        return await self.search_after(index, template, params, model, parameters)
 
+    @instrumented
     async def get_all_from_elastic(self, index: str, model) -> list[models.BaseModel]:
-        body = {"size": 1000, "query": {"match_all": {}}}
-        doc = await self.elastic.search(index=index, body=body)
+        params = {"source": get_source_fields(model), "sort": get_sort(None, "genre"), "from": 0, "size": 1000}
+        doc = await self.search(MATCH_ALL_PAGE, params, index=index)
         res = [model(**hit["_source"]) for hit in doc["hits"]["hits"]]
         return res
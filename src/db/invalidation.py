@@ -0,0 +1,112 @@
+import asyncio
+import json
+import logging
+from typing import Callable, Optional
+
+import aioredis
+
+from core.config import settings
+from db.bloom import bloom_filters
+from db.storage import AbstractCache, AbstractKeyCreator
+
+logger = logging.getLogger(__name__)
+
+# Пространства имён, в которых объекты индекса кешируются по айди
+INDEX_ID_NAMESPACES = {
+    'movies': ['film', 'filmshort'],
+    'genres': ['genre'],
+    'persons': ['person'],
+}
+# Пространства имён записей, построенных по данным индекса (списки, поиск, ответы ручек).
+# Они сбрасываются целиком увеличением поколения
+INDEX_NAMESPACES = {
+    'movies': ['film-window', 'film-response', 'person', 'person-films', 'person-search', 'person-response'],
+    'genres': ['genre-list', 'genre-response'],
+    'persons': ['person-search', 'person-response'],
+}
+
+
+class CacheInvalidationListener:
+    """
+    Читает из Redis stream айди объектов, которые ETL загрузил в ES, и сбрасывает их кеш:
+    удаляет записи по айди и увеличивает поколение пространств имён, зависящих от индекса.
+    Поток читает каждый воркер, чтобы сбросить и свой in-process кеш. Поколение становится
+    айди события, поэтому воркеры, обработавшие одно событие, выставляют одно поколение,
+    и пространство имён сбрасывается один раз.
+    """
+
+    def __init__(
+            self, cache: AbstractCache, cache_creator: AbstractKeyCreator, on_invalidated: Optional[Callable] = None
+    ):
+        self.cache = cache
+        self.cache_creator = cache_creator
+        # Вызывается после обработки пачки событий, например, чтобы снова прогреть кеш
+        self.on_invalidated = on_invalidated
+        self.connection: Optional[aioredis.Redis] = None
+
+    async def connect(self):
+        # XREAD с ожиданием занимает соединение, поэтому у слушателя оно своё
+        self.connection = await aioredis.create_redis((settings.REDIS_HOST, settings.REDIS_PORT))
+
+    async def disconnect(self):
+        if self.connection is not None:
+            self.connection.close()
+            await self.connection.wait_closed()
+            self.connection = None
+
+    async def run(self):
+        latest_id = '$'
+        try:
+            while True:
+                try:
+                    if self.connection is None:
+                        await self.connect()
+                    messages = await self.connection.xread(
+                        [settings.CACHE_INVALIDATION_STREAM],
+                        timeout=settings.CACHE_INVALIDATION_BLOCK_IN_MS,
+                        count=settings.CACHE_INVALIDATION_READ_COUNT,
+                        latest_ids=[latest_id],
+                    )
+                    # Айди всех событий пачки объединяются по индексам, чтобы поколения
+                    # пространств имён сменились один раз на пачку, а не на каждое событие.
+                    # Поколением индекса становится айди его последнего события в пачке
+                    ids_by_index: dict[str, list[str]] = {}
+                    last_ids: dict[str, str] = {}
+                    for _, message_id, fields in messages:
+                        index = fields[b'index'].decode()
+                        ids_by_index.setdefault(index, []).extend(json.loads(fields[b'ids']))
+                        last_ids[index] = message_id.decode()
+                    for index, ids in ids_by_index.items():
+                        await self.invalidate(index, ids, last_ids[index])
+                    if messages:
+                        latest_id = messages[-1][1]
+                    if messages and self.on_invalidated:
+                        self.on_invalidated()
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    # После обрыва или перезапуска Redis соединение создаётся заново, а чтение
+                    # продолжается с последнего обработанного события, так что события не теряются
+                    logger.exception('Cache invalidation failed')
+                    await self.disconnect()
+                    await asyncio.sleep(1)
+        finally:
+            await self.disconnect()
+
+    async def invalidate(self, index: str, ids: list[str], stream_id: str):
+        bloom_filters.add(index, ids)
+        # Ключи строятся и удаляются срезами айди, чтобы большая пачка событий
+        # не превращалась в один DEL на миллионы ключей
+        batch_size = settings.CACHE_INVALIDATION_DELETE_BATCH_SIZE
+        for i in range(0, len(ids), batch_size):
+            keys = [
+                await self.cache_creator.get_key_from_id(name_model, pk)
+                for name_model in INDEX_ID_NAMESPACES.get(index, [])
+                for pk in ids[i:i + batch_size]
+            ]
+            # Вместе с записями удаляем и отметки о том, что объектов не было
+            keys += [await self.cache_creator.get_key_from_missing(key) for key in keys]
+            await self.cache.delete(keys)
+        for namespace in INDEX_NAMESPACES.get(index, []):
+            await self.cache_creator.bump_generation(namespace, stream_id)
+        logger.debug(f'Invalidated {len(ids)} {index} ids')
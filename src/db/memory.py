@@ -0,0 +1,177 @@
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Union
+
+from api.v1 import models
+from core.config import settings
+from core.metrics import LOCAL_CACHE_REQUESTS
+from db.storage import AbstractCache
+
+# Пространство имён для готовых тел ответов
+RAW_NAMESPACE = 'raw'
+
+
+class LRUCache:
+    """
+    In-process кеш с TTL и вытеснением давно не использовавшихся записей (LRU).
+    Записи разложены по пространствам имён, у каждого свой лимит: размер записи
+    считается в объектах (список из 50 фильмов весит 50), так что память ограничена
+    суммой лимитов.
+    """
+
+    def __init__(self, default_max_objects: int, namespace_max_objects: dict[str, int] = None):
+        self.default_max_objects = default_max_objects
+        self.namespace_max_objects = namespace_max_objects or {}
+        # namespace -> key -> (expires_at, size, value)
+        self.namespaces: dict[str, OrderedDict] = {}
+        self.sizes: dict[str, int] = {}
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        entries = self.namespaces.get(namespace)
+        if not entries or key not in entries:
+            LOCAL_CACHE_REQUESTS.labels(namespace, 'miss').inc()
+            return None
+
+        expires_at, size, value = entries[key]
+        if expires_at <= time.monotonic():
+            self._pop(namespace, key)
+            LOCAL_CACHE_REQUESTS.labels(namespace, 'miss').inc()
+            return None
+        entries.move_to_end(key)
+        LOCAL_CACHE_REQUESTS.labels(namespace, 'hit').inc()
+        return value
+
+    def put(self, namespace: str, key: str, value: Any, ttl: float, size: int = 1):
+        max_objects = self.namespace_max_objects.get(namespace, self.default_max_objects)
+        if size > max_objects:
+            return
+
+        entries = self.namespaces.setdefault(namespace, OrderedDict())
+        if key in entries:
+            self._pop(namespace, key)
+        entries[key] = (time.monotonic() + ttl, size, value)
+        self.sizes[namespace] = self.sizes.get(namespace, 0) + size
+
+        while self.sizes[namespace] > max_objects:
+            oldest_key = next(iter(entries))
+            self._pop(namespace, oldest_key)
+
+    def delete(self, key: str):
+        for namespace, entries in self.namespaces.items():
+            if key in entries:
+                self._pop(namespace, key)
+
+    def _pop(self, namespace: str, key: str):
+        _, size, _ = self.namespaces[namespace].pop(key)
+        self.sizes[namespace] -= size
+
+
+class TwoTierCache(AbstractCache):
+    """Кеш из двух уровней: in-process LRU перед кешем в Redis. Попадания в LRU отдают уже разобранные модели."""
+
+    def __init__(self, local: LRUCache, remote: AbstractCache, ttl: float):
+        self.local = local
+        self.remote = remote
+        self.ttl = ttl
+
+    @staticmethod
+    def get_namespace(model, as_list: bool = False) -> str:
+        namespace = model.__name__.lower()
+        return f'{namespace}_list' if as_list else namespace
+
+    async def get_data(self, key: str, model, as_list: bool = False) -> Optional[models.BaseModel]:
+        namespace = self.get_namespace(model, as_list)
+        data = self.local.get(namespace, key)
+        if data is not None:
+            return data
+
+        data = await self.remote.get_data(key, model, as_list=as_list)
+        if data:
+            self.local.put(namespace, key, data, ttl=self.ttl, size=len(data) if as_list else 1)
+        return data
+
+    async def put_data(
+            self, key: str, data: Union[models.BaseModel, list[models.BaseModel]], as_list: bool = False,
+            expire: int = 300, stale_ttl: int = 0
+    ):
+        await self.remote.put_data(key, data, as_list=as_list, expire=expire, stale_ttl=stale_ttl)
+        self._put_local(key, data, ttl=min(self.ttl, expire))
+
+    async def get_entry(
+            self, key: str, model, as_list: bool = False, stale_ttl: int = 0, grace_ttl: int = 0, degraded: bool = False
+    ) -> tuple[Optional[Any], bool]:
+        namespace = self.get_namespace(model, as_list)
+        data = self.local.get(namespace, key)
+        if data is not None:
+            return data, False
+
+        data, stale = await self.remote.get_entry(
+            key, model, as_list=as_list, stale_ttl=stale_ttl, grace_ttl=grace_ttl, degraded=degraded
+        )
+        # Устаревшие записи в локальный уровень не попадают, чтобы следующие запросы
+        # тоже увидели, что запись пора обновить
+        if data and not stale:
+            self.local.put(namespace, key, data, ttl=self.ttl, size=len(data) if as_list else 1)
+        return data, stale
+
+    async def get_many(self, keys: list[str], model, as_list: bool = False) -> list[Optional[models.BaseModel]]:
+        namespace = self.get_namespace(model, as_list)
+        result = [self.local.get(namespace, key) for key in keys]
+        missing = [i for i, data in enumerate(result) if data is None]
+        if not missing:
+            return result
+
+        remote_data = await self.remote.get_many([keys[i] for i in missing], model, as_list=as_list)
+        for i, data in zip(missing, remote_data):
+            if data:
+                self.local.put(namespace, keys[i], data, ttl=self.ttl, size=len(data) if as_list else 1)
+            result[i] = data
+        return result
+
+    async def put_many(
+            self, items: dict[str, Union[models.BaseModel, list[models.BaseModel]]], expire: int = 300, stale_ttl: int = 0
+    ):
+        await self.remote.put_many(items, expire=expire, stale_ttl=stale_ttl)
+        for key, data in items.items():
+            self._put_local(key, data, ttl=min(self.ttl, expire))
+
+    async def delete(self, keys: list[str]):
+        await self.remote.delete(keys)
+        for key in keys:
+            self.local.delete(key)
+
+    async def get_raw(self, key: str) -> Optional[bytes]:
+        data = self.local.get(RAW_NAMESPACE, key)
+        if data is not None:
+            return data
+
+        data = await self.remote.get_raw(key)
+        if data:
+            self.local.put(RAW_NAMESPACE, key, data, ttl=self.ttl)
+        return data
+
+    async def put_raw(self, key: str, data: bytes, expire: int = 300):
+        await self.remote.put_raw(key, data, expire=expire)
+        self.local.put(RAW_NAMESPACE, key, data, ttl=min(self.ttl, expire))
+
+    # Отметки об отсутствии объектов в локальный уровень не попадают: объект может появиться
+    # в хранилище раньше, чем отметка истечёт, а на промахе воркер всё равно идёт в Redis
+    async def is_missing(self, key: str) -> bool:
+        return await self.remote.is_missing(key)
+
+    async def mark_missing(self, key: str, expire: int):
+        await self.remote.mark_missing(key, expire)
+
+    def _put_local(self, key: str, data: Union[models.BaseModel, list[models.BaseModel]], ttl: float):
+        if not data:
+            return
+        as_list = isinstance(data, list)
+        model = type(data[0]) if as_list else type(data)
+        namespace = self.get_namespace(model, as_list)
+        self.local.put(namespace, key, data, ttl=ttl, size=len(data) if as_list else 1)
+
+
+local_cache = LRUCache(
+    default_max_objects=settings.LOCAL_CACHE_MAX_OBJECTS,
+    namespace_max_objects=settings.LOCAL_CACHE_NAMESPACE_MAX_OBJECTS,
+)
@@ -0,0 +1,59 @@
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from uuid import UUID
+
+from core.config import settings
+from db import redis as redis_db
+
+logger = logging.getLogger(__name__)
+
+
+class Popularity:
+    """
+    Считает запросы объектов по айди. Счётчики копятся в процессе и раз в flush_interval
+    секунд одним конвейером добавляются в ZSET сущности в Redis, где хранятся только
+    max_ids самых запрашиваемых айди. По ним прогрев выбирает, что положить в кеш.
+    """
+
+    def __init__(self, max_ids: int, flush_interval: float):
+        self.max_ids = max_ids
+        self.flush_interval = flush_interval
+        self.hits: defaultdict[str, Counter] = defaultdict(Counter)
+
+    @staticmethod
+    def get_key(name_model: str) -> str:
+        return f"popular:{name_model}"
+
+    def hit(self, name_model: str, pk: UUID):
+        self.hits[name_model][str(pk)] += 1
+
+    async def flush(self):
+        hits, self.hits = self.hits, defaultdict(Counter)
+        if not hits:
+            return
+
+        pipe = redis_db.redis.pipeline()
+        for name_model, counter in hits.items():
+            key = self.get_key(name_model)
+            for pk, count in counter.items():
+                pipe.zincrby(key, count, pk)
+            pipe.zremrangebyrank(key, 0, -self.max_ids - 1)
+        await pipe.execute()
+
+    async def top(self, name_model: str, count: int) -> list[str]:
+        return await redis_db.redis.zrevrange(self.get_key(name_model), 0, count - 1, encoding='utf-8')
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception('Popularity flush failed')
+
+
+popularity = Popularity(
+    max_ids=settings.POPULARITY_MAX_IDS,
+    flush_interval=settings.POPULARITY_FLUSH_INTERVAL_IN_SECONDS,
+)
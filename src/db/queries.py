@@ -0,0 +1,139 @@
+import re
+from functools import lru_cache
+from typing import Optional
+
+import orjson
+
+# Подстановка параметра в шаблоне: строка "{{name}}" на месте значения
+PLACEHOLDER = re.compile(rb'"\{\{(\w+)\}\}"')
+
+# Параметр sort ручки -> поле индекса, по которому сортируется выдача
+SORT_FIELDS = {
+    "film": {"imdb_rating": "imdb_rating"},
+    "person": {"full_name": "full_name.raw"},
+    "genre": {},
+}
+
+
+class QueryTemplate:
+    """
+    Тело запроса к ES, которое собирается и сериализуется один раз при импорте.
+    Значения параметров подставляются в готовые байты на места "{{name}}",
+    так что на запрос не строятся вложенные словари и не сериализуется весь запрос.
+    Шаблон можно сохранить в ES как search template (mustache) и передавать только параметры.
+    """
+
+    def __init__(self, name: str, body: dict):
+        self.name = name
+        serialized = orjson.dumps(body)
+        # Чередование готовых кусков тела и имён параметров между ними
+        self.parts: list[bytes] = []
+        self.params: list[str] = []
+        position = 0
+        for match in PLACEHOLDER.finditer(serialized):
+            self.parts.append(serialized[position:match.start()])
+            self.params.append(match.group(1).decode())
+            position = match.end()
+        self.parts.append(serialized[position:])
+        self.source = PLACEHOLDER.sub(rb"{{#toJson}}\1{{/toJson}}", serialized).decode()
+
+    def render(self, params: dict, extra: Optional[dict] = None) -> bytes:
+        """
+        Тело запроса с подставленными параметрами.
+        extra - поля верхнего уровня, которых нет в шаблоне (search_after, pit), дописываются в конец тела.
+        """
+        chunks = [self.parts[0]]
+        for name, part in zip(self.params, self.parts[1:]):
+            chunks.append(orjson.dumps(params[name]))
+            chunks.append(part)
+        body = b"".join(chunks)
+        if extra:
+            body = body[:-1] + b"," + orjson.dumps(extra)[1:]
+        return body
+
+    def render_stored(self, params: dict) -> bytes:
+        """Тело запроса _search/template к шаблону, сохранённому в ES под именем шаблона"""
+        return orjson.dumps({"id": self.name, "params": {name: params[name] for name in set(self.params)}})
+
+    def script(self) -> dict:
+        return {"script": {"lang": "mustache", "source": self.source}}
+
+
+def page_template(name: str, query: dict) -> QueryTemplate:
+    """Шаблон страницы выдачи: from/size, а для search_after - from 0 и курсор в extra"""
+    return QueryTemplate(name, {
+        "_source": "{{source}}",
+        "query": query,
+        "sort": "{{sort}}",
+        "from": "{{from}}",
+        "size": "{{size}}",
+    })
+
+
+def nested_term(path: str, field: str, param: str) -> dict:
+    return {
+        "nested": {
+            "path": path,
+            "query": {"bool": {"should": [{"term": {f"{path}.{field}": f"{{{{{param}}}}}"}}]}},
+        }
+    }
+
+
+MATCH_ALL_PAGE = page_template("movies-match-all-page", {"match_all": {}})
+
+FILMS_BY_GENRE_PAGE = page_template("movies-by-genre-page", {
+    "bool": {"must": [nested_term("genre", "uuid", "genre")]},
+})
+
+FILM_SEARCH_PAGE = page_template("movies-search-page", {
+    "bool": {
+        "should": [
+            {"match": {"title": "{{query}}"}},
+            {"match": {"description": "{{query}}"}},
+        ]
+    }
+})
+
+PERSON_SEARCH_PAGE = page_template("movies-person-search-page", {
+    "match": {"full_name": {"query": "{{query}}"}},
+})
+
+PERSON_FILMS = QueryTemplate("movies-person-films", {
+    "_source": "{{source}}",
+    "query": {
+        "bool": {
+            "should": [
+                nested_term("actors", "uuid", "person"),
+                nested_term("writers", "uuid", "person"),
+                nested_term("directors", "uuid", "person"),
+            ]
+        }
+    },
+})
+
+TEMPLATES = [MATCH_ALL_PAGE, FILMS_BY_GENRE_PAGE, FILM_SEARCH_PAGE, PERSON_SEARCH_PAGE, PERSON_FILMS]
+
+
+@lru_cache()
+def get_sort(sort: Optional[str], entity: str) -> tuple:
+    """
+    Сортировка по параметру sort ("field" или "-field") с добавкой по uuid,
+    чтобы порядок был стабильным и по нему можно было продолжать выдачу через search_after.
+    Поле индекса для параметра берётся из SORT_FIELDS[entity].
+    """
+    res = []
+    if sort:
+        order = "desc" if sort.startswith("-") else "asc"
+        field = SORT_FIELDS[entity].get(sort.lstrip("-"))
+        if field:
+            res.append({field: {"order": order}})
+    if not res:
+        res.append("_score")
+    res.append({"uuid": {"order": "asc"}})
+    return tuple(res)
+
+
+async def put_stored_templates(elastic):
+    """Сохраняет шаблоны в ES, чтобы в запросах передавать только их имена и параметры"""
+    for template in TEMPLATES:
+        await elastic.put_script(id=template.name, body=template.script())
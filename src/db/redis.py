@@ -1,50 +1,216 @@
-import json
-from typing import Optional, Union
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Optional, Union
+from urllib.parse import urlencode
 from uuid import UUID
 
 from aioredis import Redis
-from pydantic.json import pydantic_encoder
 
-from db.storage import AbstractCache, AbstractKeyCreator
 from api.v1 import models
+from core.config import settings
+from core.metrics import CACHE_REQUESTS
+from db.bulkhead import redis_bulkhead
+from db.codecs import CacheSerializer
+from db.storage import AbstractCache, AbstractKeyCreator
 
 redis: Optional[Redis] = None
+serializer = CacheSerializer(settings.CACHE_CODEC)
+
+# Переставляет поколение на айди события потока инвалидации, только если оно новее текущего,
+# и возвращает текущее поколение. Значения не в формате айди потока считаются старше любого события
+ADVANCE_GENERATION_SCRIPT = """
+local function parse(stream_id)
+    local ms, seq = string.match(stream_id or '', '^(%d+)-(%d+)$')
+    return tonumber(ms or -1), tonumber(seq or -1)
+end
+local current = redis.call('get', KEYS[1])
+local current_ms, current_seq = parse(current)
+local new_ms, new_seq = parse(ARGV[1])
+if new_ms > current_ms or (new_ms == current_ms and new_seq > current_seq) then
+    redis.call('set', KEYS[1], ARGV[1])
+    return ARGV[1]
+end
+return current
+"""
+
+
+class Generations:
+    """
+    Поколения пространств имён ключей. Поколения хранятся в Redis, а в процессе
+    кешируются на ttl секунд, так что построение ключа обычно не ходит в Redis.
+
+    Поколение - айди последнего события потока инвалидации, которое сбросило пространство
+    имён. Поток читает каждый воркер, и все они выставляют одно и то же поколение: сброс
+    происходит один раз на событие, а не по разу на воркер, и прогретые записи не теряются.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        # namespace -> (expires_at, generation)
+        self.values: dict[str, tuple[float, str]] = {}
+
+    @staticmethod
+    def get_key(namespace: str) -> str:
+        return f"generation:{namespace}"
+
+    async def get(self, namespace: str) -> str:
+        cached = self.values.get(namespace)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        value = await redis.get(self.get_key(namespace))
+        generation = value.decode() if value else '0'
+        self.values[namespace] = (time.monotonic() + self.ttl, generation)
+        return generation
+
+    async def advance(self, namespace: str, stream_id: str) -> str:
+        value = await redis.eval(ADVANCE_GENERATION_SCRIPT, keys=[self.get_key(namespace)], args=[stream_id])
+        generation = value.decode()
+        self.values[namespace] = (time.monotonic() + self.ttl, generation)
+        return generation
+
+
+generations = Generations(ttl=settings.CACHE_GENERATION_TTL_IN_SECONDS)
 
 
 class RedisCreator(AbstractKeyCreator):
+    """Ключи вида {namespace}:v{версия схемы}:g{поколение}:{ключ в пространстве имён}"""
 
-    async def get_key_from_id(self, pk: UUID) -> str:
-        return str(pk)
+    async def get_prefix(self, namespace: str) -> str:
+        return f"{namespace}:v{settings.CACHE_SCHEMA_VERSION}:g{await generations.get(namespace)}"
+
+    async def get_key_from_id(self, name_model: str, pk: UUID) -> str:
+        return f"{await self.get_prefix(name_model)}:{pk}"
+
+    async def get_key_from_list(self, name_model: str) -> str:
+        return f"{await self.get_prefix(f'{name_model}-list')}:all"
 
     async def get_key_from_search(self, name_model: str, query: str, list_parameters: dict) -> str:
-        return f"{name_model}-search-{query}-{list_parameters['sort']}-{list_parameters['page_size']}-{list_parameters['page_number']}"
+        prefix = await self.get_prefix(f"{name_model}-search")
+        return f"{prefix}:{query}-{list_parameters['sort']}-{list_parameters['page_size']}-{list_parameters['page_number']}"
 
     async def get_key_from_films_list(self, name_model: str, pk: UUID) -> str:
-        return f"{name_model}-films-{pk}"
+        return f"{await self.get_prefix(f'{name_model}-films')}:{pk}"
+
+    async def get_key_from_window(
+            self, name_model: str, query: str, sort: Optional[str], window_size: int, window_number: int
+    ) -> str:
+        prefix = await self.get_prefix(f"{name_model}-window")
+        return f"{prefix}:{query}-{sort}-{window_size}-{window_number}"
+
+    async def get_key_from_response(self, name_model: str, path: str, params: dict) -> str:
+        prefix = await self.get_prefix(f"{name_model}-response")
+        return f"{prefix}:{path}-{urlencode(sorted(params.items()))}"
+
+    async def get_key_from_missing(self, key: str) -> str:
+        return f"missing:{key}"
+
+    async def bump_generation(self, namespace: str, stream_id: str):
+        await generations.advance(namespace, stream_id)
 
 
 class RedisStorage(AbstractCache):
     def __init__(self):
         self.redis = redis
 
+    @staticmethod
+    def parse(data: bytes, model, as_list: bool = False) -> Union[models.BaseModel, list[models.BaseModel]]:
+        parsed = serializer.loads(data)
+        if as_list:
+            return [model(**d) for d in parsed]
+        return model(**parsed)
+
+    @staticmethod
+    def dump(data: Union[models.BaseModel, list[models.BaseModel]]) -> bytes:
+        if isinstance(data, list):
+            return serializer.dumps([item.dict() for item in data])
+        return serializer.dumps(data.dict())
+
+    @staticmethod
+    def count(key: str, result: str):
+        # Пространство имён - первая часть ключа до двоеточия
+        CACHE_REQUESTS.labels(key.split(':', 1)[0], result).inc()
+
+    @asynccontextmanager
+    async def reading(self, keys: list[str]):
+        # Чтение под переборкой Redis, ошибки считаются в метриках по пространствам имён ключей
+        try:
+            async with redis_bulkhead:
+                yield
+        except Exception:
+            for key in keys:
+                self.count(key, 'error')
+            raise
+
     async def get_data(self, key: str, model, as_list: bool = False) -> Optional[models.BaseModel]:
-        data = await self.redis.get(key)
+        async with self.reading([key]):
+            data = await self.redis.get(key)
+        self.count(key, 'hit' if data else 'miss')
         if not data:
             return None
+        return self.parse(data, model, as_list)
 
-        if as_list:
-            parsed = json.loads(data)
-            res = [model(**d) for d in parsed]
-        else:
-            res = model.parse_raw(data)
+    async def put_data(
+            self, key: str, data: Union[models.BaseModel, list[models.BaseModel]], as_list: bool = False,
+            expire: int = 300, stale_ttl: int = 0
+    ):
+        async with redis_bulkhead:
+            await self.redis.set(key, self.dump(data), expire=expire + stale_ttl)
+
+    async def get_entry(
+            self, key: str, model, as_list: bool = False, stale_ttl: int = 0, grace_ttl: int = 0, degraded: bool = False
+    ) -> tuple[Optional[Any], bool]:
+        # Запись хранится expire + stale_ttl + grace_ttl секунд, поэтому устаревшей она становится,
+        # когда до удаления остаётся меньше stale_ttl + grace_ttl. Записи без TTL устаревшими не считаются
+        pipe = self.redis.pipeline()
+        pipe.get(key)
+        pipe.pttl(key)
+        async with self.reading([key]):
+            data, pttl = await pipe.execute()
+        if not data:
+            self.count(key, 'miss')
+            return None, False
+        if 0 <= pttl < grace_ttl * 1000:
+            if not degraded:
+                self.count(key, 'miss')
+                return None, False
+            self.count(key, 'grace')
+            return self.parse(data, model, as_list), True
+        stale = 0 <= pttl < (stale_ttl + grace_ttl) * 1000
+        self.count(key, 'stale' if stale else 'hit')
+        return self.parse(data, model, as_list), stale
 
-        return res
+    async def get_many(self, keys: list[str], model, as_list: bool = False) -> list[Optional[models.BaseModel]]:
+        if not keys:
+            return []
+        async with self.reading(keys):
+            values = await self.redis.mget(*keys)
+        for key, data in zip(keys, values):
+            self.count(key, 'hit' if data else 'miss')
+        return [self.parse(data, model, as_list) if data else None for data in values]
 
-    async def put_data(
-            self, key: str, data: Union[models.BaseModel, list[models.BaseModel]], as_list: bool = False, expire: int = 300
+    async def put_many(
+            self, items: dict[str, Union[models.BaseModel, list[models.BaseModel]]], expire: int = 300, stale_ttl: int = 0
     ):
-        if as_list:
-            jsoned = json.dumps(data, default=pydantic_encoder)
-        else:
-            jsoned = data.json()
-        await self.redis.set(key, jsoned, expire=expire)
+        if not items:
+            return
+        pipe = self.redis.pipeline()
+        for key, data in items.items():
+            pipe.set(key, self.dump(data), expire=expire + stale_ttl)
+        async with redis_bulkhead:
+            await pipe.execute()
+
+    async def delete(self, keys: list[str]):
+        if keys:
+            async with redis_bulkhead:
+                await self.redis.delete(*keys)
+
+    async def get_raw(self, key: str) -> Optional[bytes]:
+        async with self.reading([key]):
+            data = await self.redis.get(key)
+        self.count(key, 'hit' if data else 'miss')
+        return data
+
+    async def put_raw(self, key: str, data: bytes, expire: int = 300):
+        async with redis_bulkhead:
+            await self.redis.set(key, data, expire=expire)
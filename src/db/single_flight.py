@@ -0,0 +1,107 @@
+import asyncio
+import uuid
+from collections import Counter
+from typing import Any, Awaitable, Callable
+
+from aioredis import Redis
+
+from core.config import settings
+from core.metrics import SINGLE_FLIGHT
+from db import redis as redis_db
+
+# Снимаем блокировку, только если она всё ещё принадлежит нам
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# read_cache возвращает NOT_FOUND, если лидер уже отметил в кеше, что объекта в хранилище нет
+NOT_FOUND = object()
+
+
+class SingleFlight:
+    """
+    Схлопывает одновременные промахи кеша по одному ключу в один запрос к хранилищу.
+    Внутри процесса ожидающие подписываются на результат запроса-лидера,
+    между воркерами лидер определяется короткой блокировкой (lease) в Redis:
+    остальные воркеры ждут, пока лидер положит результат в кеш.
+    """
+
+    def __init__(self, lock_timeout: float, poll_interval: float):
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.in_flight: dict[str, asyncio.Future] = {}
+        # leader - запросы, реально ушедшие в хранилище,
+        # collapsed_local/collapsed_remote - схлопнутые внутри процесса/между воркерами,
+        # fallback - ожидание лидера из другого воркера не дождалось результата
+        self.stats = Counter()
+
+    def count(self, result: str):
+        self.stats[result] += 1
+        SINGLE_FLIGHT.labels(result).inc()
+
+    async def do(
+            self, key: str, fetch: Callable[[], Awaitable[Any]], read_cache: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.count('collapsed_local')
+            return await asyncio.shield(future)
+
+        future = asyncio.get_event_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            result = await self._do_across_workers(key, fetch, read_cache)
+        except Exception as exc:
+            future.set_exception(exc)
+            # Помечаем исключение полученным, даже если ожидающих не было
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self.in_flight[key]
+
+    async def _do_across_workers(
+            self, key: str, fetch: Callable[[], Awaitable[Any]], read_cache: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        redis: Redis = redis_db.redis
+        lock_key = f'lock:{key}'
+        token = uuid.uuid4().hex
+        acquired = await redis.set(
+            lock_key, token, pexpire=int(self.lock_timeout * 1000), exist=Redis.SET_IF_NOT_EXIST
+        )
+        if acquired:
+            self.count('leader')
+            try:
+                return await fetch()
+            finally:
+                await redis.eval(RELEASE_LOCK_SCRIPT, keys=[lock_key], args=[token])
+
+        # Запрос уже выполняет другой воркер: ждём его результат в кеше,
+        # пока не истечёт или не будет снята его блокировка
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self.lock_timeout
+        while loop.time() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            result = await read_cache()
+            if result is NOT_FOUND:
+                self.count('collapsed_remote')
+                return None
+            if result:
+                self.count('collapsed_remote')
+                return result
+            if not await redis.exists(lock_key):
+                break
+
+        self.count('fallback')
+        return await fetch()
+
+
+single_flight = SingleFlight(
+    lock_timeout=settings.SINGLE_FLIGHT_LOCK_TIMEOUT_IN_SECONDS,
+    poll_interval=settings.SINGLE_FLIGHT_POLL_INTERVAL_IN_SECONDS,
+)
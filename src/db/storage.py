@@ -1,31 +1,55 @@
 from abc import ABC, abstractmethod
-from typing import Optional, Union
+from typing import Any, Optional, Union
 from uuid import UUID
 
 from api.v1 import models
 
 
+class InvalidCursor(ValueError):
+    """Курсор страницы выдачи не удалось разобрать"""
+
+
 class AbstractStorage(ABC):
     @abstractmethod
     def get_data_by_id(self, index: str, id: UUID, model):
         pass
 
+    @abstractmethod
+    async def get_data_by_ids(self, index: str, ids: list[UUID], model):
+        pass
+
     @abstractmethod
     def get_data_list_by_id(self, index: str, id: UUID, model, parameters: dict = None):
         pass
 
+    @abstractmethod
+    async def get_data_list_by_cursor(self, index: str, id: UUID, model, parameters: dict):
+        pass
+
     @abstractmethod
     def get_data_by_query(self, index: str, query: str, model, parameters: dict = None):
         pass
 
+    @abstractmethod
+    async def get_data_by_query_cursor(self, index: str, query: str, model, parameters: dict):
+        pass
+
     @abstractmethod
     async def get_person_films_from_elastic(self, index: str, person_id: UUID, model):
         pass
 
+    @abstractmethod
+    async def get_persons_films_from_elastic(self, index: str, person_ids: list[UUID], model):
+        pass
+
     @abstractmethod
     async def get_person_search_from_elastic(self, index: str, query: str, model, parameters: dict = None):
         pass
 
+    @abstractmethod
+    async def get_person_search_by_cursor(self, index: str, query: str, model, parameters: dict):
+        pass
+
     @abstractmethod
     async def get_all_from_elastic(self, index: str, model):
         pass
@@ -37,13 +61,69 @@ class AbstractCache(ABC):
         pass
 
     @abstractmethod
-    def put_data(self, key: str, data: Union[models.BaseModel, list[models.BaseModel]], as_list: bool = False, expire: int = 300):
+    def put_data(
+            self, key: str, data: Union[models.BaseModel, list[models.BaseModel]], as_list: bool = False,
+            expire: int = 300, stale_ttl: int = 0
+    ):
+        """
+        expire - мягкий TTL, после которого запись считается устаревшей,
+        stale_ttl - сколько ещё после этого запись хранится (жёсткий TTL = expire + stale_ttl)
+        """
         pass
 
+    @abstractmethod
+    async def get_entry(
+            self, key: str, model, as_list: bool = False, stale_ttl: int = 0, grace_ttl: int = 0, degraded: bool = False
+    ) -> tuple[Optional[Any], bool]:
+        """
+        Возвращает данные и признак того, что мягкий TTL записи уже истёк.
+        Запись хранится expire + stale_ttl + grace_ttl секунд; в последние grace_ttl секунд
+        она отдаётся, только если degraded (хранилище недоступно), иначе считается отсутствующей.
+        """
+        pass
+
+    @abstractmethod
+    async def get_many(self, keys: list[str], model, as_list: bool = False):
+        pass
+
+    @abstractmethod
+    async def put_many(
+            self, items: dict[str, Union[models.BaseModel, list[models.BaseModel]]], expire: int = 300, stale_ttl: int = 0
+    ):
+        pass
+
+    @abstractmethod
+    async def delete(self, keys: list[str]):
+        pass
+
+    @abstractmethod
+    async def get_raw(self, key: str) -> Optional[bytes]:
+        pass
+
+    @abstractmethod
+    async def put_raw(self, key: str, data: bytes, expire: int = 300):
+        pass
+
+    async def is_missing(self, key: str) -> bool:
+        """Есть ли отметка key о том, что в хранилище ничего не нашлось"""
+        return bool(await self.get_raw(key))
+
+    async def mark_missing(self, key: str, expire: int):
+        await self.put_raw(key, b'1', expire=expire)
+
 
 class AbstractKeyCreator(ABC):
+    """
+    Ключи записей разложены по пространствам имён (namespace), у каждого есть поколение.
+    Увеличение поколения разом делает недоступными все записи пространства имён.
+    """
+
+    @abstractmethod
+    def get_key_from_id(self, name_model: str, pk: UUID):
+        pass
+
     @abstractmethod
-    def get_key_from_id(self, pk: UUID):
+    async def get_key_from_list(self, name_model: str) -> str:
         pass
 
     @abstractmethod
@@ -53,3 +133,26 @@ class AbstractKeyCreator(ABC):
     @abstractmethod
     async def get_key_from_films_list(self, name_model: str, pk: UUID) -> str:
         pass
+
+    @abstractmethod
+    async def get_key_from_window(
+            self, name_model: str, query: str, sort: Optional[str], window_size: int, window_number: int
+    ) -> str:
+        pass
+
+    @abstractmethod
+    async def get_key_from_response(self, name_model: str, path: str, params: dict) -> str:
+        pass
+
+    @abstractmethod
+    async def get_key_from_missing(self, key: str) -> str:
+        """Ключ отметки о том, что для записи key в хранилище ничего не нашлось"""
+        pass
+
+    @abstractmethod
+    async def bump_generation(self, namespace: str, stream_id: str):
+        """
+        Сбрасывает пространство имён, переставляя его поколение на айди события stream_id.
+        Повторный вызов с тем же или более старым событием ничего не меняет
+        """
+        pass
@@ -16,6 +16,7 @@ def backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10, max_tries=20):
     :param factor: во сколько раз нужно увеличить время ожидания
     :param border_sleep_time: граничное время ожидания
     :return: результат выполнения функции
+    :raises: последнюю ошибку, если все max_tries попыток неудачны
     """
 
     def func_wrapper(func):
@@ -28,6 +29,9 @@ def backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10, max_tries=20):
                 try:
                     return func(*args, **kwargs)
                 except:
+                    # Вызывающий код должен узнать о неудаче, а не получить None как результат
+                    if n >= max_tries:
+                        raise
                     logging.exception(
                         f"Function {func.__name__}, try {n} of {max_tries}, retrying in {t} seconds..."
                     )
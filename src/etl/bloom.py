@@ -0,0 +1,82 @@
+import hashlib
+import logging
+import math
+import struct
+import uuid
+from typing import Iterable
+
+from config import BloomSettings
+from postgres_connection import PostgresConnection
+from publisher import Publisher
+
+# Заголовок сериализованного фильтра: число бит и число хеш-функций.
+# Формат и хеширование должны совпадать с src/db/bloom.py в API
+HEADER = struct.Struct('!QB')
+
+
+class BloomFilter:
+    def __init__(self, size: int, hash_count: int, bits: bytearray = None):
+        self.size = size
+        self.hash_count = hash_count
+        self.bits = bits if bits is not None else bytearray((size + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float) -> 'BloomFilter':
+        """Фильтр с оптимальными размером и числом хеш-функций для capacity элементов"""
+        size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        hash_count = max(1, round(size / capacity * math.log(2)))
+        return cls(size, hash_count)
+
+    def positions(self, pk: str) -> Iterable[int]:
+        # Двойное хеширование: k позиций из двух 64-битных половин одного хеша
+        digest = hashlib.blake2b(uuid.UUID(str(pk)).bytes, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, pk: str):
+        for position in self.positions(pk):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, pk: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(pk))
+
+    def to_bytes(self) -> bytes:
+        return HEADER.pack(self.size, self.hash_count) + bytes(self.bits)
+
+
+def measure_false_positive_rate(bloom: BloomFilter, samples: int) -> float:
+    """Доля случайных uuid4, которые фильтр ошибочно считает существующими"""
+    false_positives = sum(str(uuid.uuid4()) in bloom for _ in range(samples))
+    return false_positives / samples
+
+
+class BloomBuilder:
+    """
+    Строит фильтры Блума по всем айди каждого индекса и сохраняет их в Redis.
+    API по фильтру отвечает 404 на заведомо несуществующие айди, не обращаясь к кешу и ES.
+    """
+
+    def __init__(self, settings: BloomSettings, db: PostgresConnection, publisher: Publisher):
+        self.settings = settings
+        self.db = db
+        self.publisher = publisher
+
+    def build(self):
+        for filter_settings in self.settings.filters:
+            # Айди, загруженные после этой точки потока, API дочитает из потока сам
+            stream_id = self.publisher.last_stream_id()
+            ids = [row[0] for row in self.db.fetch(filter_settings.sql, ())]
+            capacity = max(self.settings.min_capacity, math.ceil(len(ids) * self.settings.capacity_factor))
+            bloom = BloomFilter.for_capacity(capacity, self.settings.error_rate)
+            for pk in ids:
+                bloom.add(pk)
+
+            false_positive_rate = measure_false_positive_rate(bloom, self.settings.fpr_samples)
+            data = bloom.to_bytes()
+            self.publisher.save_bloom(filter_settings.index, data, stream_id)
+            logging.info(
+                f"Bloom filter for {filter_settings.index}: {len(ids)} ids, {len(data)} bytes, "
+                f"{bloom.hash_count} hashes, measured false positive rate {false_positive_rate:.5f} "
+                f"(target {self.settings.error_rate})"
+            )
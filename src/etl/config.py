@@ -11,11 +11,40 @@ class DSNSettings(BaseModel):
     password: Optional[str] = None
 
 
+class PoolSettings(BaseModel):
+    enabled: bool
+    min_size: int
+    max_size: int
+    prepare: bool
+
+
 class ESSettings(BaseModel):
     host: str
     limit: int
 
 
+class RedisSettings(BaseModel):
+    host: str
+    port: int
+    stream: str
+    maxlen: int
+    publish_batch_size: int
+
+
+class BloomFilterSettings(BaseModel):
+    index: str
+    sql: str
+
+
+class BloomSettings(BaseModel):
+    error_rate: float
+    capacity_factor: float
+    min_capacity: int
+    rebuild_interval: int
+    fpr_samples: int
+    filters: list[BloomFilterSettings]
+
+
 class ProducerSettings(BaseModel):
     name: str
     state_file_path: str
@@ -34,21 +63,37 @@ class MergerSettings(BaseModel):
     name: str
     use: list[str]
     sql: str
+    chunk_size: int
+    ids_as_array: bool
+    stream: bool
+    itersize: int
 
 
 class LoaderSettings(BaseModel):
     name: str
     use: str
+    transformer: str
     index: str
 
 
+class PipelineSettings(BaseModel):
+    enabled: bool
+    chunk_workers: int
+    loader_workers: int
+    queue_size: int
+
+
 class Config(BaseModel):
     dsn: DSNSettings
+    pool: PoolSettings
     es: ESSettings
+    redis: RedisSettings
+    bloom: BloomSettings
     producers: list[ProducerSettings]
     enrichers: list[EnricherSettings]
     mergers: list[MergerSettings]
     loaders: list[LoaderSettings]
+    pipeline: PipelineSettings
 
 
 config = Config.parse_file('config.json')
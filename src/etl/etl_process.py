@@ -2,18 +2,22 @@ import itertools
 import logging
 import os
 from collections import defaultdict
-from time import sleep
+from threading import Lock
+from time import monotonic, perf_counter, sleep
 from typing import Any, Generator, Iterable
 
 from dotenv import load_dotenv
 
+from bloom import BloomBuilder
 from config import Config
 from enricher import Enricher
 from loader import Loader
 from merger import Merger
+from pipeline import Checkpoint, Checkpoints, Pipeline, Stage
 from postgres_connection import PostgresConnection
 from producer import Producer
-from transform import transform_film_work, transform_genre, transform_person
+from publisher import Publisher
+from transform import transform_film_work, transform_film_work_aggregated, transform_genre, transform_person
 
 
 def grouper_it(iterable: Iterable, n: int) -> Generator[Any, None, None]:
@@ -35,8 +39,14 @@ class ETLProcess:
         self.init()
 
     def init(self):
-        self.db = PostgresConnection(self.config.dsn)
-        self.loader = Loader(host=self.config.es.host)
+        self.db = PostgresConnection(self.config.dsn, self.config.pool)
+        self.loader = Loader(host=self.config.es.host, maxsize=max(self.config.pipeline.loader_workers, 10))
+        self.publisher = Publisher(self.config.redis)
+        self.bloom_builder = BloomBuilder(self.config.bloom, db=self.db, publisher=self.publisher)
+        self.bloom_built_at = None
+        # Айди объектов, загруженных в ES за цикл, по индексам
+        self.loaded: dict[str, dict[str, None]] = defaultdict(dict)
+        self.loaded_lock = Lock()
 
         # Словари продьюсеров, энричеров и мёрджеров, описанных в конфиге
         self.producers = {
@@ -51,6 +61,12 @@ class ETLProcess:
             sttngs.name: Merger(settings=sttngs, db=self.db)
             for sttngs in self.config.mergers
         }
+        # Лоудеры каждого мёрджера. Мёрджер, на который не ссылается ни один лоудер
+        # (например, запасной вариант SQL), не выполняется
+        self.merger_loaders = {
+            name: [sttngs for sttngs in self.config.loaders if sttngs.use == name]
+            for name in self.mergers
+        }
 
         # Энричеры используют айди, сгенерированные продьюсерами, для
         # получения айди фильмов, которые нуждаются в обновлении.
@@ -71,60 +87,172 @@ class ETLProcess:
 
     def run(self):
         """Основной цикл ETL"""
-        produced = {}
-        enriched = defaultdict(set)
+        started = perf_counter()
+        # Работа прерванного цикла, в том числе стоявшая в очередях конвейера,
+        # повторяется с последних сохранённых позиций продьюсеров
+        for producer in self.producers.values():
+            producer.load_state()
+        try:
+            if self.config.pipeline.enabled:
+                # Этапы конвейера идут одновременно, поэтому пишется только время всего цикла
+                timings = {}
+                self.run_pipelined()
+            else:
+                timings = self.run_sequential()
+        finally:
+            # Загруженное до падения уже в ES, поэтому публикуется и после ошибки,
+            # даже если позиция его чанка не сохранилась
+            self.publish_loaded()
 
-        # Метод produce каждого продьюсера возвращает чанки айди,
-        # которые сохраняются для каждого продьюсера и направляются в
-        # описанные энричеры.
-        for name, producer in self.producers.items():
-            ids = []
-            for chunk in producer.produce():
-                ids.extend(chunk)
-                for enricher_name in self.producer2enricher.get(name, []):
-                    enriched_res = self.enrichers[enricher_name].enrich(chunk)
-                    enriched[enricher_name] |= set(enriched_res)
-            if ids:
-                produced[name] = ids
-                total = len(ids)
-                logging.debug(f"{name} produced {total} ids")
-
-        # Для каждого мёрджера объединяются айди, поступающие из продьюсеров и
-        # энричеров, (без дублирования) и метод merge возвращает сырые данные
-        # из БД.
-        raw_data = {}
+        # Фильтры Блума всех айди перестраиваются не чаще раза в rebuild_interval секунд
+        if self.bloom_built_at is None or monotonic() - self.bloom_built_at >= self.config.bloom.rebuild_interval:
+            self.bloom_builder.build()
+            self.bloom_built_at = monotonic()
+
+        timings["cycle"] = perf_counter() - started
+        logging.info("ETL cycle timings: " + ", ".join(f"{stage} {value:.3f}s" for stage, value in timings.items()))
+
+    def process_chunk(self, producer_name: str, ids: list[str]) -> Generator[tuple[str, list], None, None]:
+        """
+        Всё, что зависит от одного чанка продьюсера. Айди чанка направляются в
+        энричеры продьюсера, затем каждый мёрджер получает айди чанка и энричеров,
+        которые он использует (без дублирования). Возвращает пары (индекс, чанк
+        документов) для загрузки в ES.
+        """
+        enriched = {
+            enricher_name: set(self.enrichers[enricher_name].enrich(ids))
+            for enricher_name in self.producer2enricher.get(producer_name, [])
+        }
         for name, merger in self.mergers.items():
-            uses = merger.settings.use
-            ids = set()
-            for use in uses:
-                if use.endswith("_producer"):
-                    ids |= set(produced.get(use, set()))
-                elif use.endswith("_enricher"):
-                    ids |= enriched.get(use, set())
-
-            if not ids:
-                continue
-
-            res = merger.merge(ids)
-            total = len(res)
-            raw_data[name] = res
-            logging.debug(f"{name} merged {total} items")
-
-        # Лоудеры загружают полученные данные в ES. Если на предыдущем шаге для
-        # лоудера получены сырые данные, они поступают в трансформер для данного
-        # лоудера, а затем чанками - в метод load, загружающий данные в ES.
-        for loader_settings in self.config.loaders:
-            if loader_settings.use not in raw_data:
-                continue
-
-            transformed_data = self.transformers[loader_settings.name](raw_data[loader_settings.use])
-
-            for raw_chunk in grouper_it(transformed_data, self.config.es.limit):
-                self.loader.load(list(raw_chunk), index=loader_settings.index)
+            merger_ids = set()
+            for use in merger.settings.use:
+                if use == producer_name:
+                    merger_ids |= set(ids)
+                elif use in enriched:
+                    merger_ids |= enriched[use]
+            if merger_ids and self.merger_loaders[name]:
+                yield from self.merge(name, merger_ids)
 
-        for producer in self.producers.values():
-            producer.save_state()
+    def merge(self, name: str, ids: set) -> Generator[tuple[str, list], None, None]:
+        """
+        Айди мёрджера обрабатываются чанками: данные каждого чанка читаются из БД,
+        проходят через трансформеры использующих мёрджер лоудеров и разбиваются
+        на чанки для bulk-запросов. Возвращает пары (индекс, чанк документов)
+        по мере чтения, так что загрузка начинается до того, как прочитан последний чанк.
+        """
+        merger = self.mergers[name]
+        for ids_chunk in merger.chunks(ids):
+            res = None
+            for loader_settings in self.merger_loaders[name]:
+                # Потоковый мёрджер возвращает генератор: строки читаются из БД
+                # только при загрузке, пачками, поэтому здесь их число неизвестно.
+                # Генератор одноразовый, поэтому каждый лоудер мёрджера читает
+                # строки заново, а не держит в памяти весь чанк.
+                if not isinstance(res, list):
+                    res = merger.merge(ids_chunk)
+                    if isinstance(res, list):
+                        logging.debug(f"{name} merged {len(res)} items of {len(ids_chunk)} ids")
+                    else:
+                        logging.debug(f"{name} streams items of {len(ids_chunk)} ids")
+
+                transformed_data = self.transformers[loader_settings.transformer](res)
+                for raw_chunk in grouper_it(transformed_data, self.config.es.limit):
+                    yield loader_settings.index, list(raw_chunk)
+
+    def load(self, index: str, chunk: list):
+        self.loader.load(chunk, index=index)
+        with self.loaded_lock:
+            self.loaded[index].update(dict.fromkeys(item.uuid for item in chunk))
+            full = len(self.loaded[index]) >= self.config.redis.publish_batch_size
+        if full:
+            self.publish_loaded()
 
+    def publish_loaded(self):
+        """
+        Публикует айди загруженных в ES объектов, чтобы API сбросил их кеш. Вызывается перед
+        сохранением позиции продьюсера и когда айди индекса набралось publish_batch_size.
+        В событии не больше publish_batch_size айди, поэтому ни память ETL, ни размер
+        события не растут с объёмом цикла (например, при полной перезаливке).
+        """
+        with self.loaded_lock:
+            loaded, self.loaded = self.loaded, defaultdict(dict)
+        batch_size = self.config.redis.publish_batch_size
+        for index, ids in loaded.items():
+            ids = list(ids)
+            for i in range(0, len(ids), batch_size):
+                self.publisher.publish(index, ids[i:i + batch_size])
+
+    def save_state(self, producer: Producer, position: Any):
+        """
+        Сохраняет позицию продьюсера. Сначала публикуется всё загруженное, в том числе
+        чанки до этой позиции: после падения между сохранением позиции и публикацией
+        их айди не попали бы в поток, и кеш API оставался бы устаревшим до истечения TTL.
+        """
+        self.publish_loaded()
+        producer.save_state(position)
+
+    def run_sequential(self) -> dict[str, float]:
+        """
+        Чанки продьюсеров обрабатываются по очереди. Позиция продьюсера сохраняется
+        после того, как все документы чанка загружены в ES: после падения повторяется
+        только незавершённый чанк. Возвращает время работы каждого продьюсера в секундах.
+        """
+        timings = {}
+        for name, producer in self.producers.items():
+            started = perf_counter()
+            total = 0
+            for ids in producer.produce():
+                total += len(ids)
+                position = producer.position
+                for index, chunk in self.process_chunk(name, ids):
+                    self.load(index, chunk)
+                self.save_state(producer, position)
+            logging.debug(f"{name} produced {total} ids")
+            timings[name] = perf_counter() - started
+        return timings
+
+    def run_pipelined(self):
+        """
+        Чанки обрабатываются одновременно в потоках. Каждый продьюсер работает в своём
+        потоке и отправляет чанки айди в ограниченную очередь, из которой chunk_workers
+        потоков прогоняют их через энричеры, мёрджеры и трансформеры. Чанки документов
+        идут в ограниченную очередь лоудеров, которые держат в ES одновременно до
+        loader_workers bulk-запросов. Позиция продьюсера сохраняется, когда загружены
+        все документы чанка и всех предыдущих чанков этого продьюсера.
+        При ошибке любого потока конвейер останавливается, а ошибка пробрасывается.
+        """
+        settings = self.config.pipeline
+        pipeline = Pipeline()
+
+        def process(task: tuple[str, list, Checkpoint]):
+            name, ids, checkpoint = task
+            for index, chunk in self.process_chunk(name, ids):
+                checkpoint.add()
+                load_stage.put((index, chunk, checkpoint))
+            # Если чанк упал на середине, он не закрывается, и его позиция не сохранится
+            checkpoint.close()
+
+        def load(task: tuple[str, list, Checkpoint]):
+            index, chunk, checkpoint = task
+            self.load(index, chunk)
+            checkpoint.done()
+
+        def produce(name: str, producer: Producer):
+            checkpoints = Checkpoints(lambda position: self.save_state(producer, position))
+            for ids in producer.produce():
+                chunk_stage.put((name, ids, checkpoints.open(producer.position)))
+
+        chunk_stage = Stage(pipeline, "chunk", settings.chunk_workers, settings.queue_size, process)
+        load_stage = Stage(pipeline, "loader", settings.loader_workers, settings.queue_size, load)
+        chunk_stage.start()
+        load_stage.start()
+
+        producer_threads = [pipeline.spawn(name, produce, name, producer) for name, producer in self.producers.items()]
+        for thread in producer_threads:
+            thread.join()
+        chunk_stage.join()
+        load_stage.join()
+        pipeline.raise_error()
 
 if __name__ == "__main__":
     load_dotenv()
@@ -133,15 +261,28 @@ if __name__ == "__main__":
     config.dsn.password = os.environ.get("DB_PASSWORD")
     config.dsn.host = os.environ.get('DB_HOST') or "127.0.0.1"
     config.es.host = os.environ.get('ELASTIC_HOST') or "127.0.0.1:9200"
+    config.redis.host = os.environ.get('REDIS_HOST') or "127.0.0.1"
 
+    # Трансформеры по именам, на которые ссылаются лоудеры в конфиге. film_work
+    # работает с декартовым произведением фильмов, персон и жанров (мёрджер
+    # film_work_merger_cartesian), а film_work_aggregated - с одной строкой на фильм,
+    # собранной в SQL json_agg (film_work_merger). Чтобы вернуться к декартову
+    # произведению, film_work_loader переключается на эту пару в config.json.
     transformers = {
-        "film_work_loader": transform_film_work,
-        "person_loader": transform_person,
-        "genre_loader": transform_genre,
+        "film_work": transform_film_work,
+        "film_work_aggregated": transform_film_work_aggregated,
+        "person": transform_person,
+        "genre": transform_genre,
     }
 
     process = ETLProcess(config, transformers)
     refresh_mins = int(os.environ.get("refresh", 5))
     while True:
-        process.run()
+        try:
+            process.run()
+        except Exception:
+            # Позиции продьюсеров сохраняются только после загрузки чанков, а каждый
+            # цикл начинается с сохранённых позиций, поэтому следующий цикл продолжит
+            # с первого незагруженного чанка
+            logging.exception("ETL cycle failed")
         sleep(refresh_mins * 60)
@@ -7,10 +7,15 @@ from create_es_schema.create_index import IndexCreator
 from es_item import ITEM_TYPES
 
 
+class BulkLoadError(Exception):
+    """ES не проиндексировал часть документов bulk-запроса"""
+
+
 class Loader:
     """Загружает чанками данные в ES"""
-    def __init__(self, host: str):
-        self.connection = Elasticsearch([host])
+    def __init__(self, host: str, maxsize: int = 10):
+        # maxsize - число соединений с ES, не меньше числа параллельных bulk-запросов
+        self.connection = Elasticsearch([host], maxsize=maxsize)
         self.create_index = IndexCreator(self.connection)
         self.es = self.es_init()
 
@@ -30,3 +35,11 @@ class Loader:
     def load(self, data: list[ITEM_TYPES], index: str):
         body = self.make_body(data, index)
         res = self.es.bulk(body=body)
+        # bulk отвечает 200 и при отказе отдельных документов: такой чанк не считается
+        # загруженным, чтобы позиция продьюсера не сдвинулась за него
+        if res["errors"]:
+            failed = [item["index"] for item in res["items"] if item["index"].get("error")]
+            raise BulkLoadError(
+                f"{len(failed)} of {len(data)} documents were not indexed into {index}, "
+                f"first error: {failed[0]['_id']}: {failed[0]['error']}"
+            )
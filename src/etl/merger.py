@@ -1,3 +1,7 @@
+from typing import Iterable, Iterator, Union
+
+from psycopg2.extras import DictRow
+
 from config import MergerSettings
 from postgres_connection import PostgresConnection
 
@@ -7,6 +11,20 @@ class Merger:
         self.settings = settings
         self.db = db
 
-    def merge(self, ids: list[str]) -> list:
-        data = self.db.fetch(self.settings.sql, (tuple(ids),))
+    def chunks(self, ids: Iterable[str]) -> Iterator[list[str]]:
+        """Айди, разбитые на чанки по chunk_size, чтобы каждый запрос мёрджера оставался небольшим"""
+        ids = sorted(ids)
+        for i in range(0, len(ids), self.settings.chunk_size):
+            yield ids[i:i + self.settings.chunk_size]
+
+    def merge(self, ids: list[str]) -> Union[list[DictRow], Iterator[DictRow]]:
+        """
+        Сырые данные объектов с айди ids. В потоковом режиме возвращается генератор строк,
+        читающий их серверным курсором по мере потребления, иначе - список всех строк.
+        Айди передаются массивом для = ANY(%s::uuid[]) или кортежем для IN %s.
+        """
+        args = (list(ids),) if self.settings.ids_as_array else (tuple(ids),)
+        if self.settings.stream:
+            return self.db.stream(self.settings.sql, args, self.settings.itersize)
+        data = self.db.fetch(self.settings.sql, args)
         return data
@@ -0,0 +1,156 @@
+import logging
+from collections import deque
+from queue import Full, Queue
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Optional
+
+# Маркер конца очереди для воркеров этапа
+STOP = object()
+
+
+class PipelineAborted(Exception):
+    """Один из потоков конвейера упал, остальные прекращают работу"""
+
+
+class Pipeline:
+    """
+    Общее состояние конвейерного цикла ETL: ошибки потоков и флаг аварийной остановки.
+    Первая ошибка любого потока останавливает весь конвейер и пробрасывается из raise_error.
+    """
+
+    def __init__(self):
+        self.failed = Event()
+        self.errors: list[Exception] = []
+        self.lock = Lock()
+
+    def fail(self, error: Exception):
+        with self.lock:
+            self.errors.append(error)
+        self.failed.set()
+
+    def spawn(self, name: str, target: Callable, *args) -> Thread:
+        """Запускает target в отдельном потоке, ошибка потока останавливает конвейер"""
+        def run():
+            try:
+                target(*args)
+            except PipelineAborted:
+                pass
+            except Exception as e:
+                logging.exception(f"ETL pipeline thread {name} failed")
+                self.fail(e)
+
+        thread = Thread(target=run, name=name, daemon=True)
+        thread.start()
+        return thread
+
+    def raise_error(self):
+        if self.errors:
+            raise self.errors[0]
+
+
+class Stage:
+    """
+    Этап конвейера: workers потоков разбирают ограниченную очередь и передают задачи в handler.
+    Когда очередь заполнена, put блокирует поставщика, так что этапы-поставщики не убегают
+    вперёд медленного этапа и не копят задачи в памяти.
+    """
+
+    def __init__(self, pipeline: Pipeline, name: str, workers: int, queue_size: int, handler: Callable[[Any], None]):
+        self.pipeline = pipeline
+        self.name = name
+        self.workers = workers
+        self.handler = handler
+        self.queue: Queue = Queue(maxsize=queue_size)
+        self.threads: list[Thread] = []
+
+    def start(self):
+        self.threads = [self.pipeline.spawn(f"{self.name}-{i}", self.work) for i in range(self.workers)]
+
+    def work(self):
+        while True:
+            item = self.queue.get()
+            if item is STOP:
+                return
+            # После аварии очередь только разбирается, чтобы не заблокировать поставщиков
+            if self.pipeline.failed.is_set():
+                continue
+            try:
+                self.handler(item)
+            except PipelineAborted:
+                pass
+            except Exception as e:
+                logging.exception(f"ETL stage {self.name} failed")
+                self.pipeline.fail(e)
+
+    def put(self, item: Any, timeout: Optional[float] = 0.1):
+        while not self.pipeline.failed.is_set():
+            try:
+                self.queue.put(item, timeout=timeout)
+                return
+            except Full:
+                continue
+        raise PipelineAborted
+
+    def join(self):
+        """Дожидается обработки всех поставленных задач и останавливает воркеров"""
+        for _ in range(self.workers):
+            self.queue.put(STOP)
+        for thread in self.threads:
+            thread.join()
+
+
+class Checkpoint:
+    """Чанк источника: его позиция и число ещё не выполненных задач, порождённых чанком"""
+
+    def __init__(self, checkpoints: "Checkpoints", position: Any):
+        self.checkpoints = checkpoints
+        self.position = position
+        self.pending = 0
+        # Все задачи чанка поставлены, новых не будет
+        self.closed = False
+
+    @property
+    def finished(self) -> bool:
+        return self.closed and not self.pending
+
+    def add(self):
+        with self.checkpoints.lock:
+            self.pending += 1
+
+    def done(self):
+        with self.checkpoints.lock:
+            self.pending -= 1
+            self.checkpoints.flush()
+
+    def close(self):
+        with self.checkpoints.lock:
+            self.closed = True
+            self.checkpoints.flush()
+
+
+class Checkpoints:
+    """
+    Позиции чанков одного источника в порядке их получения. Задачи чанков выполняются
+    параллельно и завершаются в любом порядке, а commit вызывается с позицией последнего
+    чанка, завершённого вместе со всеми предыдущими, так что сохранённая позиция
+    никогда не обгоняет незагруженные данные.
+    """
+
+    def __init__(self, commit: Callable[[Any], None]):
+        self.commit = commit
+        self.lock = Lock()
+        self.chunks: deque[Checkpoint] = deque()
+
+    def open(self, position: Any) -> Checkpoint:
+        checkpoint = Checkpoint(self, position)
+        with self.lock:
+            self.chunks.append(checkpoint)
+        return checkpoint
+
+    def flush(self):
+        # Вызывается под self.lock, поэтому позиции сохраняются по очереди
+        position = None
+        while self.chunks and self.chunks[0].finished:
+            position = self.chunks.popleft().position
+        if position is not None:
+            self.commit(position)
@@ -1,23 +1,176 @@
+import hashlib
+import logging
+import re
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache
+from threading import BoundedSemaphore, Lock
+from typing import Iterator, Optional
+from uuid import uuid4
+
 import psycopg2
-from psycopg2.extras import DictCursor
+from psycopg2.extensions import TRANSACTION_STATUS_UNKNOWN, connection as BaseConnection
+from psycopg2.extras import DictCursor, DictRow
+from psycopg2.pool import ThreadedConnectionPool
 
 from backoff import backoff
-from config import DSNSettings
+from config import DSNSettings, PoolSettings
+
+# Параметр запроса %s с необязательным приведением типа после него или литерал %%
+PARAMETER = re.compile(r"%%|%s(::\w+(?:\[\])?)?")
+
+
+@lru_cache()
+def number_parameters(query: str) -> tuple[str, tuple[str, ...]]:
+    """
+    Запрос для PREPARE: параметры %s нумеруются ($1, $2, ...), а %% заменяется на %,
+    так как текст PREPARE выполняется без параметров. Возвращает запрос и приведения типов
+    параметров ("::uuid[]" для ANY(%s::uuid[]), пустая строка для параметра без приведения).
+    """
+    casts = []
+
+    def replace(match: re.Match) -> str:
+        if match.group(0) == "%%":
+            return "%"
+        casts.append(match.group(1) or "")
+        return f"${len(casts)}{casts[-1]}"
+
+    return PARAMETER.sub(replace, query.rstrip().rstrip(";")), tuple(casts)
+
+
+class PooledConnection(BaseConnection):
+    """Соединение пула, которое помнит подготовленные в своей сессии запросы"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared: set[str] = set()
 
 
 class PostgresConnection:
-    def __init__(self, dsn: DSNSettings):
+    """
+    Запросы к Postgres. Без пула на каждый запрос открывается новое соединение.
+    С пулом соединения переиспользуются: перед выдачей соединение проверяется,
+    а сломанное закрывается, так что повтор в backoff получит новое.
+    Запросы со скалярными параметрами (в том числе без параметров) и с массивами явного типа
+    в соединениях пула выполняются через PREPARE/EXECUTE: Postgres разбирает и планирует
+    их один раз на сессию.
+    """
+
+    def __init__(self, dsn: DSNSettings, pool_settings: PoolSettings):
         self.dsn = dsn
+        self.pool_settings = pool_settings
+        self.pool: Optional[ThreadedConnectionPool] = None
+        self.pool_lock = Lock()
+        # ThreadedConnectionPool не ждёт освобождения соединения, а сразу падает,
+        # поэтому потоки конвейера ждут свободного соединения на семафоре
+        self.pool_slots = BoundedSemaphore(pool_settings.max_size)
+
+    def get_pool(self) -> ThreadedConnectionPool:
+        # Пул создаётся при первом запросе, чтобы недоступная при старте БД обрабатывалась backoff
+        with self.pool_lock:
+            if self.pool is None:
+                self.pool = ThreadedConnectionPool(
+                    self.pool_settings.min_size,
+                    self.pool_settings.max_size,
+                    **self.dsn.dict(),
+                    cursor_factory=DictCursor,
+                    connection_factory=PooledConnection,
+                )
+            return self.pool
+
+    @staticmethod
+    def is_healthy(connection: BaseConnection) -> bool:
+        return not connection.closed and connection.get_transaction_status() != TRANSACTION_STATUS_UNKNOWN
+
+    @contextmanager
+    def connection(self) -> Iterator[BaseConnection]:
+        if not self.pool_settings.enabled:
+            connection = psycopg2.connect(**self.dsn.dict(), cursor_factory=DictCursor)
+            try:
+                with connection:
+                    yield connection
+            finally:
+                connection.close()
+            return
+
+        pool = self.get_pool()
+        with self.pool_slots:
+            connection = pool.getconn()
+            while not self.is_healthy(connection):
+                logging.warning("Dropping broken Postgres connection from the pool")
+                pool.putconn(connection, close=True)
+                connection = pool.getconn()
+            # Соединения пула только читают, поэтому работают без открытых транзакций
+            connection.autocommit = True
+            broken = False
+            try:
+                yield connection
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                broken = True
+                raise
+            finally:
+                # Соединение возвращается в пул, даже если потребитель потока бросил его на середине
+                pool.putconn(connection, close=broken)
+
+    @staticmethod
+    def can_prepare(connection: BaseConnection, query: str, args: tuple) -> bool:
+        # Кортеж в параметре раскрывается в список значений для IN, такой запрос не подготовить.
+        # Список передаётся массивом text[], поэтому готовится, только если у параметра
+        # в запросе явно указан тип массива (ANY(%s::uuid[])): с ним массив приводится и в EXECUTE.
+        if not isinstance(connection, PooledConnection):
+            return False
+        _, casts = number_parameters(query)
+        return len(casts) == len(args) and all(
+            not isinstance(arg, tuple) and (not isinstance(arg, list) or cast.endswith("[]"))
+            for arg, cast in zip(args, casts)
+        )
+
+    @staticmethod
+    def execute_prepared(connection: PooledConnection, cursor, query: str, args: tuple):
+        name = "etl_" + hashlib.md5(query.encode()).hexdigest()[:16]
+        numbered, casts = number_parameters(query)
+        if name not in connection.prepared:
+            cursor.execute(f"PREPARE {name} AS {numbered}")
+            connection.prepared.add(name)
+        if args:
+            cursor.execute(f"EXECUTE {name} ({', '.join(f'%s{cast}' for cast in casts)})", args)
+        else:
+            cursor.execute(f"EXECUTE {name}")
 
     @backoff()
     def fetch(self, query: str, args: tuple) -> list[tuple]:
-        with psycopg2.connect(
-            **self.dsn.dict(), cursor_factory=DictCursor
-        ) as connection:
+        with self.connection() as connection:
             with connection.cursor() as cursor:
-                query = cursor.mogrify(query, args).decode()
-                cursor.execute(query)
+                if self.pool_settings.prepare and self.can_prepare(connection, query, args):
+                    self.execute_prepared(connection, cursor, query, args)
+                else:
+                    query = cursor.mogrify(query, args).decode()
+                    cursor.execute(query)
                 res = cursor.fetchall()
-
-        connection.close()
         return res
+
+    @backoff()
+    def open_stream(self, query: str, args: tuple, itersize: int) -> tuple[ExitStack, DictCursor]:
+        with ExitStack() as stack:
+            connection = stack.enter_context(self.connection())
+            # Именованный (серверный) курсор живёт только внутри транзакции
+            connection.autocommit = False
+            stack.callback(connection.rollback)
+            cursor = stack.enter_context(connection.cursor(name=f"etl_stream_{uuid4().hex}"))
+            cursor.itersize = itersize
+            cursor.execute(query, args)
+            return stack.pop_all(), cursor
+
+    def stream(self, query: str, args: tuple, itersize: int) -> Iterator[DictRow]:
+        """
+        Потоковое чтение результата запроса серверным курсором: строки забираются из БД
+        пачками по itersize, и в памяти одновременно находится не больше одной пачки.
+        Открытие курсора повторяется через backoff, ошибка посреди потока пробрасывается,
+        так как часть строк уже отдана потребителю.
+        """
+        stack, cursor = self.open_stream(query, args, itersize)
+        with stack:
+            yield from cursor
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.closeall()
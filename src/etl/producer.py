@@ -1,21 +1,45 @@
-from typing import Generator
+from typing import Any, Generator, Optional
 
 from config import ProducerSettings
 from postgres_connection import PostgresConnection
 from state import JsonFileStorage, State
 
+# Айди, меньший любого другого: с ним позиция из одного updated_at
+# (состояние до появления айди в нём) перечитывает строки с той же меткой времени
+MIN_ID = "00000000-0000-0000-0000-000000000000"
+
 
 class Producer:
+    """
+    Отдаёт чанками айди изменённых объектов. Позиция продьюсера - пара (updated_at, id)
+    последней отданной строки: строки с одинаковым updated_at, попавшие на границу чанков,
+    не пропускаются и не читаются повторно.
+    """
+
     def __init__(self, settings: ProducerSettings, db: PostgresConnection):
         self.settings = settings
         self.db = db
         self.state_manager = State(JsonFileStorage(self.settings.state_file_path))
+        self.load_state()
+
+    def load_state(self):
+        """
+        Возвращает позицию к сохранённой. produce двигает позицию в памяти до загрузки чанка,
+        поэтому каждый цикл начинается с сохранённой позиции: чанки прерванного цикла,
+        которые не дошли до ES, читаются заново, а не пропускаются.
+        """
         self.state = self.state_manager.get_state(self.settings.state_field)
+        self.state_id = self.state_manager.get_state("id") or MIN_ID
+
+    @property
+    def position(self) -> Optional[tuple[Any, str]]:
+        """Позиция после последнего отданного чанка"""
+        return (self.state, self.state_id) if self.state else None
 
     def produce(self) -> Generator[list[str], None, None]:
         while True:
             query = self.settings.sql
-            args = (self.state, self.settings.limit)
+            args = (self.state, self.state_id, self.settings.limit)
             if not self.state:
                 query = "\n".join(
                     line for line in query.split("\n") if not line.startswith("WHERE")
@@ -27,13 +51,16 @@ class Producer:
             if not data:
                 break
 
-            # Сохраняется последнее полученное значение столбца соотв.
-            # состоянию продьюсера
+            # Сохраняется позиция последней полученной строки
             self.state = data[-1][self.settings.state_field]
+            self.state_id = data[-1]["id"]
 
             ids = [item["id"] for item in data]
 
             yield ids
 
-    def save_state(self):
-        self.state_manager.set_state(self.settings.state_field, self.state)
+    def save_state(self, position: Optional[tuple[Any, str]] = None):
+        """Сохраняет позицию position (по умолчанию текущую), с которой продьюсер продолжит после перезапуска"""
+        position = position or self.position
+        if position:
+            self.state_manager.update_state({self.settings.state_field: position[0], "id": position[1]})
@@ -0,0 +1,35 @@
+import json
+import time
+
+from redis import Redis
+
+from backoff import backoff
+from config import RedisSettings
+
+
+class Publisher:
+    """Публикует айди загруженных в ES объектов в Redis stream, по которому API сбрасывает кеш"""
+    def __init__(self, settings: RedisSettings):
+        self.settings = settings
+        self.redis = Redis(host=settings.host, port=settings.port)
+
+    @backoff()
+    def publish(self, index: str, ids: list[str]):
+        self.redis.xadd(
+            self.settings.stream,
+            {"index": index, "ids": json.dumps(ids)},
+            maxlen=self.settings.maxlen,
+            approximate=True,
+        )
+
+    @backoff()
+    def last_stream_id(self) -> str:
+        last = self.redis.xrevrange(self.settings.stream, count=1)
+        return last[0][0].decode() if last else "0-0"
+
+    @backoff()
+    def save_bloom(self, index: str, data: bytes, stream_id: str):
+        self.redis.hset(
+            f"bloom:{index}",
+            mapping={"filter": data, "stream_id": stream_id, "built_at": time.time()},
+        )
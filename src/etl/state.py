@@ -21,8 +21,12 @@ class JsonFileStorage(BaseStorage):
         self.file_path = file_path or "states.json"
 
     def save_state(self, state: dict) -> None:
-        with open(self.file_path, "w") as fo:
+        # Состояние пишется во временный файл и атомарно подменяет старое,
+        # чтобы падение посреди записи не оставило обрезанный JSON
+        tmp_path = f"{self.file_path}.tmp"
+        with open(tmp_path, "w") as fo:
             json.dump(state, fo, ensure_ascii=False, indent=4, default=str)
+        os.replace(tmp_path, self.file_path)
 
     def retrieve_state(self) -> dict:
         if os.path.exists(self.file_path):
@@ -49,6 +53,12 @@ class State:
         state.update({key: value})
         self.storage.save_state(state)
 
+    def update_state(self, values: dict[str, Any]) -> None:
+        """Установить состояние для нескольких ключей одной записью"""
+        state = self.storage.retrieve_state()
+        state.update(values)
+        self.storage.save_state(state)
+
     def get_state(self, key: str) -> Any:
         """Получить состояние по определённому ключу"""
         state = self.storage.retrieve_state()
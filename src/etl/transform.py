@@ -1,12 +1,16 @@
 from itertools import groupby
+from typing import Iterable, Iterator
 
 from es_item import FilmItem, GenreItem, PersonItem
 
 
-def transform_film_work(data: list[dict]) -> list[FilmItem]:
+def transform_film_work(data: Iterable[dict]) -> Iterator[FilmItem]:
+    """
+    Собирает фильмы из строк мёрджера. Строки должны идти упорядоченными по uuid фильма
+    (ORDER BY fw.id в SQL мёрджера): тогда данные обрабатываются потоком, и в памяти
+    держатся только строки текущего фильма.
+    """
     key_func = lambda x: x["fw_uuid"]
-    res = []
-    data.sort(key=key_func)
     for fw_uuid, fw_group_iter in groupby(data, key=key_func):
         # Группируем данные по uuid фильма, в каждой группе затем формируются
         # списки уникальных персон и жанров.
@@ -40,9 +44,33 @@ def transform_film_work(data: list[dict]) -> list[FilmItem]:
             setattr(item, collection, [PersonItem(uuid=uuid, full_name=full_name)
                                        for uuid, full_name in persons[role].items()])
 
-        res.append(item)
+        yield item
 
-    return res
+
+def transform_film_work_aggregated(data: Iterable[dict]) -> Iterator[FilmItem]:
+    """
+    Собирает фильмы из строк мёрджера с агрегацией в SQL: на фильм приходит одна строка,
+    в которой жанры и персоны по ролям уже собраны Postgres в JSON-массивы без повторов.
+    """
+    for row in data:
+        genre = [GenreItem(**elem) for elem in row["genre"] or []]
+        actors = [PersonItem(**elem) for elem in row["actors"] or []]
+        writers = [PersonItem(**elem) for elem in row["writers"] or []]
+        directors = [PersonItem(**elem) for elem in row["directors"] or []]
+        yield FilmItem(
+            uuid=row["fw_uuid"],
+            imdb_rating=row["rating"],
+            title=row["title"],
+            description=row["description"],
+            genres_names=[elem.name for elem in genre],
+            genre=genre,
+            actors_names=[elem.full_name for elem in actors],
+            writers_names=[elem.full_name for elem in writers],
+            directors_names=[elem.full_name for elem in directors],
+            actors=actors,
+            writers=writers,
+            directors=directors,
+        )
 
 
 def transform_person(data: list[dict]) -> list[PersonItem]:
@@ -1,13 +1,26 @@
+import asyncio
+from http import HTTPStatus
+
 import aioredis
 import uvicorn
 from elasticsearch import AsyncElasticsearch
-from fastapi import FastAPI
-from fastapi.responses import ORJSONResponse
+from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 
 from api.v1 import film, genre, person
 from core.config import settings
 from core.logger import LOGGING
+from core.metrics import POOL_CONNECTIONS, MetricsMiddleware, registry
 from db import elastic, redis
+from db.bloom import bloom_filters
+from db.bulkhead import BackendOverloaded
+from db.circuit_breaker import CircuitOpen
+from db.dependens import get_cache, get_cache_creator
+from db.invalidation import CacheInvalidationListener
+from db.popularity import popularity
+from db.queries import put_stored_templates
+from db.storage import InvalidCursor
+from services.warmup import get_warmup
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -15,16 +28,91 @@ app = FastAPI(
     openapi_url='/api/openapi.json',
     default_response_class=ORJSONResponse,
 )
+app.add_middleware(MetricsMiddleware)
 
 
 @app.on_event('startup')
 async def startup():
-    redis.redis = await aioredis.create_redis_pool((settings.REDIS_HOST, settings.REDIS_PORT), minsize=10, maxsize=20)
-    elastic.es = AsyncElasticsearch(hosts=[f'{settings.ELASTIC_HOST}:{settings.ELASTIC_PORT}'])
+    redis.redis = await aioredis.create_redis_pool(
+        (settings.REDIS_HOST, settings.REDIS_PORT),
+        minsize=settings.REDIS_POOL_MIN_SIZE,
+        maxsize=settings.REDIS_POOL_MAX_SIZE,
+    )
+    elastic.es = AsyncElasticsearch(
+        hosts=[f'{settings.ELASTIC_HOST}:{settings.ELASTIC_PORT}'],
+        connection_class=elastic.KeepAliveConnection,
+        maxsize=settings.ELASTIC_POOL_MAX_SIZE,
+        keep_alive=settings.ELASTIC_KEEP_ALIVE_IN_SECONDS,
+        timeout=settings.ELASTIC_TIMEOUT_IN_SECONDS,
+    )
+    if settings.ES_STORED_TEMPLATES_ENABLED:
+        await put_stored_templates(elastic.es)
+    # Фоновые задачи воркера, которые отменяются при остановке
+    app.state.background_tasks = [asyncio.create_task(popularity.run())]
+    if settings.BLOOM_FILTER_ENABLED:
+        await bloom_filters.refresh()
+        app.state.background_tasks.append(asyncio.create_task(bloom_filters.run()))
+    app.state.warmup = warmup = await get_warmup()
+    if settings.WARMUP_ENABLED:
+        warmup.trigger()
+    if settings.CACHE_INVALIDATION_ENABLED:
+        listener = CacheInvalidationListener(
+            await get_cache(), await get_cache_creator(),
+            on_invalidated=warmup.trigger if settings.WARMUP_ENABLED else None,
+        )
+        app.state.background_tasks.append(asyncio.create_task(listener.run()))
+
+
+def collect_backend_metrics():
+    if redis.redis is not None:
+        pool = redis.redis.connection
+        POOL_CONNECTIONS.labels('redis', 'open').set(pool.size)
+        POOL_CONNECTIONS.labels('redis', 'free').set(pool.freesize)
+        POOL_CONNECTIONS.labels('redis', 'max').set(pool.maxsize)
+    if elastic.es is not None:
+        in_use = 0
+        for connection in elastic.es.transport.connection_pool.connections:
+            session = getattr(connection, 'session', None)
+            in_use += len(getattr(getattr(session, 'connector', None), '_acquired', ()))
+        POOL_CONNECTIONS.labels('elasticsearch', 'in_use').set(in_use)
+
+
+registry.add_collector(collect_backend_metrics)
+
+
+@app.get('/metrics', include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4')
+
+
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor_handler(request: Request, exc: InvalidCursor):
+    return ORJSONResponse(status_code=HTTPStatus.UNPROCESSABLE_ENTITY, content={'detail': 'invalid cursor'})
+
+
+@app.exception_handler(BackendOverloaded)
+async def backend_overloaded_handler(request: Request, exc: BackendOverloaded):
+    return ORJSONResponse(
+        status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+        content={'detail': 'service overloaded'},
+        headers={'Retry-After': '1'},
+    )
+
+
+@app.exception_handler(CircuitOpen)
+async def circuit_open_handler(request: Request, exc: CircuitOpen):
+    return ORJSONResponse(
+        status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+        content={'detail': 'storage unavailable'},
+        headers={'Retry-After': str(int(settings.ES_CIRCUIT_BREAKER_OPEN_IN_SECONDS))},
+    )
 
 
 @app.on_event('shutdown')
 async def shutdown():
+    for task in [*app.state.background_tasks, app.state.warmup.task]:
+        if task is not None:
+            task.cancel()
     await redis.redis.close()
     await elastic.es.close()
 
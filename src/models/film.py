@@ -3,7 +3,7 @@ from uuid import UUID
 
 from models import BaseModel
 from models.genre import Genre
-from models.person import Person
+from models.person import Person, PersonRef
 
 
 class Film(BaseModel):
@@ -19,3 +19,17 @@ class Film(BaseModel):
     actors: Optional[list[Person]] = None
     writers: Optional[list[Person]] = None
     directors: Optional[list[Person]] = None
+
+
+class FilmShort(BaseModel):
+    """Фильм в списках и поиске"""
+    uuid: UUID
+    title: str
+    imdb_rating: Optional[float] = None
+
+
+class FilmRoles(FilmShort):
+    """Фильм в фильмографии персоны: по спискам участников определяются её роли"""
+    actors: Optional[list[PersonRef]] = None
+    writers: Optional[list[PersonRef]] = None
+    directors: Optional[list[PersonRef]] = None
@@ -10,3 +10,8 @@ class Person(BaseModel):
     full_name: str
     role: Optional[str] = None
     film_ids: Optional[list[UUID]] = None
+
+
+class PersonRef(BaseModel):
+    """Ссылка на персону: только айди"""
+    uuid: UUID
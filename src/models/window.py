@@ -0,0 +1,8 @@
+from uuid import UUID
+
+from models import BaseModel
+
+
+class Window(BaseModel):
+    """Выровненное окно упорядоченных айди из выдачи списка или поиска"""
+    ids: list[UUID]
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+from core.config import settings
+from db.bulkhead import BackendOverloaded
+from db.circuit_breaker import es_circuit_breaker
+from db.single_flight import NOT_FOUND, SingleFlight
+from db.storage import AbstractCache, AbstractKeyCreator, AbstractStorage
+
+logger = logging.getLogger(__name__)
+
+
+class BaseService:
+    # Ключи, обновляемые в фоне, и ссылки на задачи, чтобы их не собрал сборщик мусора
+    refreshing_keys: set[str] = set()
+    refresh_tasks: set[asyncio.Task] = set()
+
+    def __init__(
+            self,
+            db: AbstractStorage,
+            cache: AbstractCache,
+            cache_creator: AbstractKeyCreator,
+            single_flight: SingleFlight,
+    ):
+        self.db = db
+        self.cache = cache
+        self.cache_creator = cache_creator
+        self.single_flight = single_flight
+
+    async def get_or_fetch(
+            self, key: str, model, fetch: Callable[[], Awaitable[Any]], expire: int, as_list: bool = False
+    ) -> Optional[Any]:
+        """
+        Возвращает данные из кеша, а при промахе получает их через fetch и кладёт в кеш.
+        Одновременные промахи по одному ключу схлопываются в один вызов fetch.
+        Устаревшая запись (истёк мягкий TTL) отдаётся сразу, а обновляется в фоне.
+        То, что в хранилище ничего не нашлось, тоже кешируется, но ненадолго.
+        Пока хранилище недоступно (разомкнут предохранитель или запрос к нему не удался),
+        отдаются и записи, которые хранятся сверх TTL как раз на этот случай.
+        """
+        stale_ttl = settings.CACHE_STALE_TTL_IN_SECONDS
+        grace_ttl = settings.CACHE_GRACE_TTL_IN_SECONDS
+        degraded = es_circuit_breaker.is_open
+        data, stale = await self.cache.get_entry(
+            key, model, as_list=as_list, stale_ttl=stale_ttl, grace_ttl=grace_ttl, degraded=degraded
+        )
+        missing_key = await self.cache_creator.get_key_from_missing(key)
+
+        async def fetch_and_cache():
+            data_from_db = await fetch()
+            if not data_from_db:
+                await self.cache.mark_missing(missing_key, expire=settings.NEGATIVE_CACHE_TTL_IN_SECONDS)
+                return None
+            await self.cache.put_data(
+                key=key, data=data_from_db, as_list=as_list, expire=expire, stale_ttl=self.retention_ttl()
+            )
+            return data_from_db
+
+        async def read_cache():
+            # Отметка лидера о том, что объекта нет, - тоже результат для ожидающих его воркеров
+            if await self.cache.is_missing(missing_key):
+                return NOT_FOUND
+            return await self.cache.get_data(key, model, as_list=as_list)
+
+        if data:
+            if stale and not degraded:
+                self.refresh_in_background(key, fetch_and_cache, read_cache)
+            return data
+
+        if await self.cache.is_missing(missing_key):
+            return None
+        try:
+            return await self.single_flight.do(key, fetch_and_cache, read_cache)
+        except Exception:
+            if degraded:
+                raise
+            data, _ = await self.cache.get_entry(key, model, as_list=as_list, grace_ttl=grace_ttl, degraded=True)
+            if not data:
+                raise
+            logger.warning(f'Storage is unavailable, serving {key} past its TTL', exc_info=True)
+            return data
+
+    async def get_many_or_fetch(
+            self, keys: list[str], model, fetch_missing: Callable[[list[int]], Awaitable[list[Optional[Any]]]],
+            expire: int, related: Optional[dict[str, Any]] = None,
+    ) -> list[Any]:
+        """
+        Пакетный вариант get_or_fetch: кеш читается одним MGET, а недостающие записи
+        получаются одним вызовом fetch_missing (по номерам ключей) и записываются одним конвейером.
+        В related fetch_missing может сложить связанные записи (например, фильмографии персон):
+        они попадают в тот же конвейер.
+        Порядок результата совпадает с порядком ключей, отсутствующие в хранилище объекты пропускаются.
+        """
+        data = await self.cache.get_many(keys, model)
+        missing = [i for i, item in enumerate(data) if item is None]
+        if missing:
+            data_from_db = await fetch_missing(missing)
+            for i, item in zip(missing, data_from_db):
+                data[i] = item
+            items = dict(related or {})
+            items.update({keys[i]: data[i] for i in missing if data[i]})
+            await self.put_many(items, expire=expire)
+
+        return [item for item in data if item]
+
+    @staticmethod
+    def retention_ttl() -> int:
+        """
+        Сколько запись хранится после мягкого TTL: пока она устаревшая, и сверх того
+        на случай недоступности хранилища. Одинаково для записей, положенных по одной и пачкой.
+        """
+        return settings.CACHE_STALE_TTL_IN_SECONDS + settings.CACHE_GRACE_TTL_IN_SECONDS
+
+    async def put_many(self, items: dict[str, Any], expire: int):
+        await self.cache.put_many(items, expire=expire, stale_ttl=self.retention_ttl())
+
+    def refresh_in_background(
+            self, key: str, fetch: Callable[[], Awaitable[Any]], read_cache: Callable[[], Awaitable[Any]]
+    ):
+        if key in self.refreshing_keys or key in self.single_flight.in_flight:
+            return
+        self.refreshing_keys.add(key)
+
+        async def refresh():
+            try:
+                await self.single_flight.do(key, fetch, read_cache)
+            except BackendOverloaded:
+                logger.info(f'Background refresh of {key} skipped: storage is overloaded')
+            except Exception:
+                logger.exception(f'Background refresh of {key} failed')
+            finally:
+                self.refreshing_keys.discard(key)
+
+        task = asyncio.create_task(refresh())
+        self.refresh_tasks.add(task)
+        task.add_done_callback(self.refresh_tasks.discard)
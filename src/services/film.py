@@ -1,76 +1,124 @@
+import asyncio
 from functools import lru_cache
-from typing import Optional
+from typing import Awaitable, Callable, Optional
 from uuid import UUID
 
 from fastapi import Depends
 
 from core.config import settings
-from db.dependens import get_storage, get_cache, get_cache_creator
+from db.dependens import get_storage, get_cache, get_cache_creator, get_single_flight
+from db.bloom import bloom_filters
 from db.elastic import AbstractStorage
 
+from db.single_flight import SingleFlight
 from db.storage import AbstractCache, AbstractKeyCreator
-from models.film import Film
+from models.film import Film, FilmShort
+from models.window import Window
+from services.base import BaseService
 
 
-class FilmService:
-    def __init__(self, db: AbstractStorage, cache: AbstractCache, cache_creator):
-        self.db = db
-        self.cache = cache
-        self.cache_creator = cache_creator
+class FilmService(BaseService):
+    async def search(self, query: str, list_parameters: dict) -> Optional[list[FilmShort]]:
+        return await self.get_page(
+            f'search-{query}', list_parameters,
+            lambda parameters: self.db.get_data_by_query("movies", query, FilmShort, parameters),
+        )
 
-    async def search(self, query: str, list_parameters: dict) -> Optional[list[Film]]:
-        key = await self.cache_creator.get_key_from_search('film', query, list_parameters)
-        films_search = await self.cache.get_data(key, Film, as_list=True)
-        if films_search:
-            return films_search
-
-        films_search = await self.db.get_data_by_query("movies", query, Film, list_parameters)
-        if not films_search:
-            return None
-        await self.cache.put_data(key=key, data=films_search, as_list=True, expire=settings.FILM_CACHE_EXPIRE_IN_SECONDS)
-
-        return films_search
+    async def search_by_cursor(self, query: str, list_parameters: dict) -> tuple[list[FilmShort], Optional[str]]:
+        return await self.db.get_data_by_query_cursor("movies", query, FilmShort, list_parameters)
 
     # get_by_id возвращает объект фильма. Он опционален, так как фильм может отсутствовать в базе
     async def get_by_id(self, film_id: UUID) -> Optional[Film]:
-        # Пытаемся получить данные из кеша, потому что оно работает быстрее
-        key = await self.cache_creator.get_key_from_id(film_id)
-        film_from_cache = await self.cache.get_data(key, Film)
-        # film = GetData(RedisStorage(RedisRequest(key=key, model=Film))).data
-        if film_from_cache:
-            return film_from_cache
-
-        # Если фильма нет в кеше, то ищем его в Elasticsearch
-        # self.db.storage_request = ElasticRequesterId()
-        film_from_db = await self.db.get_data_by_id(index="movies", id=film_id, model=Film)
-        # film = GetData(ElasticStorage(ElasticRequestByIndex("movies", film_id))).data
-        if not film_from_db:
-            # Если он отсутствует в Elasticsearch, значит, фильма вообще нет в базе
+        # Сначала смотрим в кеш, потому что он работает быстрее. Если фильма нет в кеше,
+        # то ищем его в Elasticsearch и сохраняем в кеш. Если он отсутствует и в Elasticsearch,
+        # значит, фильма вообще нет в базе
+        key = await self.cache_creator.get_key_from_id('film', film_id)
+        return await self.get_or_fetch(
+            key, Film,
+            lambda: self.db.get_data_by_id(index="movies", id=film_id, model=Film),
+            expire=settings.FILM_CACHE_EXPIRE_IN_SECONDS,
+        )
+
+    async def get_key(self, film_id: UUID, model=Film) -> str:
+        # Урезанные модели фильма кешируются отдельно от полной, в своём пространстве имён
+        return await self.cache_creator.get_key_from_id(model.__name__.lower(), film_id)
+
+    async def get_many_by_id(self, film_ids: list[UUID], model=Film) -> list[Film]:
+        """Пакетный вариант get_by_id: кеш читается одним MGET, недостающие фильмы - одним mget в ES"""
+        film_ids = [film_id for film_id in film_ids if bloom_filters.might_contain('movies', film_id)]
+        keys = [await self.get_key(film_id, model) for film_id in film_ids]
+        return await self.get_many_or_fetch(
+            keys, model,
+            lambda missing: self.db.get_data_by_ids("movies", [film_ids[i] for i in missing], model),
+            expire=settings.FILM_CACHE_EXPIRE_IN_SECONDS,
+        )
+
+    async def list_films(self, filter_genre: UUID, list_parameters: dict) -> Optional[list[FilmShort]]:
+        return await self.get_page(
+            f'list-{filter_genre}', list_parameters,
+            lambda parameters: self.db.get_data_list_by_id("movies", filter_genre, FilmShort, parameters=parameters),
+        )
+
+    async def list_films_by_cursor(
+            self, filter_genre: UUID, list_parameters: dict
+    ) -> tuple[list[FilmShort], Optional[str]]:
+        return await self.db.get_data_list_by_cursor("movies", filter_genre, FilmShort, list_parameters)
+
+    async def get_page(
+            self, query: str, list_parameters: dict, fetch: Callable[[dict], Awaitable[Optional[list[FilmShort]]]]
+    ) -> Optional[list[FilmShort]]:
+        """
+        Собирает страницу выдачи из выровненных окон упорядоченных айди фильмов.
+        Окна не зависят от размера и номера страницы, поэтому пересекающиеся страницы
+        используют одни и те же записи кеша, а сами фильмы берутся из кеша по айди.
+        """
+        window_size = settings.FILM_WINDOW_SIZE
+        start = (list_parameters['page_number'] - 1) * list_parameters['page_size']
+        end = start + list_parameters['page_size']
+        first_window = start // window_size
+        windows = await asyncio.gather(*[
+            self.get_window(query, list_parameters['sort'], window_number, fetch)
+            for window_number in range(first_window, (end - 1) // window_size + 1)
+        ])
+
+        ids = []
+        for window in windows:
+            if not window:
+                break
+            ids.extend(window.ids)
+        offset = first_window * window_size
+        page_ids = ids[start - offset:end - offset]
+        if not page_ids:
             return None
-        # Сохраняем фильм  в кеш
-        await self.cache.put_data(key=key, data=film_from_db, expire=settings.FILM_CACHE_EXPIRE_IN_SECONDS)
-        # StoragePut(RedisPutParams(RedisPutRequest(key=key, data=film, expire=settings.FILM_CACHE_EXPIRE_IN_SECONDS)))
 
-        return film_from_db
+        return await self.get_many_by_id(page_ids, FilmShort)
 
-    async def list_films(self, filter_genre: UUID, list_parameters: dict) -> Optional[list[Film]]:
-        key = await self.cache_creator.get_key_from_search('film', filter_genre, list_parameters)
-        films_list = await self.cache.get_data(key, Film, as_list=True)
-        if films_list:
-            return films_list
+    async def get_window(
+            self, query: str, sort: Optional[str], window_number: int,
+            fetch: Callable[[dict], Awaitable[Optional[list[FilmShort]]]]
+    ) -> Optional[Window]:
+        window_size = settings.FILM_WINDOW_SIZE
+        key = await self.cache_creator.get_key_from_window('film', query, sort, window_size, window_number)
 
-        films_list_from_db = await self.db.get_data_list_by_id("movies", filter_genre, Film, parameters=list_parameters)
-        if not films_list_from_db:
-            return None
-        await self.cache.put_data(key=key, data=films_list_from_db, as_list=True, expire=settings.FILM_CACHE_EXPIRE_IN_SECONDS)
+        async def fetch_window() -> Optional[Window]:
+            films = await fetch({'sort': sort, 'page_size': window_size, 'page_number': window_number + 1})
+            if not films:
+                return None
+            # Фильмы из окна сразу кладём в кеш по айди, откуда их потом соберёт страница
+            await self.put_many(
+                {await self.get_key(film.uuid, FilmShort): film for film in films},
+                expire=settings.FILM_CACHE_EXPIRE_IN_SECONDS,
+            )
+            return Window(ids=[film.uuid for film in films])
 
-        return films_list_from_db
+        return await self.get_or_fetch(key, Window, fetch_window, expire=settings.FILM_CACHE_EXPIRE_IN_SECONDS)
 
 
 @lru_cache()
 def get_film_service(
         db: AbstractStorage = Depends(get_storage),
         cache: AbstractCache = Depends(get_cache),
-        cache_creator: AbstractKeyCreator = Depends(get_cache_creator)
+        cache_creator: AbstractKeyCreator = Depends(get_cache_creator),
+        single_flight: SingleFlight = Depends(get_single_flight),
 ) -> FilmService:
-    return FilmService(db, cache, cache_creator)
+    return FilmService(db, cache, cache_creator, single_flight)
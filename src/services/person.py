@@ -1,85 +1,132 @@
+import asyncio
 from functools import lru_cache
 from typing import Optional
 from uuid import UUID
 
 from core.config import settings
-from db.dependens import get_cache, get_cache_creator, get_storage
+from db.bloom import bloom_filters
+from db.dependens import get_cache, get_cache_creator, get_single_flight, get_storage
+from db.single_flight import SingleFlight
 from db.storage import AbstractCache, AbstractKeyCreator, AbstractStorage
 from fastapi import Depends
-from models.film import Film
-from models.person import Person
-from pydantic.json import pydantic_encoder
+from models.film import FilmRoles
+from models.person import Person, PersonRef
+from services.base import BaseService
 
 
-class PersonService:
-    def __init__(self, db: AbstractStorage, cache: AbstractCache, cache_creator):
-        self.db = db
-        self.cache = cache
-        self.cache_creator = cache_creator
-
+class PersonService(BaseService):
     async def get_by_search(self, query: str, list_parameters: dict) -> Optional[list[Person]]:
         key = await self.cache_creator.get_key_from_search('person', query, list_parameters)
-        persons_search = await self.cache.get_data(key, Person, as_list=True)
-        if persons_search:
-            return persons_search
+        return await self.get_or_fetch(
+            key, Person,
+            lambda: self._search_from_db(query, list_parameters),
+            expire=settings.PERSON_CACHE_EXPIRE_IN_SECONDS,
+            as_list=True,
+        )
+
+    async def get_by_search_cursor(self, query: str, list_parameters: dict) -> tuple[list[Person], Optional[str]]:
+        persons, next_cursor = await self.db.get_person_search_by_cursor('persons', query, PersonRef, list_parameters)
+        if not persons:
+            return [], next_cursor
+        return await self.get_many_by_id([person.uuid for person in persons]), next_cursor
 
-        persons = await self.db.get_person_search_from_elastic('persons', query, Person, list_parameters)
+    async def _search_from_db(self, query: str, list_parameters: dict) -> Optional[list[Person]]:
+        persons = await self.db.get_person_search_from_elastic('persons', query, PersonRef, list_parameters)
         if not persons:
             return None
-        persons_search = [await self.get_by_id(person.uuid) for person in persons]
-        await self.cache.put_data(key=key, data=persons_search, as_list=True, expire=settings.PERSON_CACHE_EXPIRE_IN_SECONDS)
-
-        return persons_search
+        return await self.get_many_by_id([person.uuid for person in persons])
 
     async def get_by_id(self, person_id: UUID) -> Optional[Person]:
-        key = await self.cache_creator.get_key_from_id(person_id)
-        person = await self.cache.get_data(key, Person)
-        if person:
-            return person
-
+        key = await self.cache_creator.get_key_from_id('person', person_id)
+        return await self.get_or_fetch(
+            key, Person,
+            lambda: self._get_by_id_from_db(person_id),
+            expire=settings.PERSON_CACHE_EXPIRE_IN_SECONDS,
+        )
+
+    async def get_many_by_id(self, person_ids: list[UUID]) -> list[Person]:
+        """
+        Пакетный вариант get_by_id: кеш читается одним MGET, недостающие персоны
+        и их фильмографии получаются одним mget и одним msearch в ES,
+        а персоны вместе с новыми фильмографиями записываются в кеш одним конвейером.
+        """
+        person_ids = [person_id for person_id in person_ids if bloom_filters.might_contain('persons', person_id)]
+        keys = [await self.cache_creator.get_key_from_id('person', person_id) for person_id in person_ids]
+        new_films = {}
+        return await self.get_many_or_fetch(
+            keys, Person,
+            lambda missing: self._get_many_by_id_from_db([person_ids[i] for i in missing], new_films),
+            expire=settings.PERSON_CACHE_EXPIRE_IN_SECONDS,
+            related=new_films,
+        )
+
+    async def _get_by_id_from_db(self, person_id: UUID) -> Optional[Person]:
         person_from_db = await self.db.get_data_by_id(index="persons", id=person_id, model=Person)
         if not person_from_db:
             return None
 
         films = await self.get_films_by_person_id(person_id)
-        if films:
-            roles = set()
-            film_ids = []
-            for film in films:
-                film_ids.append(film.uuid)
-                if person_id in {person.uuid for person in film.actors}:
-                    roles.add("actor")
-                if person_id in {person.uuid for person in film.writers}:
-                    roles.add("writer")
-                if person_id in {person.uuid for person in film.directors}:
-                    roles.add("director")
-            if roles:
-                person_from_db.role = ", ".join(roles)
-            if film_ids:
-                person_from_db.film_ids = film_ids
-
-        await self.cache.put_data(key=key, data=person_from_db, expire=settings.PERSON_CACHE_EXPIRE_IN_SECONDS)
-
+        self.set_roles(person_from_db, films)
         return person_from_db
 
-    async def get_films_by_person_id(self, person_id: UUID) -> Optional[list[Film]]:
+    async def _get_many_by_id_from_db(
+            self, person_ids: list[UUID], new_films: dict[str, list[FilmRoles]]
+    ) -> list[Optional[Person]]:
+        """Персоны из ES с ролями; фильмографии, которых не было в кеше, складываются в new_films"""
+        films_keys = [await self.cache_creator.get_key_from_films_list('person', person_id) for person_id in person_ids]
+        films_lists = await self.cache.get_many(films_keys, FilmRoles, as_list=True)
+        missing = [i for i, films in enumerate(films_lists) if films is None]
+
+        persons_from_db, films_from_db = await asyncio.gather(
+            self.db.get_data_by_ids('persons', person_ids, Person),
+            self.db.get_persons_films_from_elastic('movies', [person_ids[i] for i in missing], FilmRoles),
+        )
+        for i, films in zip(missing, films_from_db):
+            films_lists[i] = films
+            if films:
+                new_films[films_keys[i]] = films
+
+        for person, films in zip(persons_from_db, films_lists):
+            if person:
+                self.set_roles(person, films)
+        return persons_from_db
+
+    @staticmethod
+    def set_roles(person: Person, films: Optional[list[FilmRoles]]):
+        """Заполняет роли персоны и список её фильмов по фильмографии"""
+        if not films:
+            return
+
+        roles = set()
+        film_ids = []
+        for film in films:
+            film_ids.append(film.uuid)
+            if person.uuid in {p.uuid for p in film.actors or []}:
+                roles.add("actor")
+            if person.uuid in {p.uuid for p in film.writers or []}:
+                roles.add("writer")
+            if person.uuid in {p.uuid for p in film.directors or []}:
+                roles.add("director")
+        if roles:
+            person.role = ", ".join(roles)
+        if film_ids:
+            person.film_ids = film_ids
+
+    async def get_films_by_person_id(self, person_id: UUID) -> Optional[list[FilmRoles]]:
         key = await self.cache_creator.get_key_from_films_list('person', person_id)
-        films = await self.cache.get_data(key, Film, as_list=True)
-        if films:
-            return films
-
-        films_from_db = await self.db.get_person_films_from_elastic('movies', person_id, Film)
-        if not films_from_db:
-            return None
-        await self.cache.put_data(key=key, data=films_from_db, as_list=True, expire=settings.PERSON_CACHE_EXPIRE_IN_SECONDS)
-
-        return films_from_db
+        return await self.get_or_fetch(
+            key, FilmRoles,
+            lambda: self.db.get_person_films_from_elastic('movies', person_id, FilmRoles),
+            expire=settings.PERSON_CACHE_EXPIRE_IN_SECONDS,
+            as_list=True,
+        )
 
 
 @lru_cache()
 def get_person_service(
         db: AbstractStorage = Depends(get_storage),
         cache: AbstractCache = Depends(get_cache),
-        cache_creator: AbstractKeyCreator = Depends(get_cache_creator)
+        cache_creator: AbstractKeyCreator = Depends(get_cache_creator),
+        single_flight: SingleFlight = Depends(get_single_flight),
 ) -> PersonService:
-    return PersonService(db, cache, cache_creator)
+    return PersonService(db, cache, cache_creator, single_flight)
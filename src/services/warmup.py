@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+from uuid import UUID
+
+from core.config import settings
+from db.dependens import get_cache, get_cache_creator, get_single_flight, get_storage
+from db.popularity import Popularity, popularity
+from services.film import FilmService
+from services.genre import GenreService
+from services.person import PersonService
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """
+    Прогрев кеша: список жанров, первые страницы списка фильмов для каждой сортировки
+    и каждого жанра, самые запрашиваемые фильмы и персоны. Данные получаются через сервисы,
+    поэтому попадают во все уровни кеша, а одновременные промахи схлопываются.
+    Число одновременных запросов к хранилищу ограничено concurrency.
+    """
+
+    def __init__(
+            self,
+            film_service: FilmService,
+            genre_service: GenreService,
+            person_service: PersonService,
+            popularity: Popularity,
+            concurrency: int,
+    ):
+        self.film_service = film_service
+        self.genre_service = genre_service
+        self.person_service = person_service
+        self.popularity = popularity
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.task: Optional[asyncio.Task] = None
+        self.pending = False
+
+    def trigger(self):
+        """
+        Запускает прогрев в фоне. Если прогрев уже идёт, после него запустится ещё один,
+        так что серия вызовов (например, событий ETL) схлопывается в один-два прогрева.
+        """
+        if self.task is not None and not self.task.done():
+            self.pending = True
+            return
+        self.task = asyncio.create_task(self.run_pending())
+
+    async def run_pending(self):
+        self.pending = True
+        while self.pending:
+            self.pending = False
+            try:
+                await self.run()
+            except Exception:
+                logger.exception('Cache warmup failed')
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        started = loop.time()
+        genres = await self.genre_service.get_all() or []
+
+        jobs = []
+        for filter_genre in [None, *(genre.uuid for genre in genres)]:
+            for sort in settings.WARMUP_FILM_SORTS:
+                for page_number in range(1, settings.WARMUP_FILM_PAGES + 1):
+                    jobs.append(self.get_film_page(filter_genre, sort, page_number))
+        jobs.append(self.get_popular('film', self.film_service.get_many_by_id))
+        jobs.append(self.get_popular('person', self.person_service.get_many_by_id))
+
+        results = await asyncio.gather(*(self.bounded(job) for job in jobs), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        for error in errors[:3]:
+            logger.warning(f'Cache warmup job failed: {error!r}')
+        logger.info(f'Cache warmup: {len(jobs) - len(errors)}/{len(jobs)} jobs in {loop.time() - started:.2f}s')
+
+    async def bounded(self, job: Callable[[], Awaitable]):
+        async with self.semaphore:
+            return await job()
+
+    def get_film_page(self, filter_genre: Optional[UUID], sort: Optional[str], page_number: int) -> Callable:
+        list_parameters = {
+            'sort': sort,
+            'page_size': settings.WARMUP_FILM_PAGE_SIZE,
+            'page_number': page_number,
+            'cursor': None,
+        }
+        return lambda: self.film_service.list_films(filter_genre, list_parameters)
+
+    def get_popular(self, name_model: str, get_many_by_id: Callable[[list[UUID]], Awaitable]) -> Callable:
+        async def job():
+            ids = await self.popularity.top(name_model, settings.WARMUP_POPULAR_IDS)
+            if ids:
+                await get_many_by_id([UUID(pk) for pk in ids])
+        return job
+
+
+async def get_warmup() -> Warmup:
+    db, cache, cache_creator, single_flight = (
+        await get_storage(), await get_cache(), await get_cache_creator(), await get_single_flight()
+    )
+    return Warmup(
+        FilmService(db, cache, cache_creator, single_flight),
+        GenreService(db, cache, cache_creator, single_flight),
+        PersonService(db, cache, cache_creator, single_flight),
+        popularity,
+        concurrency=settings.WARMUP_CONCURRENCY,
+    )
@@ -0,0 +1,287 @@
+"""
+Нагрузочный бенчмарк API: приложение FastAPI запускается в процессе, хранилище и кеш
+заменены in-memory реализациями из fakes.py с данными из tests/functional/testdata
+и заданной задержкой. Смесь запросов к фильмам, персонам и жанрам подаётся с заданной
+конкурентностью, по каждой ручке считаются RPS и p50/p95/p99.
+
+Состояния кеша:
+    cold - кеш ничего не хранит, каждый запрос идёт в хранилище;
+    warm - перед замером все запросы прогона выполняются один раз, замер идёт по прогретому кешу.
+
+Запуск из корня репозитория:
+    python tests/benchmark/bench_api.py [--concurrency 1 10 50] [--json] [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from core.config import settings  # noqa: E402
+from db.dependens import get_cache, get_cache_creator, get_single_flight, get_storage  # noqa: E402
+from db.memory import LRUCache, TwoTierCache  # noqa: E402
+from fakes import LocalSingleFlight, MemoryCache, MemoryKeyCreator, MemoryStorage, load_indexes  # noqa: E402
+from main import app  # noqa: E402
+
+CACHE_STATES = ('cold', 'warm')
+
+# Ручка -> вес в смеси запросов
+TRAFFIC_MIX = {
+    'film_details': 30,
+    'film_list': 15,
+    'film_list_genre': 5,
+    'film_search': 10,
+    'film_batch': 5,
+    'person_details': 10,
+    'person_search': 5,
+    'person_films': 5,
+    'genre_details': 5,
+    'genre_list': 10,
+}
+
+
+class Traffic:
+    """Запросы к ручкам с айди и строками поиска из тестовых данных"""
+
+    def __init__(self, indexes: dict[str, dict[str, dict]], seed: int):
+        self.random = random.Random(seed)
+        self.films = list(indexes['movies'])
+        self.persons = list(indexes['persons'])
+        self.genres = list(indexes['genres'])
+        self.film_words = sorted({
+            word for film in indexes['movies'].values() for word in film['title'].lower().split() if len(word) > 3
+        })
+        self.person_words = sorted({
+            word for person in indexes['persons'].values() for word in person['full_name'].lower().split()
+        })
+
+    def film_details(self):
+        return f'/api/v1/film/{self.random.choice(self.films)}', {}
+
+    def film_list(self):
+        return '/api/v1/film/', {
+            'sort': self.random.choice(['-imdb_rating', 'imdb_rating']),
+            'page[size]': 50,
+            'page[number]': self.random.randint(1, 4),
+        }
+
+    def film_list_genre(self):
+        return '/api/v1/film/', {'filter[genre]': self.random.choice(self.genres), 'sort': '-imdb_rating'}
+
+    def film_search(self):
+        return '/api/v1/film/search', {'query': self.random.choice(self.film_words)}
+
+    def film_batch(self):
+        return '/api/v1/film/batch', [('ids', film_id) for film_id in self.random.sample(self.films, 10)]
+
+    def person_details(self):
+        return f'/api/v1/person/{self.random.choice(self.persons)}', {}
+
+    def person_search(self):
+        return '/api/v1/person/search', {'query': self.random.choice(self.person_words)}
+
+    def person_films(self):
+        return f'/api/v1/person/{self.random.choice(self.persons)}/film', {}
+
+    def genre_details(self):
+        return f'/api/v1/genre/{self.random.choice(self.genres)}', {}
+
+    def genre_list(self):
+        return '/api/v1/genre/', {}
+
+    def generate(self, count: int) -> list[tuple[str, str, str]]:
+        """Список (ручка, путь, строка запроса) в пропорциях TRAFFIC_MIX"""
+        endpoints = self.random.choices(list(TRAFFIC_MIX), weights=list(TRAFFIC_MIX.values()), k=count)
+        requests = []
+        for endpoint in endpoints:
+            path, params = getattr(self, endpoint)()
+            requests.append((endpoint, path, urlencode(params)))
+        return requests
+
+
+async def call(path: str, query_string: str) -> int:
+    """Запрос к приложению напрямую через ASGI, без сети и HTTP-клиента. Возвращает статус ответа"""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query_string.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'benchmark')],
+        'client': ('127.0.0.1', 0),
+        'server': ('benchmark', 80),
+    }
+    response = {'status': 0}
+    done = asyncio.Event()
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif message['type'] == 'http.response.body' and not message.get('more_body'):
+            done.set()
+
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        # ServerErrorMiddleware уже отправил 500 и пробрасывает исключение дальше, серверу
+        return response['status'] or 500
+    return response['status']
+
+
+def setup(cache_state: str, indexes: dict, storage_latency: float, cache_latency: float) -> MemoryStorage:
+    """Подменяет зависимости приложения свежими хранилищем и кешем"""
+    storage = MemoryStorage(indexes, latency=storage_latency)
+    if cache_state == 'cold':
+        cache = MemoryCache(latency=cache_latency, enabled=False)
+    else:
+        cache = MemoryCache(latency=cache_latency)
+        if settings.LOCAL_CACHE_ENABLED:
+            local = LRUCache(settings.LOCAL_CACHE_MAX_OBJECTS, settings.LOCAL_CACHE_NAMESPACE_MAX_OBJECTS)
+            cache = TwoTierCache(local, cache, ttl=settings.LOCAL_CACHE_TTL_IN_SECONDS)
+    cache_creator = MemoryKeyCreator()
+    single_flight = LocalSingleFlight(
+        lock_timeout=settings.SINGLE_FLIGHT_LOCK_TIMEOUT_IN_SECONDS,
+        poll_interval=settings.SINGLE_FLIGHT_POLL_INTERVAL_IN_SECONDS,
+    )
+
+    async def override_storage():
+        return storage
+
+    async def override_cache():
+        return cache
+
+    async def override_cache_creator():
+        return cache_creator
+
+    async def override_single_flight():
+        return single_flight
+
+    app.dependency_overrides = {
+        get_storage: override_storage,
+        get_cache: override_cache,
+        get_cache_creator: override_cache_creator,
+        get_single_flight: override_single_flight,
+    }
+    return storage
+
+
+async def drive(requests: list[tuple[str, str, str]], concurrency: int) -> tuple[dict[str, list], dict[str, int], float]:
+    """Выполняет запросы concurrency параллельными клиентами. Возвращает латентности и ошибки по ручкам и время"""
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    queue = iter(requests)
+
+    async def client():
+        for endpoint, path, query_string in queue:
+            started = time.perf_counter()
+            status = await call(path, query_string)
+            latencies[endpoint].append(time.perf_counter() - started)
+            if status >= 500:
+                errors[endpoint] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Перцентиль по ближайшему рангу"""
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+def summarize(endpoint: str, latencies: list[float], errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        'endpoint': endpoint,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+async def run(args) -> dict:
+    indexes = load_indexes()
+    results = []
+    for cache_state in args.cache_states:
+        for concurrency in args.concurrency:
+            requests = Traffic(indexes, args.seed).generate(args.requests)
+            storage = setup(cache_state, indexes, args.storage_latency / 1000, args.cache_latency / 1000)
+            if cache_state == 'warm':
+                await drive(requests, concurrency)
+            storage.calls = 0
+
+            latencies, errors, elapsed = await drive(requests, concurrency)
+            run_info = {'cache_state': cache_state, 'concurrency': concurrency, 'storage_calls': storage.calls}
+            for endpoint in sorted(latencies):
+                results.append({**run_info, **summarize(endpoint, latencies[endpoint], errors[endpoint], elapsed)})
+            all_latencies = [latency for values in latencies.values() for latency in values]
+            results.append({**run_info, **summarize('all', all_latencies, sum(errors.values()), elapsed)})
+    app.dependency_overrides = {}
+    return {
+        'config': {
+            'requests': args.requests,
+            'storage_latency_ms': args.storage_latency,
+            'cache_latency_ms': args.cache_latency,
+            'seed': args.seed,
+            'local_cache_enabled': settings.LOCAL_CACHE_ENABLED,
+            'response_cache_enabled': settings.RESPONSE_CACHE_ENABLED,
+            'cache_codec': settings.CACHE_CODEC,
+        },
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50], help='число параллельных клиентов')
+    parser.add_argument('--requests', type=int, default=2000, help='запросов в каждом прогоне')
+    parser.add_argument('--storage-latency', type=float, default=5, help='задержка хранилища, мс')
+    parser.add_argument('--cache-latency', type=float, default=0.5, help='задержка кеша, мс')
+    parser.add_argument('--cache-states', nargs='+', choices=CACHE_STATES, default=list(CACHE_STATES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='вывести результаты в JSON')
+    parser.add_argument('--output', help='записать результаты в JSON-файл')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    if args.output:
+        with open(args.output, 'w') as fo:
+            json.dump(report, fo, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{'cache':<7}{'conc':>5}  {'endpoint':<17}{'requests':>9}{'errors':>7}{'rps':>10}"
+          f"{'p50, ms':>9}{'p95, ms':>9}{'p99, ms':>9}")
+    for res in report['results']:
+        print(f"{res['cache_state']:<7}{res['concurrency']:>5}  {res['endpoint']:<17}{res['requests']:>9}"
+              f"{res['errors']:>7}{res['rps']:>10.0f}{res['p50_ms']:>9.2f}{res['p95_ms']:>9.2f}{res['p99_ms']:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
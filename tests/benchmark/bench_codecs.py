@@ -0,0 +1,77 @@
+"""
+Сравнение кодеков значений кеша на данных из tests/functional/testdata:
+время кодирования/декодирования одной записи и её размер в байтах.
+
+Запуск из корня репозитория:
+    python tests/benchmark/bench_codecs.py [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from db.codecs import CODECS, CacheSerializer  # noqa: E402
+
+TESTDATA = os.path.join(ROOT, 'tests', 'functional', 'testdata')
+
+
+def load_entries() -> dict[str, list]:
+    """Записи, как они лежат в кеше: фильм, страница из 50 фильмов, персона, список жанров"""
+    with open(os.path.join(TESTDATA, 'movies.json')) as fi:
+        films = json.load(fi)[1::2]
+    with open(os.path.join(TESTDATA, 'real_persons.json')) as fi:
+        persons = json.load(fi)
+    with open(os.path.join(TESTDATA, 'real_genres.json')) as fi:
+        genres = json.load(fi)
+    return {
+        'film': films,
+        'film_list': [films[i:i + 50] for i in range(0, len(films), 50)],
+        'person': persons,
+        'genre_list': [genres],
+    }
+
+
+def bench(serializer: CacheSerializer, entries: list, number: int) -> dict:
+    encoded = [serializer.dumps(entry) for entry in entries]
+    encode = timeit.timeit(lambda: [serializer.dumps(entry) for entry in entries], number=number)
+    decode = timeit.timeit(lambda: [serializer.loads(data) for data in encoded], number=number)
+    total = number * len(entries)
+    return {
+        'bytes': sum(len(data) for data in encoded) / len(entries),
+        'encode_us': encode / total * 1e6,
+        'decode_us': decode / total * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--json', action='store_true', help='вывести результаты в JSON')
+    parser.add_argument('--number', type=int, default=200, help='повторов на каждую запись')
+    args = parser.parse_args()
+
+    results = []
+    for kind, entries in load_entries().items():
+        for codec_name in CODECS:
+            try:
+                serializer = CacheSerializer(codec_name)
+            except ImportError as exc:
+                print(f'skip {codec_name}: {exc}', file=sys.stderr)
+                continue
+            results.append({'entry': kind, 'codec': codec_name, **bench(serializer, entries, args.number)})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'entry':<12}{'codec':<14}{'bytes':>10}{'encode, us':>12}{'decode, us':>12}")
+    for res in results:
+        print(f"{res['entry']:<12}{res['codec']:<14}{res['bytes']:>10.0f}"
+              f"{res['encode_us']:>12.1f}{res['decode_us']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Мёрджер фильмов ETL: декартово произведение фильмов, персон и жанров с группировкой в Python
+(transform_film_work) против одной строки на фильм с массивами, собранными в SQL json_agg
+(transform_film_work_aggregated).
+
+Строки обоих мёрджеров строятся из фильмов tests/functional/testdata в том виде, в каком их
+отдаёт psycopg2: для декартова произведения - по строке на каждую пару (персона с ролью, жанр),
+для json_agg - JSON-текст массивов, который разбирается json.loads, как это делает psycopg2,
+и этот разбор входит в замер. Сравниваются число строк и объём данных, переданных из Postgres
+(длина текстового представления значений), и процессорное время трансформации.
+
+Запуск из корня репозитория:
+    python tests/benchmark/bench_etl_transform.py [--copies 20] [--repeat 5] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from uuid import uuid4
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'etl'))
+
+from transform import transform_film_work, transform_film_work_aggregated  # noqa: E402
+
+TESTDATA = os.path.join(ROOT, 'tests', 'functional', 'testdata')
+ROLES = {'actors': 'actor', 'writers': 'writer', 'directors': 'director'}
+
+
+def load_films(copies: int) -> list[dict]:
+    """Фильмы тестовых данных, размноженные copies раз с новыми айди"""
+    with open(os.path.join(TESTDATA, 'movies.json')) as fi:
+        films = json.load(fi)[1::2]
+    return [{**film, 'uuid': str(uuid4())} for _ in range(copies) for film in films]
+
+
+def cartesian_rows(films: list[dict]) -> list[dict]:
+    """Строки SQL с LEFT JOIN персон и жанров, упорядоченные по айди фильма"""
+    rows = []
+    for film in sorted(films, key=lambda film: film['uuid']):
+        base = {
+            'fw_uuid': film['uuid'],
+            'title': film['title'],
+            'description': film['description'],
+            'rating': film['imdb_rating'],
+            'type': 'movie',
+            'created_at': '2021-06-16 20:14:09.221838+00',
+            'updated_at': '2021-06-16 20:14:09.221855+00',
+        }
+        persons = [
+            {'role': role, 'person_uuid': person['uuid'], 'full_name': person['full_name']}
+            for collection, role in ROLES.items() for person in film[collection]
+        ] or [{'role': None, 'person_uuid': None, 'full_name': None}]
+        genres = [
+            {'genre_uuid': genre['uuid'], 'name': genre['name']} for genre in film['genre']
+        ] or [{'genre_uuid': None, 'name': None}]
+        rows.extend({**base, **person, **genre} for person in persons for genre in genres)
+    return rows
+
+
+def aggregated_rows(films: list[dict]) -> list[dict]:
+    """Строки SQL с json_agg: JSON-колонки приходят текстом, как по протоколу Postgres"""
+    rows = []
+    for film in sorted(films, key=lambda film: film['uuid']):
+        row = {
+            'fw_uuid': film['uuid'],
+            'title': film['title'],
+            'description': film['description'],
+            'rating': film['imdb_rating'],
+            'genre': json.dumps(film['genre']) if film['genre'] else None,
+        }
+        for collection in ROLES:
+            row[collection] = json.dumps(film[collection]) if film[collection] else None
+        rows.append(row)
+    return rows
+
+
+def parse_aggregated(rows: list[dict]):
+    """Разбор JSON-колонок, который psycopg2 выполняет при чтении строк"""
+    for row in rows:
+        yield {
+            **row,
+            **{column: json.loads(row[column]) if row[column] else None for column in ('genre', *ROLES)},
+        }
+
+
+def transferred_bytes(rows: list[dict]) -> int:
+    return sum(len(str(value)) for row in rows for value in row.values() if value is not None)
+
+
+def measure(transform, rows: list[dict], repeat: int) -> tuple[float, list]:
+    """Лучшее из repeat процессорное время трансформации всех строк, секунды"""
+    best, items = None, None
+    for _ in range(repeat):
+        started = time.process_time()
+        items = list(transform(rows))
+        elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, items
+
+
+def signature(item) -> tuple:
+    """Содержимое документа без учёта порядка персон и жанров"""
+    return (
+        item.uuid, item.title, item.imdb_rating, item.description,
+        frozenset((genre.uuid, genre.name) for genre in item.genre),
+        *(frozenset((person.uuid, person.full_name) for person in getattr(item, collection)) for collection in ROLES),
+    )
+
+
+def run(args) -> dict:
+    films = load_films(args.copies)
+    cartesian = cartesian_rows(films)
+    aggregated = aggregated_rows(films)
+
+    cartesian_cpu, cartesian_items = measure(transform_film_work, cartesian, args.repeat)
+    aggregated_cpu, aggregated_items = measure(
+        lambda rows: transform_film_work_aggregated(parse_aggregated(rows)), aggregated, args.repeat,
+    )
+    if {signature(item) for item in cartesian_items} != {signature(item) for item in aggregated_items}:
+        raise AssertionError('transformers produced different documents')
+
+    return {
+        'films': len(films),
+        'results': [
+            {
+                'approach': name,
+                'rows': len(rows),
+                'transferred_kb': transferred_bytes(rows) / 1024,
+                'transform_cpu_ms': cpu * 1000,
+                'per_film_us': cpu / len(films) * 1e6,
+            }
+            for name, rows, cpu in (
+                ('cartesian', cartesian, cartesian_cpu),
+                ('json_agg', aggregated, aggregated_cpu),
+            )
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--copies', type=int, default=20, help='во сколько раз размножить тестовые фильмы')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='вывести результаты в JSON')
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"films: {report['films']}")
+    print(f"{'approach':<11}{'rows':>9}{'transferred, KB':>17}{'transform CPU, ms':>19}{'per film, us':>14}")
+    for res in report['results']:
+        print(f"{res['approach']:<11}{res['rows']:>9}{res['transferred_kb']:>17.0f}"
+              f"{res['transform_cpu_ms']:>19.1f}{res['per_film_us']:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Сборка тела запроса к ES: словарь, собираемый на каждый запрос и сериализуемый клиентом
+(json.dumps, как JSONSerializer elasticsearch-py), против шаблонов db/queries.py.
+Время на одно тело запроса в микросекундах. То, что шаблоны дают те же запросы,
+проверяется в tests/unit/test_queries.py.
+
+Запуск из корня репозитория:
+    python tests/benchmark/bench_queries.py [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from uuid import uuid4
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from db.queries import FILM_SEARCH_PAGE, FILMS_BY_GENRE_PAGE, PERSON_FILMS, get_sort  # noqa: E402
+
+SOURCE = ['uuid', 'title', 'imdb_rating']
+
+
+def dumps(body: dict) -> str:
+    return json.dumps(body, default=str, ensure_ascii=False, separators=(',', ':'))
+
+
+def nested_term(path: str, value) -> dict:
+    return {'nested': {'path': path, 'query': {'bool': {'should': [{'term': {f'{path}.uuid': value}}]}}}}
+
+
+def build_sort(sort: str) -> list:
+    order = 'desc' if sort.startswith('-') else 'asc'
+    return [{sort.lstrip('-'): {'order': order}}, {'uuid': {'order': 'asc'}}]
+
+
+def dict_person_films(person_id) -> str:
+    return dumps({
+        '_source': SOURCE,
+        'query': {'bool': {'should': [nested_term(path, person_id) for path in ('actors', 'writers', 'directors')]}},
+    })
+
+
+def dict_films_by_genre(genre_id) -> str:
+    return dumps({
+        '_source': SOURCE,
+        'query': {'bool': {'must': [nested_term('genre', genre_id)]}},
+        'sort': build_sort('-imdb_rating'),
+        'from': 50,
+        'size': 50,
+    })
+
+
+def dict_film_search(query: str) -> str:
+    return dumps({
+        '_source': SOURCE,
+        'query': {'bool': {'should': [{'match': {'title': query}}, {'match': {'description': query}}]}},
+        'sort': build_sort('-imdb_rating'),
+        'from': 50,
+        'size': 50,
+    })
+
+
+def template_person_films(person_id) -> bytes:
+    return PERSON_FILMS.render({'source': SOURCE, 'person': person_id})
+
+
+def template_films_by_genre(genre_id) -> bytes:
+    params = {'source': SOURCE, 'genre': genre_id, 'sort': get_sort('-imdb_rating', 'film'), 'from': 50, 'size': 50}
+    return FILMS_BY_GENRE_PAGE.render(params)
+
+
+def template_film_search(query: str) -> bytes:
+    params = {'source': SOURCE, 'query': query, 'sort': get_sort('-imdb_rating', 'film'), 'from': 50, 'size': 50}
+    return FILM_SEARCH_PAGE.render(params)
+
+
+CASES = {
+    'person_films': (dict_person_films, template_person_films, uuid4()),
+    'films_by_genre': (dict_films_by_genre, template_films_by_genre, uuid4()),
+    'film_search': (dict_film_search, template_film_search, 'star wars'),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--json', action='store_true', help='вывести результаты в JSON')
+    parser.add_argument('--number', type=int, default=50000, help='повторов на каждый запрос')
+    args = parser.parse_args()
+
+    results = []
+    for name, (build_dict, build_template, value) in CASES.items():
+        dict_time = timeit.timeit(lambda: build_dict(value), number=args.number)
+        template_time = timeit.timeit(lambda: build_template(value), number=args.number)
+        results.append({
+            'query': name,
+            'dict_us': dict_time / args.number * 1e6,
+            'template_us': template_time / args.number * 1e6,
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'query':<16}{'dict, us':>10}{'template, us':>14}{'speedup':>10}")
+    for res in results:
+        print(f"{res['query']:<16}{res['dict_us']:>10.2f}{res['template_us']:>14.2f}"
+              f"{res['dict_us'] / res['template_us']:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
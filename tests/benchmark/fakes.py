@@ -0,0 +1,262 @@
+"""
+In-memory замены хранилища, кеша и их окружения для бенчмарков API.
+Данные берутся из tests/functional/testdata, задержка бэкендов имитируется asyncio.sleep.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import defaultdict
+from typing import Any, Optional, Union
+from uuid import UUID
+
+from core.config import settings
+from db.elastic import decode_cursor, encode_cursor
+from db.redis import RedisCreator, RedisStorage
+from db.single_flight import SingleFlight
+from db.storage import AbstractCache, AbstractStorage
+from models import BaseModel
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+TESTDATA = os.path.join(ROOT, 'tests', 'functional', 'testdata')
+
+ROLES = ('actors', 'writers', 'directors')
+
+
+def load_indexes() -> dict[str, dict[str, dict]]:
+    """Документы индексов movies, persons и genres в том виде, в каком их загружает ETL"""
+    with open(os.path.join(TESTDATA, 'movies.json')) as fi:
+        films = json.load(fi)[1::2]
+    with open(os.path.join(TESTDATA, 'real_genres.json')) as fi:
+        genres = {genre['uuid']: genre for genre in json.load(fi)}
+
+    persons = {}
+    for film in films:
+        for genre in film['genre']:
+            genres.setdefault(genre['uuid'], genre)
+        for role in ROLES:
+            for person in film[role]:
+                doc = persons.setdefault(person['uuid'], {
+                    'uuid': person['uuid'], 'full_name': person['full_name'], 'role': role[:-1], 'film_ids': [],
+                })
+                if film['uuid'] not in doc['film_ids']:
+                    doc['film_ids'].append(film['uuid'])
+    return {
+        'movies': {film['uuid']: film for film in films},
+        'persons': persons,
+        'genres': genres,
+    }
+
+
+class MemoryStorage(AbstractStorage):
+    """Хранилище поверх словарей с той же семантикой выдачи, что у ElasticStorage"""
+
+    def __init__(self, indexes: dict[str, dict[str, dict]], latency: float):
+        self.indexes = indexes
+        self.latency = latency
+        self.calls = 0
+
+    async def request(self):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    @staticmethod
+    def sort_docs(docs: list[dict], sort: Optional[str], field_by_param: dict[str, str]) -> list[dict]:
+        docs = sorted(docs, key=lambda doc: doc['uuid'])
+        field = field_by_param.get((sort or '').lstrip('-'))
+        if field:
+            docs.sort(key=lambda doc: (doc.get(field) is None, doc.get(field) or 0), reverse=sort.startswith('-'))
+        return docs
+
+    @staticmethod
+    def page(docs: list[dict], model, parameters: dict) -> list[BaseModel]:
+        start = (parameters['page_number'] - 1) * parameters['page_size']
+        return [model(**doc) for doc in docs[start:start + parameters['page_size']]]
+
+    @staticmethod
+    def page_after(docs: list[dict], model, parameters: dict) -> tuple[list[BaseModel], Optional[str]]:
+        start = decode_cursor(parameters['cursor'])['search_after'][0] if parameters['cursor'] else 0
+        end = start + parameters['page_size']
+        next_cursor = encode_cursor({'search_after': [end]}) if end < len(docs) else None
+        return [model(**doc) for doc in docs[start:end]], next_cursor
+
+    def films(self, filter_genre: Optional[UUID], sort: Optional[str]) -> list[dict]:
+        docs = self.indexes['movies'].values()
+        if filter_genre:
+            docs = [doc for doc in docs if any(genre['uuid'] == str(filter_genre) for genre in doc['genre'])]
+        return self.sort_docs(list(docs), sort, {'imdb_rating': 'imdb_rating'})
+
+    def film_search(self, query: str, sort: Optional[str]) -> list[dict]:
+        words = query.lower().split()
+        docs = [
+            doc for doc in self.indexes['movies'].values()
+            if any(word in f"{doc['title']} {doc.get('description') or ''}".lower() for word in words)
+        ]
+        return self.sort_docs(docs, sort, {'imdb_rating': 'imdb_rating'})
+
+    def person_search(self, query: str, sort: Optional[str]) -> list[dict]:
+        words = query.lower().split()
+        docs = [doc for doc in self.indexes['persons'].values() if any(word in doc['full_name'].lower() for word in words)]
+        return self.sort_docs(docs, sort, {'full_name': 'full_name'})
+
+    async def get_data_by_id(self, index: str, id: UUID, model):
+        await self.request()
+        doc = self.indexes[index].get(str(id))
+        return model(**doc) if doc else None
+
+    async def get_data_by_ids(self, index: str, ids: list[UUID], model):
+        if not ids:
+            return []
+        await self.request()
+        docs = [self.indexes[index].get(str(id)) for id in ids]
+        return [model(**doc) if doc else None for doc in docs]
+
+    async def get_data_list_by_id(self, index: str, id: UUID, model, parameters: dict = None):
+        await self.request()
+        return self.page(self.films(id, parameters['sort']), model, parameters)
+
+    async def get_data_list_by_cursor(self, index: str, id: UUID, model, parameters: dict):
+        await self.request()
+        return self.page_after(self.films(id, parameters['sort']), model, parameters)
+
+    async def get_data_by_query(self, index: str, query: str, model, parameters: dict = None):
+        await self.request()
+        return self.page(self.film_search(query, parameters['sort']), model, parameters)
+
+    async def get_data_by_query_cursor(self, index: str, query: str, model, parameters: dict):
+        await self.request()
+        return self.page_after(self.film_search(query, parameters['sort']), model, parameters)
+
+    def person_films(self, person_id: UUID, model) -> list[BaseModel]:
+        person_id = str(person_id)
+        docs = [
+            doc for doc in self.indexes['movies'].values()
+            if any(person['uuid'] == person_id for role in ROLES for person in doc[role])
+        ]
+        # Как в ES без size: первые 10 попаданий
+        return [model(**doc) for doc in docs[:10]]
+
+    async def get_person_films_from_elastic(self, index: str, person_id: UUID, model):
+        await self.request()
+        return self.person_films(person_id, model)
+
+    async def get_persons_films_from_elastic(self, index: str, person_ids: list[UUID], model):
+        if not person_ids:
+            return []
+        await self.request()
+        return [self.person_films(person_id, model) for person_id in person_ids]
+
+    async def get_person_search_from_elastic(self, index: str, query: str, model, parameters: dict = None):
+        await self.request()
+        return self.page(self.person_search(query, parameters['sort']), model, parameters)
+
+    async def get_person_search_by_cursor(self, index: str, query: str, model, parameters: dict):
+        await self.request()
+        return self.page_after(self.person_search(query, parameters['sort']), model, parameters)
+
+    async def get_all_from_elastic(self, index: str, model):
+        await self.request()
+        return [model(**doc) for doc in list(self.indexes[index].values())[:1000]]
+
+
+class MemoryCache(AbstractCache):
+    """
+    Кеш в словаре с TTL. Значения кодируются тем же сериализатором, что и в Redis,
+    чтобы в замеры попадала цена кодирования. enabled=False - кеш, который ничего не хранит.
+    """
+
+    def __init__(self, latency: float, enabled: bool = True):
+        self.latency = latency
+        self.enabled = enabled
+        # key -> (expires_at, stale_at, data)
+        self.entries: dict[str, tuple[float, float, bytes]] = {}
+
+    async def request(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def read(self, key: str) -> Optional[tuple[float, float, bytes]]:
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry
+
+    def write(self, key: str, data: bytes, expire: float, stale_ttl: float = 0):
+        if self.enabled:
+            now = time.monotonic()
+            self.entries[key] = (now + expire + stale_ttl, now + expire, data)
+
+    async def get_data(self, key: str, model, as_list: bool = False):
+        await self.request()
+        entry = self.read(key)
+        return RedisStorage.parse(entry[2], model, as_list) if entry else None
+
+    async def put_data(
+            self, key: str, data: Union[BaseModel, list[BaseModel]], as_list: bool = False,
+            expire: int = 300, stale_ttl: int = 0
+    ):
+        await self.request()
+        self.write(key, RedisStorage.dump(data), expire, stale_ttl)
+
+    async def get_entry(
+            self, key: str, model, as_list: bool = False, stale_ttl: int = 0, grace_ttl: int = 0, degraded: bool = False
+    ) -> tuple[Optional[Any], bool]:
+        await self.request()
+        entry = self.read(key)
+        if not entry:
+            return None, False
+        if entry[0] - time.monotonic() < grace_ttl and not degraded:
+            return None, False
+        return RedisStorage.parse(entry[2], model, as_list), entry[1] <= time.monotonic()
+
+    async def get_many(self, keys: list[str], model, as_list: bool = False):
+        if not keys:
+            return []
+        await self.request()
+        entries = [self.read(key) for key in keys]
+        return [RedisStorage.parse(entry[2], model, as_list) if entry else None for entry in entries]
+
+    async def put_many(
+            self, items: dict[str, Union[BaseModel, list[BaseModel]]], expire: int = 300, stale_ttl: int = 0
+    ):
+        if not items:
+            return
+        await self.request()
+        for key, data in items.items():
+            self.write(key, RedisStorage.dump(data), expire, stale_ttl)
+
+    async def delete(self, keys: list[str]):
+        await self.request()
+        for key in keys:
+            self.entries.pop(key, None)
+
+    async def get_raw(self, key: str) -> Optional[bytes]:
+        await self.request()
+        entry = self.read(key)
+        return entry[2] if entry else None
+
+    async def put_raw(self, key: str, data: bytes, expire: int = 300):
+        await self.request()
+        self.write(key, data, expire)
+
+
+class MemoryKeyCreator(RedisCreator):
+    """Ключи как у RedisCreator, но поколения пространств имён хранятся в процессе"""
+
+    def __init__(self):
+        self.generations: defaultdict[str, str] = defaultdict(lambda: '0')
+
+    async def get_prefix(self, namespace: str) -> str:
+        return f"{namespace}:v{settings.CACHE_SCHEMA_VERSION}:g{self.generations[namespace]}"
+
+    async def bump_generation(self, namespace: str, stream_id: str):
+        self.generations[namespace] = stream_id
+
+
+class LocalSingleFlight(SingleFlight):
+    """Схлопывание промахов только внутри процесса: в бенчмарке один воркер и нет Redis"""
+
+    async def _do_across_workers(self, key, fetch, read_cache):
+        self.count('leader')
+        return await fetch()
@@ -46,6 +46,15 @@ async def session(event_loop):
     yield session
     await session.close()
 
+@pytest.fixture
+def make_cache_key(redis_client):
+    # Поколение пространства имён читается из Redis: его увеличивают события ETL,
+    # поэтому нулевым после flushall оно может и не остаться
+    async def inner(namespace: str, key: str) -> str:
+        generation = await redis_client.get(f'generation:{namespace}')
+        return f'{namespace}:v{test_settings.cache_schema_version}:g{(generation or b"0").decode()}:{key}'
+    return inner
+
 @pytest.fixture
 def make_get_request(session):
     async def inner(method: str, params: dict = None) -> HTTPResponse:
@@ -13,6 +13,17 @@ def fake_film_data():
     return new_data
 
 
+@pytest.fixture
+async def incomplete_film_data(es_client):
+    """Фильм без описания, жанров и участников, добавленный в индекс на время теста"""
+    new_uuid = str(uuid.uuid4())
+    new_data = {'uuid': new_uuid, 'title': 'Test film without description', 'imdb_rating': None,
+                'description': None, 'genre': None, 'actors': None, 'writers': None, 'directors': None}
+    await es_client.index(index='movies', id=new_uuid, body=new_data, refresh='wait_for')
+    yield new_data
+    await es_client.delete(index='movies', id=new_uuid, refresh='wait_for')
+
+
 @pytest.fixture
 def real_film_data():
     with open('testdata/real_films.json', 'r') as fi:
@@ -10,8 +10,11 @@ def wrong_search_query():
 @pytest.fixture
 def fake_search_query():
     query = 'newquery'
-    new_cache_key = f"film-search-{query}-None-50-1"
     new_cache_data= [{"uuid": str(uuid.uuid4()),
                       "title":"newquery",
                       "imdb_rating":1.1}]
-    return query, new_cache_key, new_cache_data
+    # Поиск фильмов кешируется окнами айди, а сами фильмы - по айди в урезанном виде.
+    # Записи заданы парами (пространство имён, ключ): полный ключ зависит от текущего поколения
+    new_cache_entries = {('film-window', f'search-{query}-None-200-0'): {"ids": [new_cache_data[0]["uuid"]]},
+                         ('filmshort', new_cache_data[0]['uuid']): new_cache_data[0]}
+    return query, new_cache_entries, new_cache_data
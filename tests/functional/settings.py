@@ -5,6 +5,7 @@ class TestSettings(BaseSettings):
     es_host: str = Field('127.0.0.1:9200', env='ELASTIC_HOST')
     redis_host: str = Field('127.0.0.1:6379', env='REDIS_HOST')
     service_url: str = Field('127.0.0.1:8000', env='SERVICE_URL')
+    cache_schema_version: int = Field(1, env='CACHE_SCHEMA_VERSION')
 
     class Config:
         env_file = '.env'
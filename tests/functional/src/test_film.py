@@ -52,8 +52,29 @@ async def test_list_films(make_get_request):
     assert response.status == HTTPStatus.OK
     assert len(response.body) == 50
 
+### Пакетный запрос фильмов по айди ###
 @pytest.mark.asyncio
-async def test_film_cached(fake_film_data, make_get_request, redis_client):
+async def test_films_batch(real_film_data, fake_film_data, make_get_request):
+    ids = [real_film_data.get('uuid'), fake_film_data.get('uuid')]
+    response = await make_get_request(f'{FILM_PATH}/batch', [('ids', film_id) for film_id in ids])
+
+    assert response.status == HTTPStatus.OK
+    assert len(response.body) == 1
+    assert response.body[0].get('title') == real_film_data.get('title')
+
+@pytest.mark.asyncio
+async def test_films_batch_with_incomplete_film(real_film_data, incomplete_film_data, make_get_request):
+    ids = [real_film_data.get('uuid'), incomplete_film_data.get('uuid')]
+    response = await make_get_request(f'{FILM_PATH}/batch', [('ids', film_id) for film_id in ids])
+
+    assert response.status == HTTPStatus.OK
+    assert len(response.body) == 2
+    incomplete = next(film for film in response.body if film['uuid'] == incomplete_film_data.get('uuid'))
+    assert incomplete['description'] is None
+    assert incomplete['genre'] == incomplete['actors'] == incomplete['writers'] == incomplete['directors'] == []
+
+@pytest.mark.asyncio
+async def test_film_cached(fake_film_data, make_get_request, make_cache_key, redis_client):
     await redis_client.flushall()
 
     # check query not return anything
@@ -63,7 +84,7 @@ async def test_film_cached(fake_film_data, make_get_request, redis_client):
 
     # add data to cache
     new_cache_json = json.dumps(fake_film_data)
-    await redis_client.set(new_uuid, new_cache_json)
+    await redis_client.set(await make_cache_key('film', new_uuid), new_cache_json)
 
     # try again
     response = await make_get_request(f'{FILM_PATH}/{new_uuid}', {})
@@ -71,4 +92,26 @@ async def test_film_cached(fake_film_data, make_get_request, redis_client):
     assert len(response.body) > 0
     assert response.body == fake_film_data
 
-    await redis_client.delete(new_uuid)
+    await redis_client.delete(await make_cache_key('film', new_uuid))
+
+### Постраничная выдача фильмов по курсору ###
+@pytest.mark.asyncio
+async def test_list_films_by_cursor(make_get_request):
+    response = await make_get_request(f'{FILM_PATH}/', {'page[size]': 50,
+                                                        'page[cursor]': ''})
+    assert response.status == HTTPStatus.OK
+    assert len(response.body) == 50
+    next_cursor = response.headers.get('X-Next-Cursor')
+    assert next_cursor
+
+    next_response = await make_get_request(f'{FILM_PATH}/', {'page[size]': 50,
+                                                             'page[cursor]': next_cursor})
+    assert next_response.status == HTTPStatus.OK
+    assert not {f['uuid'] for f in response.body} & {f['uuid'] for f in next_response.body}
+
+@pytest.mark.asyncio
+async def test_list_films_invalid_cursor(make_get_request):
+    response = await make_get_request(f'{FILM_PATH}/', {'page[cursor]': 'wrong'})
+
+    assert response.status == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert response.body == {'detail': 'invalid cursor'}
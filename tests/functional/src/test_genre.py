@@ -35,9 +35,24 @@ async def test_genre_by_uuid_incorrect(make_get_request):
     assert response.body == {"detail": [{"loc": ["path", "genre_id"], "msg": "value is not a valid uuid", "type": "type_error.uuid"}]}
 
 @pytest.mark.asyncio
-async def test_redis(fake_genre_data, make_get_request, redis_client):
+async def test_redis(fake_genre_data, make_get_request, make_cache_key, redis_client):
     await redis_client.flushall()
-    await redis_client.set(fake_genre_data.get('uuid'), json.dumps(fake_genre_data))
+    key = await make_cache_key('genre', fake_genre_data.get('uuid'))
+    await redis_client.set(key, json.dumps(fake_genre_data))
     response = await make_get_request(GENRE_PATH + fake_genre_data.get('uuid'), {})
     assert response.body == fake_genre_data
-    await redis_client.delete(fake_genre_data.get('uuid'))
+    await redis_client.delete(key)
+
+@pytest.mark.asyncio
+async def test_genres_batch(real_genre_data, fake_genre_data, make_get_request):
+    genres = real_genre_data[:3]
+    ids = [genre['uuid'] for genre in genres] + [fake_genre_data['uuid']]
+    response = await make_get_request(GENRE_PATH + 'batch', [('ids', genre_id) for genre_id in ids])
+    assert response.status == HTTPStatus.OK
+    assert response.body == genres
+
+@pytest.mark.asyncio
+async def test_genres_batch_absent(fake_genre_data, make_get_request):
+    response = await make_get_request(GENRE_PATH + 'batch', [('ids', fake_genre_data['uuid'])])
+    assert response.status == HTTPStatus.NOT_FOUND
+    assert response.body == {'detail': 'genres not found'}
@@ -82,9 +82,18 @@ async def test_person_by_uuid_incorrect(make_get_request):
 
 
 @pytest.mark.asyncio
-async def test_redis(fake_person_data, redis_client, make_get_request):
+async def test_redis(fake_person_data, redis_client, make_get_request, make_cache_key):
     await redis_client.flushall()
-    await redis_client.set(fake_person_data.get('uuid'), json.dumps(fake_person_data))
+    key = await make_cache_key('person', fake_person_data.get('uuid'))
+    await redis_client.set(key, json.dumps(fake_person_data))
     response = await make_get_request(PERSON_PATH + fake_person_data.get('uuid'))
     assert response.body == fake_person_data
-    await redis_client.delete(fake_person_data.get('uuid'))
+    await redis_client.delete(key)
+
+@pytest.mark.asyncio
+async def test_persons_batch(real_person_data, fake_person_data, make_get_request):
+    ids = [person['uuid'] for person in real_person_data] + [fake_person_data['uuid']]
+    response = await make_get_request(PERSON_PATH + 'batch', [('ids', person_id) for person_id in ids])
+    assert response.status == HTTPStatus.OK
+    assert [person['uuid'] for person in response.body] == [person['uuid'] for person in real_person_data]
+    assert response.body[0]['full_name'] == real_person_data[0]['full_name']
@@ -49,17 +49,19 @@ async def test_search_not_found(wrong_search_query, make_get_request):
 
 
 @pytest.mark.asyncio
-async def test_search_cached(fake_search_query, make_get_request, redis_client):
+async def test_search_cached(fake_search_query, make_get_request, make_cache_key, redis_client):
     await redis_client.flushall()
 
     # check query not return anything
-    query, new_cache_key, new_cache_data = fake_search_query
+    query, new_cache_entries, new_cache_data = fake_search_query
     response = await make_get_request(SEARCH_PATH, {'query': query})
     assert response.status == HTTPStatus.NOT_FOUND
 
     # add data to cache
-    new_cache_json = json.dumps(new_cache_data)
-    await redis_client.set(new_cache_key, new_cache_json)
+    keys = []
+    for (namespace, key), value in new_cache_entries.items():
+        keys.append(await make_cache_key(namespace, key))
+        await redis_client.set(keys[-1], json.dumps(value))
 
     # try again
     response = await make_get_request(SEARCH_PATH, {'query': query})
@@ -67,5 +69,5 @@ async def test_search_cached(fake_search_query, make_get_request, redis_client):
     assert len(response.body) == 1
     assert response.body == new_cache_data
 
-    await redis_client.delete(new_cache_key)
+    await redis_client.delete(*keys)
 
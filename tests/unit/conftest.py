@@ -0,0 +1,22 @@
+"""
+Юнит-тесты API и ETL без внешних сервисов: Postgres, ES и Redis заменены заглушками.
+
+Запуск из tests/unit:
+    pip install -r requirements.txt
+    pytest
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SRC = os.path.join(ROOT, 'src')
+ETL = os.path.join(SRC, 'etl')
+sys.path[:0] = [SRC, ETL]
+
+# Конфиг ETL читает config.json из текущей директории при импорте модуля
+cwd = os.getcwd()
+os.chdir(ETL)
+try:
+    import config  # noqa: E402,F401
+finally:
+    os.chdir(cwd)
@@ -0,0 +1,117 @@
+import json
+from uuid import UUID, uuid4
+
+import pytest
+
+from bloom import BloomBuilder, BloomFilter as ETLBloomFilter
+from config import config
+from db import redis as redis_db
+from db.bloom import BloomFilter, BloomFilters
+
+
+class FakeDB:
+    def __init__(self, ids: list[str]):
+        self.ids = ids
+
+    def fetch(self, query: str, args: tuple) -> list[tuple]:
+        return [(pk,) for pk in self.ids]
+
+
+class FakePublisher:
+    def __init__(self, stream_id: str):
+        self.stream_id = stream_id
+        self.saved: dict[str, tuple[bytes, str]] = {}
+
+    def last_stream_id(self) -> str:
+        return self.stream_id
+
+    def save_bloom(self, index: str, data: bytes, stream_id: str):
+        self.saved[index] = data, stream_id
+
+
+class FakeRedis:
+    """Хеш фильтра и поток инвалидации, как их видит API"""
+
+    def __init__(self, bloom: dict[bytes, bytes], messages: list[tuple[str, str, list[str]]]):
+        self.bloom = bloom
+        self.messages = [
+            (message_id.encode(), {b'index': index.encode(), b'ids': json.dumps(ids).encode()})
+            for message_id, index, ids in messages
+        ]
+
+    async def hgetall(self, key: str) -> dict:
+        return self.bloom
+
+    async def xrange(self, stream: str, start: str = '-', count: int = None) -> list:
+        messages = self.messages
+        if start != '-':
+            messages = [message for message in messages if message[0].decode() >= start]
+        return messages[:count] if count else messages
+
+
+def build(ids: list[str], stream_id: str) -> tuple[bytes, str]:
+    bloom_settings = config.bloom.copy(deep=True)
+    bloom_settings.filters = [filter_settings for filter_settings in bloom_settings.filters
+                              if filter_settings.index == 'genres']
+    bloom_settings.fpr_samples = 100
+    publisher = FakePublisher(stream_id)
+    BloomBuilder(bloom_settings, db=FakeDB(ids), publisher=publisher).build()
+    return publisher.saved['genres']
+
+
+def test_api_reads_filter_built_by_etl():
+    ids = [str(uuid4()) for _ in range(200)]
+    data, stream_id = build(ids, '5-0')
+    bloom = BloomFilter.from_bytes(data)
+
+    assert stream_id == '5-0'
+    assert all(pk in bloom for pk in ids)
+    false_positives = sum(str(uuid4()) in bloom for _ in range(1000))
+    assert false_positives < 1000 * config.bloom.error_rate * 10
+
+
+def test_filter_capacity_matches_error_rate():
+    bloom = ETLBloomFilter.for_capacity(1000, 0.01)
+    assert bloom.size >= 1000 * 9
+    assert bloom.hash_count == 7
+
+
+async def load(monkeypatch, stream_id: str, messages: list) -> BloomFilters:
+    data, _ = build([str(UUID(int=1))], stream_id)
+    bloom_filters = BloomFilters(refresh_interval=60)
+    monkeypatch.setattr(
+        redis_db, 'redis',
+        FakeRedis({b'filter': data, b'stream_id': stream_id.encode(), b'built_at': b'1'}, messages),
+    )
+    await bloom_filters.load('genres')
+    return bloom_filters
+
+
+async def test_load_replays_ids_loaded_after_build(monkeypatch):
+    # Постоянные айди, чтобы ложное срабатывание фильтра не делало тест случайным
+    old, new, other_index = (str(UUID(int=i)) for i in (2, 3, 4))
+    bloom_filters = await load(monkeypatch, '2-0', [
+        ('1-0', 'genres', [old]),
+        ('2-0', 'genres', [old]),
+        ('3-0', 'genres', [new]),
+        ('4-0', 'persons', [other_index]),
+    ])
+
+    assert bloom_filters.might_contain('genres', new)
+    assert not bloom_filters.might_contain('genres', old)
+    assert not bloom_filters.might_contain('genres', other_index)
+
+
+async def test_filter_is_not_used_when_stream_was_trimmed(monkeypatch):
+    # Первые события после построения фильтра вытеснены из потока по maxlen
+    bloom_filters = await load(monkeypatch, '2-0', [('5-0', 'genres', [str(uuid4())])])
+    assert 'genres' not in bloom_filters.filters
+    assert bloom_filters.might_contain('genres', uuid4())
+
+
+@pytest.mark.parametrize(
+    'messages, used', [([], True), ([('1-0', 'genres', [])], False)], ids=['still empty', 'events since build'],
+)
+async def test_filter_built_on_empty_stream(monkeypatch, messages, used):
+    bloom_filters = await load(monkeypatch, '0-0', messages)
+    assert ('genres' in bloom_filters.filters) is used
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from db.bulkhead import BackendOverloaded, Bulkhead
+
+
+async def test_limits_concurrent_operations():
+    bulkhead = Bulkhead('test', limit=2, max_wait=1)
+    running = 0
+    max_running = 0
+
+    async def operation():
+        nonlocal running, max_running
+        async with bulkhead:
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    await asyncio.gather(*(operation() for _ in range(6)))
+    assert max_running == 2
+
+
+async def test_rejects_after_max_wait():
+    bulkhead = Bulkhead('test', limit=1, max_wait=0.01)
+    async with bulkhead:
+        with pytest.raises(BackendOverloaded):
+            async with bulkhead:
+                pass
+
+
+async def test_slot_is_released_on_error():
+    bulkhead = Bulkhead('test', limit=1, max_wait=0.01)
+    with pytest.raises(RuntimeError):
+        async with bulkhead:
+            raise RuntimeError('es is down')
+
+    async with bulkhead:
+        pass
+    assert not bulkhead.semaphore.locked()
@@ -0,0 +1,184 @@
+import asyncio
+from types import SimpleNamespace
+from uuid import UUID
+
+import pytest
+
+from api.v1.models import Genre
+from core.config import settings
+from db import redis as redis_db
+from db.redis import RedisCreator, RedisStorage
+from db.single_flight import SingleFlight
+from services import base
+
+STALE_MS = settings.CACHE_STALE_TTL_IN_SECONDS * 1000
+GRACE_MS = settings.CACHE_GRACE_TTL_IN_SECONDS * 1000
+
+OLD = Genre(uuid=UUID(int=1), name='old')
+NEW = Genre(uuid=UUID(int=1), name='new')
+
+
+class FakePipeline:
+    def __init__(self, redis: 'FakeRedis'):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append(getattr(self.redis, name)(*args, **kwargs))
+        return call
+
+    async def execute(self):
+        return [await call for call in self.calls]
+
+
+class FakeRedis:
+    """Значения и оставшийся TTL ключей в миллисекундах, время в тесте не идёт"""
+
+    def __init__(self):
+        self.data: dict[str, bytes] = {}
+        self.pttls: dict[str, int] = {}
+
+    def pipeline(self) -> FakePipeline:
+        return FakePipeline(self)
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def pttl(self, key):
+        return self.pttls.get(key, -2)
+
+    async def set(self, key, value, expire=None, pexpire=None, exist=None):
+        if exist and key in self.data:
+            return False
+        self.data[key] = value
+        self.pttls[key] = expire * 1000 if expire else pexpire or -1
+        return True
+
+    async def exists(self, key):
+        return key in self.data
+
+    async def eval(self, script, keys, args):
+        # Снятие блокировки single-flight
+        self.data.pop(keys[0], None)
+        return 1
+
+
+@pytest.fixture
+def redis(monkeypatch) -> FakeRedis:
+    fake = FakeRedis()
+    monkeypatch.setattr(redis_db, 'redis', fake)
+    return fake
+
+
+@pytest.fixture
+def degraded(monkeypatch):
+    def inner(is_open: bool):
+        monkeypatch.setattr(base, 'es_circuit_breaker', SimpleNamespace(is_open=is_open))
+    inner(False)
+    return inner
+
+
+class Fetch:
+    def __init__(self, result=NEW, error: Exception = None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0)
+        if self.error:
+            raise self.error
+        return self.result
+
+
+def make_service() -> base.BaseService:
+    return base.BaseService(
+        db=None, cache=RedisStorage(), cache_creator=RedisCreator(),
+        single_flight=SingleFlight(lock_timeout=1, poll_interval=0.01),
+    )
+
+
+def cache(redis: FakeRedis, pttl: int, data: Genre = OLD):
+    redis.data['key'] = RedisStorage.dump(data)
+    redis.pttls['key'] = pttl
+
+
+async def get(service: base.BaseService, fetch: Fetch):
+    return await service.get_or_fetch('key', Genre, fetch, expire=300)
+
+
+@pytest.mark.parametrize('pttl, stale', [
+    (STALE_MS + GRACE_MS + 1, False),
+    (-1, False),
+    (STALE_MS + GRACE_MS - 1, True),
+    (GRACE_MS, True),
+], ids=['fresh', 'no ttl', 'stale', 'stale until grace'])
+async def test_get_entry_stale_boundaries(redis, pttl, stale):
+    cache(redis, pttl)
+    data, is_stale = await RedisStorage().get_entry(
+        'key', Genre, stale_ttl=settings.CACHE_STALE_TTL_IN_SECONDS, grace_ttl=settings.CACHE_GRACE_TTL_IN_SECONDS
+    )
+    assert data == OLD
+    assert is_stale is stale
+
+
+@pytest.mark.parametrize('degraded, expected', [(False, None), (True, OLD)], ids=['healthy', 'degraded'])
+async def test_get_entry_in_grace(redis, degraded, expected):
+    cache(redis, GRACE_MS - 1)
+    data, is_stale = await RedisStorage().get_entry(
+        'key', Genre, stale_ttl=settings.CACHE_STALE_TTL_IN_SECONDS, grace_ttl=settings.CACHE_GRACE_TTL_IN_SECONDS,
+        degraded=degraded,
+    )
+    assert data == expected
+    assert is_stale is degraded
+
+
+async def test_fresh_entry_is_served_without_fetch(redis, degraded):
+    cache(redis, STALE_MS + GRACE_MS + 1)
+    fetch = Fetch()
+
+    assert await get(make_service(), fetch) == OLD
+    assert fetch.calls == 0
+    assert not base.BaseService.refresh_tasks
+
+
+async def test_stale_entry_is_served_and_refreshed_once(redis, degraded):
+    cache(redis, GRACE_MS + 1)
+    fetch = Fetch()
+    service = make_service()
+
+    assert await asyncio.gather(*(get(service, fetch) for _ in range(3))) == [OLD] * 3
+    await asyncio.gather(*base.BaseService.refresh_tasks)
+
+    assert fetch.calls == 1
+    assert RedisStorage.parse(redis.data['key'], Genre) == NEW
+    assert redis.pttls['key'] == (300 + service.retention_ttl()) * 1000
+
+
+async def test_grace_entry_is_a_miss_while_storage_is_healthy(redis, degraded):
+    cache(redis, GRACE_MS - 1)
+    fetch = Fetch()
+
+    assert await get(make_service(), fetch) == NEW
+    assert fetch.calls == 1
+
+
+async def test_grace_entry_is_served_while_degraded(redis, degraded):
+    degraded(True)
+    cache(redis, GRACE_MS - 1)
+    fetch = Fetch()
+
+    assert await get(make_service(), fetch) == OLD
+    assert fetch.calls == 0
+    assert not base.BaseService.refresh_tasks
+
+
+async def test_grace_entry_is_served_when_fetch_fails(redis, degraded):
+    cache(redis, GRACE_MS - 1)
+    fetch = Fetch(error=ConnectionError('es is down'))
+
+    # Предохранитель ещё не разомкнут, но запрос к хранилищу не удался
+    assert await get(make_service(), fetch) == OLD
+    assert fetch.calls == 1
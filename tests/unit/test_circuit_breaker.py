@@ -0,0 +1,112 @@
+import pytest
+
+from db.circuit_breaker import CircuitBreaker, CircuitOpen
+from db.storage import InvalidCursor
+
+
+def make_breaker(**kwargs) -> CircuitBreaker:
+    params = dict(
+        enabled=True, window=4, min_calls=4, failure_rate=0.5, slow_call_duration=10, slow_call_rate=1.0,
+        open_interval=60, half_open_calls=2,
+    )
+    params.update(kwargs)
+    return CircuitBreaker('test', **params)
+
+
+async def call(breaker: CircuitBreaker, error: Exception = None):
+    async with breaker.guard():
+        if error is not None:
+            raise error
+
+
+async def fail(breaker: CircuitBreaker, times: int):
+    for _ in range(times):
+        with pytest.raises(RuntimeError):
+            await call(breaker, RuntimeError('es is down'))
+
+
+def expire_open_interval(breaker: CircuitBreaker):
+    breaker.opened_at -= breaker.open_interval
+
+
+async def test_opens_when_failure_rate_is_reached():
+    breaker = make_breaker()
+    await call(breaker)
+    await call(breaker)
+    await fail(breaker, 1)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    await fail(breaker, 1)
+    assert breaker.is_open
+    with pytest.raises(CircuitOpen):
+        await call(breaker)
+
+
+async def test_does_not_open_before_min_calls():
+    breaker = make_breaker()
+    await fail(breaker, 3)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+async def test_client_errors_are_not_counted():
+    breaker = make_breaker()
+    for _ in range(4):
+        with pytest.raises(InvalidCursor):
+            await call(breaker, InvalidCursor('bad cursor'))
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert not breaker.outcomes
+
+
+async def test_opens_on_slow_calls():
+    breaker = make_breaker(slow_call_duration=0)
+    for _ in range(4):
+        await call(breaker)
+    assert breaker.is_open
+
+
+async def test_successful_probes_close_the_breaker():
+    breaker = make_breaker()
+    await fail(breaker, 4)
+    expire_open_interval(breaker)
+
+    await call(breaker)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    await call(breaker)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+async def test_half_open_limits_probes():
+    breaker = make_breaker(half_open_calls=1)
+    await fail(breaker, 4)
+    expire_open_interval(breaker)
+
+    async with breaker.guard():
+        # Пока пробный вызов не завершился, остальные отклоняются
+        with pytest.raises(CircuitOpen):
+            await call(breaker)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+async def test_failed_probe_opens_the_breaker_again():
+    breaker = make_breaker()
+    await fail(breaker, 4)
+    expire_open_interval(breaker)
+
+    await fail(breaker, 1)
+    assert breaker.is_open
+
+
+async def test_calls_started_before_state_change_are_ignored():
+    breaker = make_breaker()
+    async with breaker.guard():
+        await fail(breaker, 4)
+        assert breaker.is_open
+    # Успех вызова, начатого до размыкания, не попадает в окно разомкнутого предохранителя
+    assert breaker.is_open
+    assert not breaker.outcomes
+
+
+async def test_disabled_breaker_never_opens():
+    breaker = make_breaker(enabled=False)
+    await fail(breaker, 10)
+    assert breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,39 @@
+import json
+from uuid import UUID
+
+import pytest
+
+from db.codecs import CODECS, CacheSerializer
+
+VALUE = {
+    'uuid': str(UUID(int=1)),
+    'title': 'Звёздные войны',
+    'imdb_rating': 8.6,
+    'genre': [{'uuid': str(UUID(int=2)), 'name': 'Sci-Fi'}],
+    'actors': [],
+    'description': None,
+}
+
+
+@pytest.mark.parametrize('codec_name', CODECS)
+def test_round_trip(codec_name):
+    serializer = CacheSerializer(codec_name)
+    assert serializer.loads(serializer.dumps(VALUE)) == VALUE
+
+
+@pytest.mark.parametrize('codec_name', CODECS)
+def test_reads_records_of_any_codec(codec_name):
+    # Воркеры с разными кодеками во время выкладки читают записи друг друга
+    reader = CacheSerializer('json')
+    assert reader.loads(CacheSerializer(codec_name).dumps(VALUE)) == VALUE
+
+
+def test_reads_plain_json_written_before_codecs():
+    assert CacheSerializer('orjson').loads(json.dumps(VALUE).encode()) == VALUE
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        CacheSerializer('pickle')
+    with pytest.raises(ValueError):
+        CacheSerializer('json').loads(b'\x00\xff{}')
@@ -0,0 +1,53 @@
+from uuid import UUID
+
+import pytest
+from elasticsearch import TransportError
+
+from core.config import settings
+from db import elastic
+from db.circuit_breaker import CircuitBreaker
+from db.elastic import ElasticStorage
+from models.film import FilmRoles
+
+FILM = {'uuid': str(UUID(int=100)), 'title': 'film'}
+
+
+class FakeElastic:
+    def __init__(self, responses: list[dict]):
+        self.responses = responses
+
+    async def msearch(self, body):
+        return {'took': 1, 'responses': self.responses}
+
+
+@pytest.fixture
+def make_storage(monkeypatch):
+    monkeypatch.setattr(settings, 'ES_STORED_TEMPLATES_ENABLED', False)
+    monkeypatch.setattr(elastic, 'es_circuit_breaker', CircuitBreaker(
+        'test', enabled=False, window=1, min_calls=1, failure_rate=1, slow_call_duration=10, slow_call_rate=1,
+        open_interval=1, half_open_calls=1,
+    ))
+
+    def inner(responses: list[dict]) -> ElasticStorage:
+        monkeypatch.setattr(elastic, 'es', FakeElastic(responses))
+        return ElasticStorage()
+
+    return inner
+
+
+async def test_persons_films(make_storage):
+    storage = make_storage([{'hits': {'hits': [{'_source': FILM}]}}, {'hits': {'hits': []}}])
+    films = await storage.get_persons_films_from_elastic('movies', [UUID(int=1), UUID(int=2)], FilmRoles)
+    assert films == [[FilmRoles(**FILM)], []]
+
+
+async def test_failed_item_fails_the_call(make_storage):
+    # Ответ msearch успешный, но запрос фильмографии второй персоны упал
+    storage = make_storage([
+        {'hits': {'hits': [{'_source': FILM}]}},
+        {'error': {'type': 'search_phase_execution_exception', 'reason': 'all shards failed'}, 'status': 503},
+    ])
+    with pytest.raises(TransportError) as exc_info:
+        await storage.get_persons_films_from_elastic('movies', [UUID(int=1), UUID(int=2)], FilmRoles)
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.error == 'search_phase_execution_exception'
@@ -0,0 +1,196 @@
+import json
+import os
+import threading
+from collections import Counter
+
+import pytest
+
+import etl_process
+from config import config
+from etl_process import ETLProcess
+from transform import transform_genre
+
+# (updated_at, id) жанров: по пять строк с одной меткой времени, так что границы
+# чанков продьюсера приходятся на середину групп с одинаковым updated_at
+ROWS = sorted((f'2021-01-{1 + i // 5:02d}', f'{i:08d}-0000-0000-0000-000000000000') for i in range(23))
+IDS = {pk for _, pk in ROWS}
+
+
+class FakePostgres:
+    def __init__(self, dsn, pool):
+        self.queries: list[str] = []
+
+    def fetch(self, query: str, args: tuple) -> list[dict]:
+        self.queries.append(query)
+        if isinstance(args[0], list):
+            # Запрос мёрджера по массиву айди
+            return [{'uuid': pk, 'name': f'genre {pk}'} for pk in args[0]]
+        rows = ROWS
+        if len(args) == 3:
+            rows = [row for row in rows if row > (args[0], args[1])]
+        return [{'updated_at': updated_at, 'id': pk} for updated_at, pk in rows[:args[-1]]]
+
+    def stream(self, query: str, args: tuple, itersize: int):
+        yield from self.fetch(query, args)
+
+
+class FakeLoader:
+    """Запоминает загруженные айди, а bulk-запросы с номерами из fail_on завершаются ошибкой"""
+
+    def __init__(self, host: str, maxsize: int = 10):
+        self.fail_on: set[int] = set()
+        self.calls = 0
+        self.loaded: list[str] = []
+        self.lock = threading.Lock()
+
+    def load(self, data: list, index: str):
+        with self.lock:
+            self.calls += 1
+            if self.calls in self.fail_on:
+                raise RuntimeError('bulk failed')
+            self.loaded.extend(item.uuid for item in data)
+
+
+class FakePublisher:
+    def __init__(self, settings):
+        self.published: list[str] = []
+        self.messages: list[list[str]] = []
+
+    def publish(self, index: str, ids: list[str]):
+        self.published.extend(ids)
+        self.messages.append(ids)
+
+
+@pytest.fixture(params=[False, True], ids=['sequential', 'pipelined'])
+def make_process(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(etl_process, 'PostgresConnection', FakePostgres)
+    monkeypatch.setattr(etl_process, 'Loader', FakeLoader)
+    monkeypatch.setattr(etl_process, 'Publisher', FakePublisher)
+
+    cfg = config.copy(deep=True)
+    cfg.pipeline.enabled = request.param
+    cfg.es.limit = 3
+    cfg.bloom.filters = []
+    cfg.redis.publish_batch_size = 5
+    cfg.producers = [producer for producer in cfg.producers if producer.name == 'genre_producer']
+    cfg.producers[0].state_file_path = str(tmp_path / 'genre_state.json')
+    cfg.producers[0].limit = 4
+    cfg.enrichers = []
+    cfg.mergers = [merger for merger in cfg.mergers if merger.name == 'genre_merger']
+    cfg.mergers[0].stream = False
+    cfg.mergers[0].ids_as_array = True
+    cfg.mergers[0].chunk_size = 2
+    cfg.loaders = [loader for loader in cfg.loaders if loader.name == 'genre_loader']
+
+    def inner() -> ETLProcess:
+        return ETLProcess(cfg, {'genre': transform_genre})
+
+    inner.config = cfg
+    inner.state_file_path = cfg.producers[0].state_file_path
+    return inner
+
+
+def saved_position(state_file_path: str) -> tuple[str, str]:
+    # Без файла состояния продьюсер начинает с начала: позиция меньше любой строки
+    if not os.path.exists(state_file_path):
+        return '', ''
+    with open(state_file_path) as fi:
+        state = json.load(fi)
+    return state['updated_at'], state['id']
+
+
+def test_run_loads_everything(make_process):
+    process = make_process()
+    process.run()
+
+    assert set(process.loader.loaded) == IDS
+    assert set(process.publisher.published) == IDS
+    assert saved_position(make_process.state_file_path) == ROWS[-1]
+
+
+def test_failed_cycle_does_not_checkpoint_unloaded_chunks(make_process):
+    process = make_process()
+    process.loader.fail_on = {5}
+    with pytest.raises(RuntimeError):
+        process.run()
+
+    # Всё, что не дальше сохранённой позиции, уже в ES
+    position = saved_position(make_process.state_file_path)
+    assert {row[1] for row in ROWS if row <= position} <= set(process.loader.loaded)
+    # Загруженное до ошибки всё равно публикуется для сброса кеша
+    assert set(process.publisher.published) == set(process.loader.loaded)
+
+
+def test_next_cycle_resumes_from_saved_position(make_process):
+    process = make_process()
+    process.loader.fail_on = {5}
+    with pytest.raises(RuntimeError):
+        process.run()
+
+    # Тот же процесс продолжает с сохранённой позиции, а не с позиции в памяти
+    process.run()
+    assert set(process.loader.loaded) == IDS
+    assert saved_position(make_process.state_file_path) == ROWS[-1]
+
+    # После перезапуска ETL загруженное не читается заново
+    restarted = make_process()
+    restarted.run()
+    assert restarted.loader.loaded == []
+
+
+def test_restart_reads_only_after_saved_position(make_process):
+    process = make_process()
+    process.loader.fail_on = {5}
+    with pytest.raises(RuntimeError):
+        process.run()
+    position = saved_position(make_process.state_file_path)
+
+    restarted = make_process()
+    restarted.run()
+    assert set(process.loader.loaded) | set(restarted.loader.loaded) == IDS
+    assert set(restarted.loader.loaded) == {row[1] for row in ROWS if row > position}
+
+
+def test_merger_without_loader_is_not_run(make_process):
+    # Запасной вариант SQL лежит в конфиге, но без лоудера не выполняется
+    spare = make_process.config.mergers[0].copy(update={'name': 'genre_merger_spare', 'sql': 'spare sql'})
+    make_process.config.mergers.append(spare)
+    process = make_process()
+    process.run()
+
+    assert set(process.loader.loaded) == IDS
+    assert 'spare sql' not in process.db.queries
+
+
+def test_loaded_ids_are_published_in_bounded_batches(make_process):
+    process = make_process()
+    process.run()
+
+    assert max(len(ids) for ids in process.publisher.messages) <= 5
+    assert len(process.publisher.messages) > 1
+
+
+def test_position_is_saved_after_its_ids_are_published(make_process):
+    process = make_process()
+    producer = process.producers['genre_producer']
+    save_state = producer.save_state
+
+    def checked_save_state(position):
+        # Если ETL упадёт сразу после сохранения позиции, айди до неё уже в потоке
+        assert {row[1] for row in ROWS if row <= position} <= set(process.publisher.published)
+        save_state(position)
+
+    producer.save_state = checked_save_state
+    process.run()
+    assert saved_position(make_process.state_file_path) == ROWS[-1]
+
+
+def test_streaming_merger_feeds_every_loader(make_process):
+    make_process.config.mergers[0].stream = True
+    copy = make_process.config.loaders[0].copy(update={'name': 'genre_loader_copy', 'index': 'genres_copy'})
+    make_process.config.loaders.append(copy)
+    process = make_process()
+    process.run()
+
+    # Второй лоудер мёрджера не получает исчерпанный первым генератор строк
+    assert Counter(process.loader.loaded) == {pk: 2 for pk in IDS}
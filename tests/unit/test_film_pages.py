@@ -0,0 +1,101 @@
+from types import SimpleNamespace
+from uuid import UUID
+
+import pytest
+
+from core.config import settings
+from models.film import FilmShort
+from services.film import FilmService
+
+WINDOW_SIZE = 10
+# Последнее окно выдачи неполное
+FILMS = [FilmShort(uuid=UUID(int=i), title=f'film {i}', imdb_rating=i / 10) for i in range(47)]
+
+
+class FakeCache:
+    """Записи кеша в словаре, без TTL и устаревания"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get_entry(self, key, model, as_list=False, stale_ttl=0, grace_ttl=0, degraded=False):
+        return self.data.get(key), False
+
+    async def get_data(self, key, model, as_list=False):
+        return self.data.get(key)
+
+    async def put_data(self, key, data, as_list=False, expire=300, stale_ttl=0):
+        self.data[key] = data
+
+    async def get_many(self, keys, model, as_list=False):
+        return [self.data.get(key) for key in keys]
+
+    async def put_many(self, items, expire=300, stale_ttl=0):
+        self.data.update(items)
+
+    async def get_raw(self, key):
+        return self.data.get(key)
+
+    async def put_raw(self, key, data, expire=300):
+        self.data[key] = data
+
+    async def is_missing(self, key):
+        return key in self.data
+
+    async def mark_missing(self, key, expire):
+        self.data[key] = b'1'
+
+
+class FakeKeyCreator:
+    async def get_key_from_id(self, name_model, pk):
+        return f'{name_model}:{pk}'
+
+    async def get_key_from_window(self, name_model, query, sort, window_size, window_number):
+        return f'{name_model}-window:{query}-{sort}-{window_size}-{window_number}'
+
+    async def get_key_from_missing(self, key):
+        return f'missing:{key}'
+
+
+class FakeSingleFlight:
+    in_flight = {}
+
+    async def do(self, key, fetch, read_cache):
+        return await fetch()
+
+
+async def fetch_page(parameters: dict) -> list[FilmShort]:
+    # Обычная пагинация from/size, как в ES
+    start = (parameters['page_number'] - 1) * parameters['page_size']
+    return FILMS[start:start + parameters['page_size']]
+
+
+@pytest.fixture
+def service(monkeypatch) -> FilmService:
+    monkeypatch.setattr(settings, 'FILM_WINDOW_SIZE', WINDOW_SIZE)
+    return FilmService(db=None, cache=FakeCache(), cache_creator=FakeKeyCreator(), single_flight=FakeSingleFlight())
+
+
+@pytest.mark.parametrize('page_size', [1, 3, 7, 10, 15, 25, 50])
+async def test_pages_match_from_size_pagination(service, page_size):
+    windows = []
+
+    async def fetch_window(parameters: dict) -> list[FilmShort]:
+        windows.append(parameters)
+        return await fetch_page(parameters)
+
+    # Страницы пересекают границы окон, доходят до неполного последнего окна и выходят за конец выдачи
+    for page_number in range(1, len(FILMS) // page_size + 3):
+        parameters = {'sort': '-imdb_rating', 'page_size': page_size, 'page_number': page_number}
+        page = await service.get_page('search-film', parameters, fetch_window)
+        assert page == (await fetch_page(parameters) or None), f'page {page_number}'
+
+    # Выдача читается только выровненными окнами, и каждое окно - один раз
+    assert {parameters['page_size'] for parameters in windows} == {WINDOW_SIZE}
+    numbers = [parameters['page_number'] for parameters in windows]
+    assert len(numbers) == len(set(numbers))
+
+
+async def test_page_past_the_end(service):
+    parameters = {'sort': None, 'page_size': 10, 'page_number': 6}
+    assert await service.get_page('search-film', parameters, fetch_page) is None
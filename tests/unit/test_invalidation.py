@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+import pytest
+
+from core.config import settings
+from db.invalidation import INDEX_NAMESPACES, CacheInvalidationListener
+
+
+class FakeKeyCreator:
+    def __init__(self):
+        self.bumped: list[tuple[str, str]] = []
+
+    async def get_key_from_id(self, name_model: str, pk: str) -> str:
+        return f'{name_model}:{pk}'
+
+    async def get_key_from_missing(self, key: str) -> str:
+        return f'missing:{key}'
+
+    async def bump_generation(self, namespace: str, stream_id: str):
+        self.bumped.append((namespace, stream_id))
+
+
+class FakeConnection:
+    """Отдаёт одну пачку событий потока, а следующее чтение останавливает слушателя"""
+
+    def __init__(self, messages: list[tuple[str, str, list[str]]]):
+        self.batches = [[
+            (b'stream', message_id.encode(), {b'index': index.encode(), b'ids': json.dumps(ids).encode()})
+            for message_id, index, ids in messages
+        ]]
+
+    async def xread(self, streams, timeout=0, count=None, latest_ids=None):
+        if not self.batches:
+            raise asyncio.CancelledError
+        return self.batches.pop(0)
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+class FakeCache:
+    def __init__(self):
+        self.deleted: list[list[str]] = []
+
+    async def delete(self, keys: list[str]):
+        self.deleted.append(keys)
+
+
+async def test_invalidate_deletes_keys_in_slices(monkeypatch):
+    monkeypatch.setattr(settings, 'CACHE_INVALIDATION_DELETE_BATCH_SIZE', 2)
+    cache, key_creator = FakeCache(), FakeKeyCreator()
+    listener = CacheInvalidationListener(cache, key_creator)
+
+    await listener.invalidate('genres', ['1', '2', '3'], '5-0')
+
+    assert cache.deleted == [
+        ['genre:1', 'genre:2', 'missing:genre:1', 'missing:genre:2'],
+        ['genre:3', 'missing:genre:3'],
+    ]
+    assert key_creator.bumped == [(namespace, '5-0') for namespace in INDEX_NAMESPACES['genres']]
+
+
+async def test_generation_is_the_last_event_of_each_index():
+    cache, key_creator = FakeCache(), FakeKeyCreator()
+    listener = CacheInvalidationListener(cache, key_creator)
+    listener.connection = FakeConnection([
+        ('1-0', 'genres', ['1']),
+        ('2-0', 'persons', ['2']),
+        ('3-0', 'genres', ['3']),
+    ])
+
+    with pytest.raises(asyncio.CancelledError):
+        await listener.run()
+
+    # Все воркеры выставляют одинаковые поколения для одной пачки событий,
+    # поэтому пространство имён сбрасывается один раз, а не по разу на воркер
+    assert key_creator.bumped == [
+        *((namespace, '3-0') for namespace in INDEX_NAMESPACES['genres']),
+        *((namespace, '2-0') for namespace in INDEX_NAMESPACES['persons']),
+    ]
@@ -0,0 +1,48 @@
+import time
+
+import pytest
+
+from es_item import GenreItem
+from loader import BulkLoadError, Loader
+
+
+class FakeES:
+    def __init__(self, errors: dict[str, str]):
+        # Айди документов, которые ES не проиндексирует, и текст ошибки
+        self.errors = errors
+        self.calls = 0
+
+    def bulk(self, body: list[dict]) -> dict:
+        self.calls += 1
+        items = []
+        for action in body[::2]:
+            item = {'_id': action['index']['_id']}
+            if item['_id'] in self.errors:
+                item['error'] = self.errors[item['_id']]
+            items.append({'index': item})
+        return {'errors': any('error' in item['index'] for item in items), 'items': items}
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(time, 'sleep', lambda seconds: None)
+
+
+def make_loader(es: FakeES) -> Loader:
+    loader = Loader.__new__(Loader)
+    loader.es = es
+    return loader
+
+
+def test_load_indexes_documents():
+    es = FakeES({})
+    make_loader(es).load([GenreItem(uuid='1', name='drama')], index='genres')
+    assert es.calls == 1
+
+
+def test_rejected_documents_fail_the_chunk():
+    es = FakeES({'2': 'mapper_parsing_exception'})
+    with pytest.raises(BulkLoadError, match='1 of 2 documents.*2: mapper_parsing_exception'):
+        make_loader(es).load([GenreItem(uuid='1', name='drama'), GenreItem(uuid='2', name='comedy')], index='genres')
+    # Чанк повторяется через backoff, но после последней попытки ошибка пробрасывается
+    assert es.calls > 1
@@ -0,0 +1,94 @@
+import time
+
+from db.memory import RAW_NAMESPACE, LRUCache, TwoTierCache
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(default_max_objects=2)
+    cache.put('film', 'a', 1, ttl=60)
+    cache.put('film', 'b', 2, ttl=60)
+    cache.get('film', 'a')
+    cache.put('film', 'c', 3, ttl=60)
+
+    assert cache.get('film', 'a') == 1
+    assert cache.get('film', 'b') is None
+    assert cache.get('film', 'c') == 3
+
+
+def test_limit_counts_objects_in_lists():
+    cache = LRUCache(default_max_objects=100, namespace_max_objects={'filmshort_list': 5})
+    cache.put('filmshort_list', 'page-1', [1, 2, 3], ttl=60, size=3)
+    cache.put('filmshort_list', 'page-2', [4, 5, 6], ttl=60, size=3)
+
+    assert cache.get('filmshort_list', 'page-1') is None
+    assert cache.sizes['filmshort_list'] == 3
+    # Запись больше лимита пространства имён не кешируется и не вытесняет остальные
+    cache.put('filmshort_list', 'page-3', list(range(6)), ttl=60, size=6)
+    assert cache.get('filmshort_list', 'page-2') == [4, 5, 6]
+    assert cache.get('filmshort_list', 'page-3') is None
+
+
+def test_namespaces_have_separate_limits():
+    cache = LRUCache(default_max_objects=1)
+    cache.put('film', 'a', 1, ttl=60)
+    cache.put('genre', 'a', 2, ttl=60)
+    assert cache.get('film', 'a') == 1
+    assert cache.get('genre', 'a') == 2
+
+
+def test_expired_entries_are_dropped(monkeypatch):
+    cache = LRUCache(default_max_objects=10)
+    cache.put('film', 'a', 1, ttl=5)
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 10)
+
+    assert cache.get('film', 'a') is None
+    assert cache.sizes['film'] == 0
+
+
+def test_replacing_and_deleting_keeps_sizes():
+    cache = LRUCache(default_max_objects=10)
+    cache.put('film', 'a', [1, 2], ttl=60, size=2)
+    cache.put('film', 'a', [1, 2, 3], ttl=60, size=3)
+    assert cache.sizes['film'] == 3
+
+    cache.delete('a')
+    assert cache.get('film', 'a') is None
+    assert cache.sizes['film'] == 0
+
+
+class FakeRemote:
+    def __init__(self):
+        self.raw: dict[str, bytes] = {}
+
+    async def get_raw(self, key):
+        return self.raw.get(key)
+
+    async def put_raw(self, key, data, expire=300):
+        self.raw[key] = data
+
+    async def is_missing(self, key):
+        return key in self.raw
+
+    async def mark_missing(self, key, expire):
+        self.raw[key] = b'1'
+
+
+async def test_missing_marks_are_not_cached_locally():
+    local, remote = LRUCache(default_max_objects=10), FakeRemote()
+    cache = TwoTierCache(local, remote, ttl=60)
+    await cache.mark_missing('missing:film:1', expire=30)
+    assert await cache.is_missing('missing:film:1')
+    assert not local.namespaces.get(RAW_NAMESPACE)
+
+    # Объект появился в хранилище, отметка в Redis удалена или истекла
+    del remote.raw['missing:film:1']
+    assert not await cache.is_missing('missing:film:1')
+
+
+async def test_raw_bodies_are_cached_locally():
+    local, remote = LRUCache(default_max_objects=10), FakeRemote()
+    cache = TwoTierCache(local, remote, ttl=60)
+    await cache.put_raw('film-response:1', b'{}', expire=30)
+    remote.raw.clear()
+    assert await cache.get_raw('film-response:1') == b'{}'
@@ -0,0 +1,79 @@
+from fastapi import FastAPI
+
+from core.metrics import HTTP_REQUESTS, MetricsMiddleware
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get('/films/{film_id}')
+    async def film(film_id: str):
+        return {'uuid': film_id}
+
+    async def shared():
+        return {}
+
+    # Один endpoint у двух ручек
+    app.get('/genres/')(shared)
+    app.get('/persons/')(shared)
+    return app
+
+
+async def request(app: FastAPI, path: str, method: str = 'GET') -> int:
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'raw_path': path.encode(), 'root_path': '',
+        'scheme': 'http', 'query_string': b'', 'headers': [], 'server': ('test', 80), 'client': ('test', 1),
+        'http_version': '1.1',
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages[0]['status']
+
+
+def requests_count(method: str, route: str, status: int) -> float:
+    child = HTTP_REQUESTS.children.get((method, route, status))
+    return child.value if child else 0
+
+
+def endpoint(app: FastAPI, path: str):
+    return next(route.endpoint for route in app.routes if route.path == path)
+
+
+def test_route_label_comes_from_matched_endpoint():
+    app = make_app()
+    middleware = MetricsMiddleware(app)
+    # Путь не сопоставляется с маршрутами заново: шаблон берётся по endpoint, найденному роутером
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': '/other', 'app': app, 'endpoint': endpoint(app, '/films/{film_id}'),
+    }
+    assert middleware.get_route(scope) == '/films/{film_id}'
+
+    shared = endpoint(app, '/persons/')
+    assert middleware.get_route({**scope, 'path': '/persons/', 'endpoint': shared}) == '/persons/'
+    assert middleware.get_route({**scope, 'path': '/genres/', 'endpoint': shared}) == '/genres/'
+    assert middleware.get_route({key: value for key, value in scope.items() if key != 'endpoint'}) == 'unmatched'
+
+
+async def test_requests_are_counted_by_route():
+    app = make_app()
+    before = [
+        requests_count('GET', '/films/{film_id}', 200), requests_count('GET', '/persons/', 200),
+        requests_count('GET', 'unmatched', 404), requests_count('POST', '/films/{film_id}', 405),
+    ]
+
+    assert await request(app, '/films/1') == 200
+    assert await request(app, '/persons/') == 200
+    assert await request(app, '/missing') == 404
+    assert await request(app, '/films/1', method='POST') == 405
+    assert [
+        requests_count('GET', '/films/{film_id}', 200), requests_count('GET', '/persons/', 200),
+        requests_count('GET', 'unmatched', 404), requests_count('POST', '/films/{film_id}', 405),
+    ] == [count + 1 for count in before]
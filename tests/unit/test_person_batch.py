@@ -0,0 +1,58 @@
+from uuid import UUID
+
+from models.film import FilmRoles
+from models.person import Person, PersonRef
+from services.person import PersonService
+
+FILM = UUID(int=100)
+ACTOR, DIRECTOR, CACHED = UUID(int=1), UUID(int=2), UUID(int=3)
+
+
+class FakeCache:
+    """Словарь записей кеша; запоминает каждую пачку, записанную put_many"""
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.batches: list[dict] = []
+
+    async def get_many(self, keys, model, as_list=False):
+        return [self.data.get(key) for key in keys]
+
+    async def put_many(self, items, expire=300, stale_ttl=0):
+        self.batches.append(items)
+        self.data.update(items)
+
+
+class FakeKeyCreator:
+    async def get_key_from_id(self, name_model, pk):
+        return f'{name_model}:{pk}'
+
+    async def get_key_from_films_list(self, name_model, pk):
+        return f'{name_model}-films:{pk}'
+
+
+class FakeStorage:
+    async def get_data_by_ids(self, index, ids, model):
+        return [Person(uuid=pk, full_name=f'person {pk.int}') for pk in ids]
+
+    async def get_persons_films_from_elastic(self, index, person_ids, model):
+        film = FilmRoles(uuid=FILM, title='film', actors=[PersonRef(uuid=ACTOR)], directors=[PersonRef(uuid=DIRECTOR)])
+        return [[film] for _ in person_ids]
+
+
+async def test_persons_and_films_are_cached_in_one_batch():
+    cached_films = [FilmRoles(uuid=FILM, title='film', writers=[PersonRef(uuid=CACHED)])]
+    cache = FakeCache({f'person-films:{CACHED}': cached_films})
+    service = PersonService(FakeStorage(), cache, FakeKeyCreator(), single_flight=None)
+
+    persons = await service.get_many_by_id([ACTOR, DIRECTOR, CACHED])
+
+    assert [(person.uuid, person.role) for person in persons] == [
+        (ACTOR, 'actor'), (DIRECTOR, 'director'), (CACHED, 'writer'),
+    ]
+    # Персоны и фильмографии, которых не было в кеше, записываются одним конвейером
+    assert len(cache.batches) == 1
+    assert set(cache.batches[0]) == {
+        f'person:{ACTOR}', f'person:{DIRECTOR}', f'person:{CACHED}',
+        f'person-films:{ACTOR}', f'person-films:{DIRECTOR}',
+    }
@@ -0,0 +1,81 @@
+import itertools
+import threading
+
+import pytest
+
+from pipeline import Checkpoints, Pipeline, PipelineAborted, Stage
+
+
+def test_checkpoints_commit_in_order():
+    committed = []
+    checkpoints = Checkpoints(committed.append)
+    first, second, third = (checkpoints.open(position) for position in (1, 2, 3))
+    for checkpoint in (first, second, third):
+        checkpoint.add()
+        checkpoint.close()
+
+    # Позже открытые чанки загружены раньше: позиция не должна их сохранить
+    third.done()
+    second.done()
+    assert committed == []
+
+    first.done()
+    assert committed == [3]
+
+
+def test_checkpoint_without_tasks_is_committed_on_close():
+    committed = []
+    checkpoints = Checkpoints(committed.append)
+    checkpoints.open(1).close()
+    assert committed == [1]
+
+
+def test_unclosed_checkpoint_blocks_later_positions():
+    committed = []
+    checkpoints = Checkpoints(committed.append)
+    first = checkpoints.open(1)
+    first.add()
+    # Чанк упал посреди обработки: он не закрыт, и его позиция не сохраняется
+    first.done()
+    second = checkpoints.open(2)
+    second.close()
+    assert committed == []
+
+
+def test_stage_processes_all_items():
+    pipeline = Pipeline()
+    processed = []
+    lock = threading.Lock()
+
+    def handler(item):
+        with lock:
+            processed.append(item)
+
+    stage = Stage(pipeline, 'test', workers=3, queue_size=2, handler=handler)
+    stage.start()
+    for i in range(20):
+        stage.put(i)
+    stage.join()
+
+    pipeline.raise_error()
+    assert sorted(processed) == list(range(20))
+
+
+def test_stage_error_stops_pipeline():
+    pipeline = Pipeline()
+
+    def handler(item):
+        if item == 3:
+            raise RuntimeError('boom')
+
+    stage = Stage(pipeline, 'test', workers=2, queue_size=1, handler=handler)
+    stage.start()
+    # После ошибки поставщик не блокируется на заполненной очереди, а прерывается
+    with pytest.raises(PipelineAborted):
+        for i in itertools.count():
+            stage.put(i)
+    stage.join()
+
+    assert pipeline.failed.is_set()
+    with pytest.raises(RuntimeError, match='boom'):
+        pipeline.raise_error()
@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+import pytest
+
+from config import config
+from postgres_connection import PooledConnection, PostgresConnection, number_parameters
+
+QUERY = "SELECT id FROM t WHERE updated_at > %s AND id = ANY(%s::uuid[]) AND name LIKE '%%s%%' LIMIT %s;"
+
+
+class FakeCursor:
+    def __init__(self):
+        self.executed: list[tuple[str, tuple]] = []
+
+    def execute(self, query: str, args: tuple = None):
+        self.executed.append((query, args))
+
+
+@pytest.fixture
+def pooled() -> PooledConnection:
+    # Соединение без подключения к БД: проверяется только его тип
+    return PooledConnection.__new__(PooledConnection)
+
+
+def test_parameters_are_numbered():
+    numbered, casts = number_parameters(QUERY)
+    assert numbered == "SELECT id FROM t WHERE updated_at > $1 AND id = ANY($2::uuid[]) AND name LIKE '%s%' LIMIT $3"
+    assert casts == ('', '::uuid[]', '')
+
+
+@pytest.mark.parametrize('query, args, expected', [
+    (QUERY, ('2021-01-01', ['1', '2'], 10), True),
+    ("SELECT id FROM t WHERE id IN %s", (('1', '2'),), False),
+    ("SELECT id FROM t WHERE id = ANY(%s)", (['1', '2'],), False),
+    ("SELECT id FROM t", (), True),
+    ("SELECT id FROM t WHERE id = %s", (), False),
+], ids=['typed array', 'tuple for IN', 'untyped array', 'no parameters', 'missing argument'])
+def test_can_prepare(pooled, query, args, expected):
+    assert PostgresConnection.can_prepare(pooled, query, args) is expected
+
+
+def test_connection_without_pool_is_not_prepared():
+    assert not PostgresConnection.can_prepare(object(), "SELECT id FROM t", ())
+
+
+def test_query_is_prepared_once_per_connection():
+    connection, cursor = SimpleNamespace(prepared=set()), FakeCursor()
+    args = ('2021-01-01', ['1', '2'], 10)
+    PostgresConnection.execute_prepared(connection, cursor, QUERY, args)
+    PostgresConnection.execute_prepared(connection, cursor, QUERY, args)
+
+    (prepare, _), *executes = cursor.executed
+    name = next(iter(connection.prepared))
+    assert prepare == f"PREPARE {name} AS {number_parameters(QUERY)[0]}"
+    # Массив приводится к типу параметра и в EXECUTE, иначе Postgres получит text[]
+    assert executes == [(f"EXECUTE {name} (%s, %s::uuid[], %s)", args)] * 2
+
+
+def test_array_mergers_are_prepared(pooled):
+    mergers = [merger for merger in config.mergers if merger.ids_as_array]
+    assert mergers
+    for merger in mergers:
+        assert PostgresConnection.can_prepare(pooled, merger.sql, (['1', '2'],)), merger.name
@@ -0,0 +1,71 @@
+import json
+from uuid import UUID
+
+import pytest
+
+from db.queries import FILM_SEARCH_PAGE, FILMS_BY_GENRE_PAGE, PERSON_FILMS, PERSON_SEARCH_PAGE, get_sort
+
+SOURCE = ['uuid', 'title', 'imdb_rating']
+ID = UUID(int=1)
+# Значения, которые ломают наивную подстановку в байты: кавычки, обратные слеши, не-ASCII, фигурные скобки
+QUERIES = ['star wars', 'say "hi"', 'back\\slash', '\\"', 'звёздные войны', '{{query}}', '']
+
+
+def nested_term(path: str, value) -> dict:
+    return {'nested': {'path': path, 'query': {'bool': {'should': [{'term': {f'{path}.uuid': value}}]}}}}
+
+
+def page(query: dict, sort: tuple) -> dict:
+    return {'_source': SOURCE, 'query': query, 'sort': list(sort), 'from': 50, 'size': 50}
+
+
+def page_params(**params) -> dict:
+    return {'source': SOURCE, 'from': 50, 'size': 50, **params}
+
+
+def test_person_films():
+    body = PERSON_FILMS.render({'source': SOURCE, 'person': ID})
+    assert json.loads(body) == {
+        '_source': SOURCE,
+        'query': {'bool': {'should': [nested_term(path, str(ID)) for path in ('actors', 'writers', 'directors')]}},
+    }
+
+
+def test_films_by_genre():
+    sort = get_sort('-imdb_rating', 'film')
+    body = FILMS_BY_GENRE_PAGE.render(page_params(genre=ID, sort=sort))
+    assert json.loads(body) == page({'bool': {'must': [nested_term('genre', str(ID))]}}, sort)
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_film_search(query):
+    sort = get_sort('-imdb_rating', 'film')
+    body = FILM_SEARCH_PAGE.render(page_params(query=query, sort=sort))
+    assert json.loads(body) == page(
+        {'bool': {'should': [{'match': {'title': query}}, {'match': {'description': query}}]}}, sort,
+    )
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_person_search(query):
+    sort = get_sort('full_name', 'person')
+    body = PERSON_SEARCH_PAGE.render(page_params(query=query, sort=sort))
+    assert json.loads(body) == page({'match': {'full_name': {'query': query}}}, sort)
+
+
+def test_extra_fields_are_appended():
+    sort = get_sort(None, 'film')
+    extra = {'search_after': [1.5, 'a"b'], 'pit': {'id': 'x\\y', 'keep_alive': '1m'}}
+    body = FILM_SEARCH_PAGE.render(page_params(query='q', sort=sort), extra)
+    assert json.loads(body) == {
+        **page({'bool': {'should': [{'match': {'title': 'q'}}, {'match': {'description': 'q'}}]}}, sort),
+        **extra,
+    }
+
+
+def test_stored_template_params():
+    body = FILM_SEARCH_PAGE.render_stored(page_params(query='say "hi"', sort=get_sort(None, 'film'), unused=1))
+    assert json.loads(body) == {
+        'id': FILM_SEARCH_PAGE.name,
+        'params': page_params(query='say "hi"', sort=['_score', {'uuid': {'order': 'asc'}}]),
+    }
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from core.metrics import SINGLE_FLIGHT
+from db import redis as redis_db
+from db.single_flight import NOT_FOUND, SingleFlight
+
+
+class FakeRedis:
+    """Блокировки single-flight: locked - блокировку держит лидер из другого воркера"""
+
+    def __init__(self, locked: bool = False):
+        self.locked = locked
+
+    async def set(self, key, value, pexpire=None, exist=None):
+        return not self.locked
+
+    async def exists(self, key):
+        return self.locked
+
+    async def eval(self, script, keys, args):
+        return 1
+
+
+@pytest.fixture
+def single_flight():
+    return SingleFlight(lock_timeout=1, poll_interval=0.01)
+
+
+async def test_concurrent_calls_share_one_fetch(single_flight, monkeypatch):
+    monkeypatch.setattr(redis_db, 'redis', FakeRedis())
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return 'film'
+
+    async def read_cache():
+        return None
+
+    results = await asyncio.gather(*(single_flight.do('key', fetch, read_cache) for _ in range(5)))
+    assert results == ['film'] * 5
+    assert calls == 1
+
+
+async def test_follower_gets_leader_result_from_cache(single_flight, monkeypatch):
+    monkeypatch.setattr(redis_db, 'redis', FakeRedis(locked=True))
+    collapsed = SINGLE_FLIGHT.labels('collapsed_remote').value
+
+    async def fetch():
+        raise AssertionError('follower must not query the storage')
+
+    async def read_cache():
+        return 'film'
+
+    assert await single_flight.do('key', fetch, read_cache) == 'film'
+    assert single_flight.stats['collapsed_remote'] == 1
+    assert SINGLE_FLIGHT.labels('collapsed_remote').value == collapsed + 1
+
+
+async def test_follower_shares_not_found(single_flight, monkeypatch):
+    monkeypatch.setattr(redis_db, 'redis', FakeRedis(locked=True))
+
+    async def fetch():
+        raise AssertionError('follower must not query the storage')
+
+    async def read_cache():
+        return NOT_FOUND
+
+    assert await single_flight.do('key', fetch, read_cache) is None
+    assert single_flight.stats['collapsed_remote'] == 1